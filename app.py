@@ -5,43 +5,28 @@ from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import inngest
 import inngest.fast_api
-from inngest.experimental import ai
 from dotenv import load_dotenv
-import uuid
 import os
 import datetime
 import asyncio
-from src.core.data_loader import load_and_chunk_pdf, embed_texts
-from src.core.vector_db import QdrantStorage
+from src.core import accounting, pipeline, profiling, tracing
+from src.core.pipeline import DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE, DEFAULT_TOP_K
+from src.core.lifecycle import lifespan
 from src.providers.llm_providers import get_llm_provider
 from src.core.config import ModelConfig
-from src.core.custom_types import (
-    RAQQueryResult,
-    RAGSearchResult,
-    RAGUpsertResult,
-    RAGChunkAndSrc,
-)
-from src.api import api_router
+from src.core.custom_types import RAGSearchResult, RAGUpsertResult, RAGChunkAndSrc
+from src.api import api_router, metrics_router
 
 load_dotenv()
 ModelConfig.validate()
 
-# ============================================================================
-# CONSTANTS - LLM generation settings
-# ============================================================================
-DEFAULT_MAX_TOKENS = 1024  # Numero massimo di token da generare per risposta LLM
-DEFAULT_TEMPERATURE = (
-    0.2  # Temperatura per generazione LLM (0.0-1.0, più bassa = più deterministica)
-)
-DEFAULT_TOP_K = 5  # Numero di chunk da recuperare per default nelle query
-
 # ============================================================================
 # CONSTANTS - Rate limiting settings
 # ============================================================================
-THROTTLE_LIMIT = 2  # Numero massimo di esecuzioni per periodo di throttle
-THROTTLE_PERIOD_MINUTES = 1  # Periodo per throttle (minuti)
-RATE_LIMIT_LIMIT = 1  # Numero massimo di esecuzioni per periodo di rate limit
-RATE_LIMIT_PERIOD_HOURS = 4  # Periodo per rate limit (ore)
+THROTTLE_LIMIT = ModelConfig.INGEST_THROTTLE_LIMIT  # Numero massimo di esecuzioni per periodo di throttle (0 = nessun throttle)
+THROTTLE_PERIOD_SECONDS = ModelConfig.INGEST_THROTTLE_PERIOD_SECONDS  # Periodo per throttle (secondi)
+RATE_LIMIT_LIMIT = ModelConfig.INGEST_RATE_LIMIT_LIMIT  # Esecuzioni massime per source nel periodo di rate limit (0 = nessun limite)
+RATE_LIMIT_PERIOD_SECONDS = ModelConfig.INGEST_RATE_LIMIT_PERIOD_SECONDS  # Periodo per rate limit (secondi)
 
 inngest_client = inngest.Inngest(
     app_id="rag_app",
@@ -51,118 +36,171 @@ inngest_client = inngest.Inngest(
 )
 
 
+def instrumented(ctx: inngest.Context, name: str, handler):
+    """
+    Handler di uno step eseguito in uno span figlio della richiesta che ha
+    inviato l'evento e, se richiesto, profilato nel profilo della richiesta.
+
+    Gli handler sono sincroni (embedding, Qdrant, attesa di uno slot dello
+    scheduler): girano in un thread per non bloccare l'event loop.
+    """
+    def run():
+        with (
+            tracing.span(name, {"run_id": ctx.run_id}, parent=ctx.event.data),
+            profiling.session(ctx.event.data.get(profiling.PROFILE_FIELD), name),
+        ):
+            return handler()
+
+    async def run_in_thread():
+        return await asyncio.to_thread(run)
+    return run_in_thread
+
+
 @inngest_client.create_function(
     fn_id="RAG: Ingest PDF",
     trigger=inngest.TriggerEvent(event="rag/ingest_pdf"),
-    throttle=inngest.Throttle(
-        limit=THROTTLE_LIMIT, period=datetime.timedelta(minutes=THROTTLE_PERIOD_MINUTES)
+    throttle=(
+        inngest.Throttle(
+            limit=THROTTLE_LIMIT, period=datetime.timedelta(seconds=THROTTLE_PERIOD_SECONDS)
+        )
+        if THROTTLE_LIMIT > 0
+        else None
     ),
-    rate_limit=inngest.RateLimit(
-        limit=RATE_LIMIT_LIMIT,
-        period=datetime.timedelta(hours=RATE_LIMIT_PERIOD_HOURS),
-        key="event.data.source_id",
+    rate_limit=(
+        inngest.RateLimit(
+            limit=RATE_LIMIT_LIMIT,
+            period=datetime.timedelta(seconds=RATE_LIMIT_PERIOD_SECONDS),
+            key="event.data.source_id",
+        )
+        if RATE_LIMIT_LIMIT > 0
+        else None
     ),
 )
 async def rag_ingest_pdf(ctx: inngest.Context):
-    def _load(ctx: inngest.Context) -> RAGChunkAndSrc:
-        pdf_path = ctx.event.data["pdf_path"]
-        source_id = ctx.event.data.get("source_id", pdf_path)
-        chunks = load_and_chunk_pdf(pdf_path)
-        return RAGChunkAndSrc(chunks=chunks, source_id=source_id)
-
-    def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
-        chunks = chunks_and_src.chunks
-        source_id = chunks_and_src.source_id
-        vecs = embed_texts(chunks)
-        ids = [
-            str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}"))
-            for i in range(len(chunks))
-        ]
-        payloads = [
-            {"source": source_id, "text": chunks[i]} for i in range(len(chunks))
-        ]
-        QdrantStorage().upsert(ids, vecs, payloads)
-        return RAGUpsertResult(ingested=len(chunks))
+    pdf_path = ctx.event.data["pdf_path"]
+    source_id = ctx.event.data.get("source_id", pdf_path)
+    metadata = pipeline.document_metadata(ctx.event.data)
 
     chunks_and_src = await ctx.step.run(
-        "load-and-chunk", lambda: _load(ctx), output_type=RAGChunkAndSrc
+        "load-and-chunk",
+        instrumented(ctx, "load-and-chunk", lambda: pipeline.load_chunks(pdf_path, source_id)),
+        output_type=RAGChunkAndSrc,
+    )
+    chunks = chunks_and_src.chunks
+    pages = chunks_and_src.pages
+    batch_size = chunks_and_src.batch_size or pipeline.INGEST_BATCH_SIZE
+    source_id = chunks_and_src.source_id
+
+    # Ogni batch è uno step memoizzato: gli step vengono eseguiti in parallelo
+    # e in caso di errore si riprende dall'ultimo batch non completato
+    batch_results = await ctx.group.parallel(
+        tuple(
+            lambda n=n, start=start, batch=batch: ctx.step.run(
+                f"embed-and-upsert-{n}",
+                instrumented(
+                    ctx,
+                    f"embed-and-upsert-{n}",
+                    lambda: pipeline.upsert_batch(
+                        source_id,
+                        start,
+                        batch,
+                        pages=pages[start : start + len(batch)],
+                        metadata=metadata,
+                    ),
+                ),
+                output_type=RAGUpsertResult,
+            )
+            for n, (start, batch) in enumerate(pipeline.split_batches(chunks, batch_size))
+        )
     )
     ingested = await ctx.step.run(
-        "embed-and-upsert", lambda: _upsert(chunks_and_src), output_type=RAGUpsertResult
+        "reconcile",
+        instrumented(
+            ctx,
+            "reconcile",
+            lambda: pipeline.reconcile(
+                source_id, len(chunks), sum(r.ingested for r in batch_results)
+            ),
+        ),
+        output_type=RAGUpsertResult,
     )
-    return ingested.model_dump()
+    usage = accounting.merge(*(r.usage for r in batch_results))
+    accounting.get_source_usage().add(source_id, usage)
+    return {**ingested.model_dump(), "usage": accounting.summarize(usage)}
 
 
 @inngest_client.create_function(
     fn_id="RAG: Query PDF", trigger=inngest.TriggerEvent(event="rag/query_pdf_ai")
 )
 async def rag_query_pdf_ai(ctx: inngest.Context):
-    def _search(question: str, top_k: int = DEFAULT_TOP_K) -> RAGSearchResult:
-        query_vec = embed_texts([question])[0]
-        store = QdrantStorage()
-        found = store.search(query_vec, top_k)
-        return RAGSearchResult(contexts=found["contexts"], sources=found["sources"])
-
     question = ctx.event.data["question"]
     top_k = int(ctx.event.data.get("top_k", DEFAULT_TOP_K))
+    filters = ctx.event.data.get("filters")
 
     found = await ctx.step.run(
         "embed-and-search",
-        lambda: _search(question, top_k),
+        instrumented(ctx, "embed-and-search", lambda: pipeline.search(question, top_k, filters)),
         output_type=RAGSearchResult,
     )
 
-    context_block = "\n\n".join(f"- {c}" for c in found.contexts)
-    user_content = (
-        "Use the following context to answer the question.\n\n"
-        f"Context:\n{context_block}\n\n"
-        f"Question: {question}\n"
-        "Answer concisely using the context above."
-    )
+    messages = pipeline.build_query_messages(question, found.contexts)
 
     llm_provider = get_llm_provider()
     adapter = llm_provider.get_inngest_adapter()
 
-    if adapter is not None:
-        # Use inngest adapter (e.g., OpenAI)
-        res = await ctx.step.ai.infer(
-            "llm-answer",
-            adapter=adapter,
-            body={
-                "max_tokens": DEFAULT_MAX_TOKENS,
-                "temperature": DEFAULT_TEMPERATURE,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You answer questions using only the provided context.",
-                    },
-                    {"role": "user", "content": user_content},
-                ],
-            },
-        )
-        answer = res["choices"][0]["message"]["content"].strip()
-    else:
-        # Use direct provider call (e.g., Ollama, Google, Anthropic)
-        # For non-inngest providers, call directly (still tracked by inngest function)
-        answer = await llm_provider.generate(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You answer questions using only the provided context.",
+    with accounting.tracking() as llm_usage:
+        if adapter is not None:
+            # Use inngest adapter (e.g., OpenAI)
+            res = await ctx.step.ai.infer(
+                "llm-answer",
+                adapter=adapter,
+                body={
+                    "max_tokens": DEFAULT_MAX_TOKENS,
+                    "temperature": DEFAULT_TEMPERATURE,
+                    "messages": messages,
                 },
-                {"role": "user", "content": user_content},
-            ],
-            max_tokens=DEFAULT_MAX_TOKENS,
-            temperature=DEFAULT_TEMPERATURE,
-        )
+            )
+            answer = res["choices"][0]["message"]["content"].strip()
+            usage = res.get("usage") or {}
+            llm_provider.record_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        else:
+            # Use direct provider call (e.g., Ollama, Google, Anthropic)
+            # For non-inngest providers, call directly (still tracked by inngest function)
+            with (
+                tracing.span("llm-answer", {"run_id": ctx.run_id}, parent=ctx.event.data),
+                profiling.session(ctx.event.data.get(profiling.PROFILE_FIELD), "llm-answer"),
+            ):
+                answer = await llm_provider.generate(
+                    messages=messages,
+                    max_tokens=DEFAULT_MAX_TOKENS,
+                    temperature=DEFAULT_TEMPERATURE,
+                )
     return {
         "answer": answer,
         "sources": found.sources,
         "num_contexts": len(found.contexts),
+        "usage": accounting.summarize(accounting.merge(found.usage, llm_usage.entries())),
     }
 
 
-app = FastAPI(title="RAG Application API")
+app = FastAPI(title="RAG Application API", lifespan=lifespan)
+
+
+async def trace_requests(request, call_next):
+    """Span per ogni richiesta API, figlio del traceparent inviato dal client."""
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+    with tracing.span(
+        f"{request.method} {request.url.path}",
+        {"http.method": request.method, "http.target": request.url.path},
+        parent=request.headers,
+    ):
+        return await call_next(request)
+
+
+# Le versioni di FastAPI con telemetria nativa creano già gli span delle richieste
+if not tracing.native_http_tracing():
+    app.middleware("http")(trace_requests)
 
 # CORS middleware for React frontend
 app.add_middleware(
@@ -176,6 +214,9 @@ app.add_middleware(
 # Mount API router
 app.include_router(api_router)
 
+# Prometheus metrics (/metrics, fuori dal prefisso /api)
+app.include_router(metrics_router)
+
 # Serve static files in production (React build)
 frontend_build = Path("frontend/dist")
 if frontend_build.exists():
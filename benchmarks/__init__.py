@@ -0,0 +1 @@
+# Benchmarks (eseguibili offline, senza provider né Qdrant esterni)
@@ -0,0 +1,75 @@
+"""
+Prompt-token reduction of context assembly on the fixture corpus.
+
+Confronta il prompt costruito con i top_k chunk concatenati (comportamento
+precedente) con quello prodotto da assemble_context (over-fetch, MMR, merge
+dei chunk adiacenti e budget di token).
+
+Uso:
+    python -m benchmarks.bench_context_assembly [--queries 50] [--top-k 5] [--budget 3000]
+"""
+
+import argparse
+import json
+
+from benchmarks.fixtures import (
+    fixture_chunks,
+    fixture_documents,
+    fixture_queries,
+    hash_embedding,
+)
+from src.core.context import CONTEXT_OVERFETCH_FACTOR, assemble_context, estimate_tokens
+from src.core.pipeline import build_query_messages
+
+
+def _prompt_tokens(question: str, contexts: list[str]) -> int:
+    return sum(estimate_tokens(m["content"]) for m in build_query_messages(question, contexts))
+
+
+def _search(query_vector: list[float], chunks: list[dict], limit: int) -> list[dict]:
+    """Ricerca esatta (brute force) sul corpus fixture."""
+    scored = [
+        (sum(q * v for q, v in zip(query_vector, c["vector"])), c) for c in chunks
+    ]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [{**c, "score": score} for score, c in scored[:limit]]
+
+
+def run(num_queries: int, top_k: int, budget: int) -> dict:
+    documents = fixture_documents()
+    chunks = fixture_chunks(documents)
+    for chunk in chunks:
+        chunk["vector"] = hash_embedding(chunk["text"])
+
+    naive_tokens = 0
+    assembled_tokens = 0
+    for question in fixture_queries(documents, num_queries):
+        query_vector = hash_embedding(question)
+        hits = _search(query_vector, chunks, top_k * CONTEXT_OVERFETCH_FACTOR)
+
+        naive_tokens += _prompt_tokens(question, [h["text"] for h in hits[:top_k]])
+        contexts, _ = assemble_context(query_vector, hits, top_k, budget)
+        assembled_tokens += _prompt_tokens(question, contexts)
+
+    return {
+        "queries": num_queries,
+        "chunks": len(chunks),
+        "top_k": top_k,
+        "token_budget": budget,
+        "avg_prompt_tokens_naive": round(naive_tokens / num_queries, 1),
+        "avg_prompt_tokens_assembled": round(assembled_tokens / num_queries, 1),
+        "prompt_token_reduction_pct": round(100 * (1 - assembled_tokens / naive_tokens), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=3000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.queries, args.top_k, args.budget), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Import-time benchmark: how long `import app` takes in a fresh interpreter.
+
+Ogni misura avvia un nuovo processo Python (come un cold start o il riavvio
+di un worker) con `-X importtime`, e riporta:
+
+- il tempo di `import app` (mediana e minimo sulle ripetizioni)
+- i moduli più costosi per tempo cumulativo (albero degli import incluso)
+- gli SDK pesanti già caricati dopo l'import: i provider (openai, anthropic,
+  google.generativeai), qdrant_client, llama_index e inngest.experimental.ai
+  devono essere importati solo al primo uso, non all'avvio
+
+Termina con codice 1 se un modulo pesante viene importato all'avvio o se il
+tempo mediano supera --budget, così l'avvio resta veloce quando si aggiungono
+provider.
+
+ModelConfig.validate() gira all'import: con --provider openai/google servono le
+relative API key nell'ambiente (non vengono usate, i provider si creano solo
+nel lifespan).
+
+Uso:
+    python -m benchmarks.bench_import [--repeat 5] [--provider ollama] [--budget 2.0] [--output import.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+# ============================================================================
+# CONSTANTS - Import benchmark settings
+# ============================================================================
+DEFAULT_REPEAT = 5  # Processi avviati (ogni import è a freddo)
+DEFAULT_BUDGET_S = 2.0  # Tempo mediano massimo di `import app` (secondi, 0 = nessun limite)
+DEFAULT_TOP = 15  # Moduli più costosi mostrati nel report
+DEFAULT_PROVIDER = "ollama"  # LLM_PROVIDER / EMBEDDING_PROVIDER dei processi misurati
+HEAVY_MODULES = (  # Da importare solo quando il provider o il percorso di codice li usa
+    "llama_index",
+    "qdrant_client",
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "inngest.experimental.ai",
+)
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Script eseguito nel processo misurato: tempo di import e moduli pesanti caricati
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+heavy = sorted(
+    m for m in {HEAVY_MODULES!r}
+    if any(name == m or name.startswith(m + ".") for name in sys.modules)
+)
+print(json.dumps({{"import_s": elapsed, "heavy_modules": heavy}}))
+"""
+
+
+def _probe_env(provider: Optional[str]) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    if provider:
+        env["LLM_PROVIDER"] = provider
+        env["EMBEDDING_PROVIDER"] = provider
+    return env
+
+
+def _parse_importtime(stderr: str) -> dict[str, int]:
+    """Tempo cumulativo (µs) per modulo dall'output di `-X importtime`."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cum.isdigit():
+            cumulative[name] = int(cum)
+    return cumulative
+
+
+def measure_once(provider: Optional[str]) -> dict:
+    """Un import di app in un processo nuovo."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=REPO_ROOT,
+        env=_probe_env(provider),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        error = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"import app failed:\n{error}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["modules_us"] = _parse_importtime(proc.stderr)
+    return result
+
+
+def run(repeat: int, provider: Optional[str], top: int) -> dict:
+    runs = [measure_once(provider) for _ in range(repeat)]
+    times = [r["import_s"] for r in runs]
+    # Tempo cumulativo mediano di ogni modulo sulle ripetizioni
+    names = set().union(*(r["modules_us"] for r in runs))
+    module_ms = {
+        name: statistics.median(r["modules_us"].get(name, 0) for r in runs) / 1000
+        for name in names
+    }
+    slowest = sorted(module_ms.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "python": sys.version.split()[0],
+        "provider": provider,
+        "repeat": repeat,
+        "import_median_s": round(statistics.median(times), 4),
+        "import_min_s": round(min(times), 4),
+        "heavy_modules": sorted(set().union(*(r["heavy_modules"] for r in runs))),
+        "slowest_modules": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in slowest],
+    }
+
+
+def _print_report(result: dict) -> None:
+    print(
+        f"import app: median {result['import_median_s']:.3f}s, min {result['import_min_s']:.3f}s "
+        f"({result['repeat']} cold starts, provider={result['provider']})"
+    )
+    print(f"\n{'module':<50} {'cumulative_ms':>14}")
+    for row in result["slowest_modules"]:
+        print(f"{row['module']:<50} {row['cumulative_ms']:>14.1f}")
+    heavy = result["heavy_modules"]
+    print(f"\neagerly imported heavy modules: {', '.join(heavy) if heavy else 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument(
+        "--provider",
+        default=DEFAULT_PROVIDER,
+        help="LLM_PROVIDER/EMBEDDING_PROVIDER for the measured process ('' keeps the environment)",
+    )
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_S, help="max median import time in seconds")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    parser.add_argument("--output", default=None, help="write the result to this JSON file")
+    args = parser.parse_args()
+
+    result = run(args.repeat, args.provider or None, args.top)
+    _print_report(result)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+    over_budget = args.budget > 0 and result["import_median_s"] > args.budget
+    if over_budget:
+        print(f"import time {result['import_median_s']:.3f}s exceeds budget {args.budget:.3f}s")
+    sys.exit(1 if over_budget or result["heavy_modules"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Recall@k and query latency of QdrantStorage search configurations.
+
+Costruisce il ground truth con un kNN esatto (coseno, numpy) sul corpus
+fixture e misura, per ogni configurazione, recall@k e latenza delle
+ricerche di QdrantStorage.search_hits. Gruppi della sweep:
+
+- hnsw: m ed ef_construct dell'indice, ef della ricerca
+- quantization: scalar (int8) e binary, con rescoring sui vettori originali
+- dimension: dimensione degli embedding (hashing trick)
+- chunking: chunk_size / chunk_overlap dello splitter
+
+Il ground truth è il kNN esatto nella configurazione di riferimento
+(dimensione HASH_EMBEDDING_DIM, chunking dell'applicazione). La recall dei
+chunk richiede lo stesso chunking del riferimento; quella dei documenti
+(source_recall) vale per ogni configurazione. I pari merito (documenti
+duplicati nel corpus) contano come risultati corretti. Con un chunking
+diverso dal riferimento source_recall misura quanto cambia il risultato,
+non la sua qualità: per questo si riporta anche hit_rate, la quota di
+domande per cui i k risultati contengono il documento da cui è presa la
+domanda. Gli embedding del benchmark sono bag of words con hashing trick:
+il gruppo dimension misura le collisioni di quel proxy, non il troncamento
+di un modello di embedding reale.
+
+La modalità locale di Qdrant (":memory:", default) esegue solo ricerche
+esatte e ignora indice e quantizzazione: i gruppi hnsw e quantization
+richiedono un server (--qdrant-url), in cui le collezioni del benchmark
+vengono create con indicizzazione immediata e poi cancellate.
+
+Uso:
+    python -m benchmarks.bench_recall [--documents 200] [--queries 100] [--top-k 5]
+        [--sweep dimension,chunking] [--qdrant-url http://localhost:6333] [--output recall.json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+from llama_index.core.node_parser import SentenceSplitter
+from qdrant_client.models import CollectionStatus, OptimizersConfigDiff
+
+from benchmarks.fixtures import (
+    HASH_EMBEDDING_DIM,
+    fixture_chunks,
+    fixture_documents,
+    fixture_queries_with_sources,
+    hash_embedding,
+)
+from src.core.data_loader import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
+from src.core.vector_db import IndexConfig, QdrantStorage, make_chunk_id
+
+# ============================================================================
+# CONSTANTS - Sweep settings
+# ============================================================================
+LOCAL_QDRANT = ":memory:"
+SWEEPS = ("hnsw", "quantization", "dimension", "chunking")
+LOCAL_SWEEPS = ("dimension", "chunking")  # Gruppi significativi in modalità locale
+HNSW_M_VALUES = (8, 16, 32)
+HNSW_EF_CONSTRUCT_VALUES = (64, 128)
+SEARCH_EF_VALUES = (16, 32, 64, 128)
+QUANTIZATIONS = ("scalar", "binary")
+DIMENSIONS = (64, 128, 256, 512)
+CHUNKINGS = ((256, 50), (512, 100), (1000, 200), (2000, 400))  # (chunk_size, chunk_overlap)
+UPSERT_BATCH_SIZE = 256  # Punti per ogni upsert durante il caricamento del corpus
+WARMUP_QUERIES = 5  # Ricerche non misurate prima di ogni configurazione
+INDEXING_THRESHOLD_KB = 1  # Soglia di indicizzazione delle collezioni del benchmark (HNSW subito)
+INDEXING_TIMEOUT = 300.0  # Attesa massima della costruzione dell'indice (secondi)
+SCORE_TOLERANCE = 1e-6  # Pari merito con il k-esimo risultato esatto
+COLLECTION_PREFIX = "bench_recall"
+
+
+class Corpus(NamedTuple):
+    """Chunk di un chunking, con gli embedding di riferimento per il ground truth."""
+
+    chunks: list[dict]
+    ids: list[str]
+    reference: np.ndarray  # Embedding a HASH_EMBEDDING_DIM, normalizzati (righe)
+
+
+class Config(NamedTuple):
+    group: str
+    dim: int = HASH_EMBEDDING_DIM
+    chunking: tuple[int, int] = (DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
+    index: IndexConfig = IndexConfig()
+
+    def collection_key(self) -> tuple:
+        # Le configurazioni che differiscono solo per i parametri di ricerca condividono la collezione
+        return (self.dim, self.chunking, self.index.hnsw_m, self.index.hnsw_ef_construct, self.index.quantization)
+
+    def describe(self) -> dict:
+        described = {"dim": self.dim, "chunk_size": self.chunking[0], "chunk_overlap": self.chunking[1]}
+        described.update({k: v for k, v in self.index._asdict().items() if v})
+        return described
+
+
+def build_configs(sweeps: list[str]) -> list[Config]:
+    configs = []
+    if "hnsw" in sweeps:
+        configs.append(Config("hnsw", index=IndexConfig(exact=True)))
+        for m in HNSW_M_VALUES:
+            for ef_construct in HNSW_EF_CONSTRUCT_VALUES:
+                for ef in SEARCH_EF_VALUES:
+                    configs.append(Config("hnsw", index=IndexConfig(m, ef_construct, search_hnsw_ef=ef)))
+    if "quantization" in sweeps:
+        for quantization in QUANTIZATIONS:
+            for ef in SEARCH_EF_VALUES:
+                configs.append(
+                    Config("quantization", index=IndexConfig(quantization=quantization, search_hnsw_ef=ef))
+                )
+    if "dimension" in sweeps:
+        configs.extend(Config("dimension", dim=dim) for dim in DIMENSIONS)
+    if "chunking" in sweeps:
+        configs.extend(Config("chunking", chunking=chunking) for chunking in CHUNKINGS)
+    return configs
+
+
+def make_corpus(documents: dict[str, str], chunking: tuple[int, int]) -> Corpus:
+    if chunking == (DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP):
+        chunks = fixture_chunks(documents)
+    else:
+        chunks = fixture_chunks(documents, SentenceSplitter(chunk_size=chunking[0], chunk_overlap=chunking[1]))
+    ids = [make_chunk_id(c["source"], c["chunk_index"]) for c in chunks]
+    reference = np.array([hash_embedding(c["text"]) for c in chunks], dtype=np.float32)
+    return Corpus(chunks, ids, reference)
+
+
+class GroundTruth(NamedTuple):
+    """kNN esatto di una query nel corpus di riferimento."""
+
+    threshold: float  # Score del k-esimo risultato esatto
+    sources: set[str]  # Documenti dei k risultati esatti
+
+
+def exact_knn(corpus: Corpus, query_vectors: np.ndarray, top_k: int) -> list[GroundTruth]:
+    scores = query_vectors @ corpus.reference.T
+    truth = []
+    for row in scores:
+        top = np.argsort(-row, kind="stable")[:top_k]
+        truth.append(
+            GroundTruth(
+                threshold=float(row[top[-1]]),
+                sources={corpus.chunks[i]["source"] for i in top},
+            )
+        )
+    return truth
+
+
+def chunk_recall(hits: list[dict], truth: GroundTruth, scores: dict[str, float], top_k: int) -> float:
+    """Quota dei k risultati esatti trovata (un pari merito vale come il risultato che sostituisce)."""
+    found = sum(1 for h in hits if scores.get(h["id"], -1.0) >= truth.threshold - SCORE_TOLERANCE)
+    return min(1.0, found / top_k)
+
+
+def source_recall(hits: list[dict], truth: GroundTruth, source_scores: dict[str, float]) -> float:
+    """Quota dei documenti del kNN esatto trovata (documenti con un chunk pari merito inclusi)."""
+    found = {
+        h["source"]
+        for h in hits
+        if source_scores.get(h["source"], -1.0) >= truth.threshold - SCORE_TOLERANCE
+    }
+    return min(1.0, len(found) / len(truth.sources))
+
+
+def load_store(url: str, name: str, corpus: Corpus, config: Config) -> QdrantStorage:
+    store = QdrantStorage(url=url, collection=name, dim=config.dim, index=config.index)
+    if url != LOCAL_QDRANT:
+        # Indice HNSW costruito anche per collezioni piccole (default: solo oltre 20 MB di vettori)
+        store.client.update_collection(
+            name, optimizers_config=OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD_KB)
+        )
+    for start in range(0, len(corpus.chunks), UPSERT_BATCH_SIZE):
+        batch = corpus.chunks[start : start + UPSERT_BATCH_SIZE]
+        store.upsert(
+            corpus.ids[start : start + UPSERT_BATCH_SIZE],
+            [hash_embedding(c["text"], config.dim) for c in batch],
+            batch,
+        )
+    if url != LOCAL_QDRANT:
+        deadline = time.monotonic() + INDEXING_TIMEOUT
+        while store.client.get_collection(name).status != CollectionStatus.GREEN:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Index of {name} not ready after {INDEXING_TIMEOUT} s")
+            time.sleep(0.5)
+    return store
+
+
+def evaluate(
+    store: QdrantStorage,
+    config: Config,
+    corpus: Corpus,
+    questions: list[str],
+    origins: list[set[str]],
+    truth: list[GroundTruth],
+    reference: Corpus,
+    top_k: int,
+) -> dict:
+    query_vectors = [hash_embedding(q, config.dim) for q in questions]
+    reference_vectors = np.array([hash_embedding(q) for q in questions], dtype=np.float32)
+    same_chunking = corpus is reference
+
+    for vector in query_vectors[:WARMUP_QUERIES]:
+        store.search_hits(vector, top_k)
+
+    latencies, chunk_recalls, source_recalls, hits_with_origin = [], [], [], []
+    for vector, reference_vector, origin, expected in zip(query_vectors, reference_vectors, origins, truth):
+        started = time.perf_counter()
+        hits = store.search_hits(vector, top_k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        # Score dei risultati con gli embedding di riferimento: misurano la qualità, non lo score di Qdrant
+        row = reference.reference @ reference_vector
+        source_scores: dict[str, float] = {}
+        for chunk, score in zip(reference.chunks, row):
+            source = chunk["source"]
+            source_scores[source] = max(source_scores.get(source, -1.0), float(score))
+        if same_chunking:
+            scores = {reference.ids[i]: float(row[i]) for i in range(len(reference.ids))}
+            chunk_recalls.append(chunk_recall(hits, expected, scores, top_k))
+        source_recalls.append(source_recall(hits, expected, source_scores))
+        hits_with_origin.append(any(h["source"] in origin for h in hits))
+
+    latencies.sort()
+    return {
+        "group": config.group,
+        "config": config.describe(),
+        "chunks": len(corpus.chunks),
+        "recall_at_k": round(statistics.mean(chunk_recalls), 4) if chunk_recalls else None,
+        "source_recall_at_k": round(statistics.mean(source_recalls), 4),
+        "hit_rate": round(statistics.mean(hits_with_origin), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+    }
+
+
+def run(
+    num_documents: int, num_queries: int, top_k: int, sweeps: list[str], url: str
+) -> dict:
+    documents = fixture_documents(num_documents=num_documents)
+    questions, origins = zip(*fixture_queries_with_sources(documents, num_queries))
+    reference_chunking = (DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
+    reference = make_corpus(documents, reference_chunking)
+    truth = exact_knn(
+        reference, np.array([hash_embedding(q) for q in questions], dtype=np.float32), top_k
+    )
+
+    corpora = {reference_chunking: reference}
+    stores: dict[tuple, QdrantStorage] = {}
+    results = []
+    try:
+        for config in build_configs(sweeps):
+            if config.chunking not in corpora:
+                corpora[config.chunking] = make_corpus(documents, config.chunking)
+            corpus = corpora[config.chunking]
+            key = config.collection_key()
+            started = time.perf_counter()
+            if key not in stores:
+                stores[key] = load_store(url, f"{COLLECTION_PREFIX}_{len(stores)}", corpus, config)
+            build_s = time.perf_counter() - started
+            # Stessa collezione, parametri di ricerca della configurazione
+            store = QdrantStorage(url=url, collection=stores[key].collection, dim=config.dim, index=config.index)
+            row = evaluate(store, config, corpus, questions, origins, truth, reference, top_k)
+            row["build_s"] = round(build_s, 2)
+            results.append(row)
+            print(
+                f"{config.group:13s} {json.dumps(row['config']):80s} recall {row['recall_at_k']}"
+                f"  source_recall {row['source_recall_at_k']}  hit_rate {row['hit_rate']}  p50 {row['p50_ms']} ms",
+                file=sys.stderr,
+            )
+    finally:
+        for store in stores.values():
+            store.client.delete_collection(store.collection)
+
+    return {
+        "documents": num_documents,
+        "queries": num_queries,
+        "top_k": top_k,
+        "qdrant": url,
+        "reference": {"dim": HASH_EMBEDDING_DIM, "chunk_size": reference_chunking[0], "chunk_overlap": reference_chunking[1]},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--sweep", default=None, help=f"comma separated groups among {', '.join(SWEEPS)}")
+    parser.add_argument("--qdrant-url", default=LOCAL_QDRANT, help="Qdrant server (default: local mode)")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    default_sweeps = LOCAL_SWEEPS if args.qdrant_url == LOCAL_QDRANT else SWEEPS
+    sweeps = args.sweep.split(",") if args.sweep else list(default_sweeps)
+    unknown = set(sweeps) - set(SWEEPS)
+    if unknown:
+        parser.error(f"unknown sweep groups: {', '.join(sorted(unknown))}")
+    if args.qdrant_url == LOCAL_QDRANT and set(sweeps) - set(LOCAL_SWEEPS):
+        print("Local mode searches exactly: hnsw and quantization settings have no effect", file=sys.stderr)
+
+    report = run(args.documents, args.queries, args.top_k, sweeps, args.qdrant_url)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Latency and recall of two-stage document routing against flat search.
+
+Carica il corpus fixture in un Qdrant locale (in memoria), calcola i vettori
+riassuntivi dei documenti e confronta, per ogni domanda, la ricerca piatta
+su tutti i chunk con la ricerca a due stadi (top M documenti, poi chunk
+filtrati con MatchAny). La recall@k è misurata rispetto alla ricerca piatta.
+
+Il Qdrant in memoria esegue una scansione esatta: le latenze assolute non
+sono quelle di un server con indice HNSW, ma il rapporto tra le due
+ricerche cresce con il numero di documenti.
+
+Uso:
+    python -m benchmarks.bench_routing [--documents 200] [--queries 50] [--top-k 5] [--sources 10]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.fixtures import (
+    HASH_EMBEDDING_DIM,
+    fixture_chunks,
+    fixture_documents,
+    fixture_queries,
+    hash_embedding,
+)
+from src.core.vector_db import QdrantStorage, make_chunk_id
+
+UPSERT_BATCH_SIZE = 256  # Punti per ogni upsert durante il caricamento del corpus
+
+
+def _load_corpus(num_documents: int) -> tuple[QdrantStorage, dict[str, str]]:
+    documents = fixture_documents(num_documents=num_documents)
+    chunks = fixture_chunks(documents)
+    store = QdrantStorage(url=":memory:", dim=HASH_EMBEDDING_DIM)
+    for start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+        batch = chunks[start : start + UPSERT_BATCH_SIZE]
+        store.upsert(
+            [make_chunk_id(c["source"], c["chunk_index"]) for c in batch],
+            [hash_embedding(c["text"]) for c in batch],
+            batch,
+        )
+    for source_id in documents:
+        store.update_source_vector(source_id)
+    return store, documents
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run(num_documents: int, num_queries: int, top_k: int, num_sources: int) -> dict:
+    store, documents = _load_corpus(num_documents)
+
+    flat_ms, routed_ms, recalls = [], [], []
+    for question in fixture_queries(documents, num_queries):
+        query_vector = hash_embedding(question)
+        flat, elapsed = _timed(lambda: store.search_hits(query_vector, top_k))
+        flat_ms.append(elapsed)
+
+        def routed_search():
+            sources = store.route_sources(query_vector, num_sources)
+            return store.search_hits(query_vector, top_k, source_ids=sources)
+
+        routed, elapsed = _timed(routed_search)
+        routed_ms.append(elapsed)
+
+        expected = {h["id"] for h in flat}
+        recalls.append(len(expected & {h["id"] for h in routed}) / len(expected))
+
+    return {
+        "documents": num_documents,
+        "chunks": store.client.count(store.collection).count,
+        "queries": num_queries,
+        "top_k": top_k,
+        "routing_top_sources": num_sources,
+        "flat_p50_ms": round(statistics.median(flat_ms), 2),
+        "routed_p50_ms": round(statistics.median(routed_ms), 2),
+        "routed_recall_at_k": round(statistics.mean(recalls), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--sources", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.documents, args.queries, args.top_k, args.sources), indent=2))
+
+
+if __name__ == "__main__":
+    main()
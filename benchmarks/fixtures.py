@@ -0,0 +1,178 @@
+"""Deterministic fixture corpus and offline embeddings shared by the benchmarks."""
+
+import hashlib
+import math
+import random
+import re
+
+from src.core.data_loader import get_splitter
+
+# ============================================================================
+# CONSTANTS - Fixture corpus settings
+# ============================================================================
+FIXTURE_SEED = 42  # Seed del generatore, per risultati riproducibili
+FIXTURE_DOCUMENTS = 40  # Numero di documenti sintetici
+FIXTURE_SENTENCES_PER_DOCUMENT = 400  # Frasi per documento
+FIXTURE_DUPLICATE_EVERY = 8  # Ogni N documenti uno è una copia (stesso testo, source diverso)
+FIXTURE_VOCABULARY_SIZE = 3000  # Parole sintetiche disponibili nel corpus
+FIXTURE_SECTION_SENTENCES = 6  # Frasi per sezione (ogni sezione ha il suo vocabolario)
+FIXTURE_SECTION_WORDS = 12  # Parole del vocabolario usate da ogni sezione
+HASH_EMBEDDING_DIM = 256  # Dimensione degli embedding hashing (bag of words)
+
+_TEMPLATES = [
+    "The {0} {1} the {2} of the {3} when the {4} is tuned.",
+    "A {0} stores each {1} next to the {2}, so the {3} stays close to the {4}.",
+    "Measuring the {0} against the {1} shows how the {2} changes the {3}.",
+    "Every {0} in the {1} depends on the {2} and on the {3} of the {4}.",
+]
+
+
+# Parole dei template e delle domande, ignorate dagli embedding hashing
+_STOPWORDS = set(re.findall(r"[a-z]+", " ".join(_TEMPLATES).lower())) | {"how", "are", "related"}
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    """Parole sintetiche: ogni sezione del corpus usa un sottoinsieme diverso."""
+    letters = "abcdefghilmnoprstuvz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def _section(rng: random.Random, words: list[str], sentences: int) -> str:
+    return " ".join(
+        rng.choice(_TEMPLATES).format(*rng.sample(words, 5)) for _ in range(sentences)
+    )
+
+
+def fixture_documents(
+    num_documents: int = FIXTURE_DOCUMENTS,
+    sentences: int = FIXTURE_SENTENCES_PER_DOCUMENT,
+    seed: int = FIXTURE_SEED,
+) -> dict[str, str]:
+    """Genera i documenti sintetici {source_id: testo}, con alcuni duplicati."""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, FIXTURE_VOCABULARY_SIZE)
+    documents = {}
+    previous = None
+    for i in range(num_documents):
+        if previous is not None and i % FIXTURE_DUPLICATE_EVERY == 0:
+            text = previous
+        else:
+            text = " ".join(
+                _section(rng, rng.sample(vocabulary, FIXTURE_SECTION_WORDS), FIXTURE_SECTION_SENTENCES)
+                for _ in range(sentences // FIXTURE_SECTION_SENTENCES)
+            )
+        documents[f"fixture-{i:03d}.pdf"] = text
+        previous = text
+    return documents
+
+
+def fixture_chunks(documents: dict[str, str], text_splitter=None) -> list[dict]:
+    """Divide i documenti con lo splitter dell'applicazione (stesso overlap) o con text_splitter."""
+    text_splitter = text_splitter or get_splitter()
+    chunks = []
+    for source_id, text in documents.items():
+        for index, chunk in enumerate(text_splitter.split_text(text)):
+            chunks.append({"source": source_id, "chunk_index": index, "text": chunk})
+    return chunks
+
+
+def fixture_queries(documents: dict[str, str], num_queries: int, seed: int = FIXTURE_SEED) -> list[str]:
+    """Genera domande con le parole di una frase presa a caso dal corpus."""
+    return [question for question, _ in fixture_queries_with_sources(documents, num_queries, seed)]
+
+
+def fixture_queries_with_sources(
+    documents: dict[str, str], num_queries: int, seed: int = FIXTURE_SEED
+) -> list[tuple[str, set[str]]]:
+    """Come fixture_queries, con i documenti che contengono la frase di ogni domanda (copie incluse)."""
+    rng = random.Random(seed + 1)
+    texts = list(documents.values())
+    queries = []
+    for _ in range(num_queries):
+        text = rng.choice(texts)
+        sentence = rng.choice(re.split(r"(?<=\.) ", text))
+        words = [w for w in re.findall(r"[a-z]+", sentence.lower()) if w not in _STOPWORDS]
+        sources = {source_id for source_id, other in documents.items() if other == text}
+        queries.append((f"How are {' '.join(words[:3])} related?", sources))
+    return queries
+
+
+def hash_embedding(text: str, dim: int = HASH_EMBEDDING_DIM) -> list[float]:
+    """Embedding deterministico bag-of-words (hashing trick), normalizzato."""
+    vec = [0.0] * dim
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in _STOPWORDS:
+            continue
+        digest = hashlib.blake2b(token.encode(), digest_size=4).digest()
+        vec[int.from_bytes(digest, "little") % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+PDF_LINES_PER_PAGE = 60  # Righe di testo per pagina nei PDF fixture
+PDF_LINE_CHARS = 90  # Caratteri massimi per riga nei PDF fixture
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int) -> list[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def write_fixture_pdf(path, text: str, num_pages: int) -> None:
+    """
+    Scrive un PDF minimale (Helvetica, solo testo) con num_pages pagine.
+
+    Il testo viene ripetuto se non basta a riempire le pagine: i benchmark di
+    parsing e chunking non dipendono da strumenti esterni per creare i PDF.
+    """
+    lines = _wrap(text, PDF_LINE_CHARS)
+    needed = num_pages * PDF_LINES_PER_PAGE
+    lines = (lines * (needed // len(lines) + 1))[:needed]
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, scritto quando si conoscono le pagine
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(num_pages):
+        page_lines = lines[page * PDF_LINES_PER_PAGE : (page + 1) * PDF_LINES_PER_PAGE]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(
+            f"({_pdf_escape(line)}) Tj T*" for line in page_lines
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {num_pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    ).encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
@@ -0,0 +1,554 @@
+"""
+End-to-end load generator: one application instance against stub providers.
+
+Avvia lo stub HTTP di Ollama/OpenAI (embedding e chat con latenza e ritmo dei
+token configurabili) e un'istanza dell'applicazione (uvicorn in un
+sottoprocesso) con backend di esecuzione locale e Qdrant in modalità locale
+(QDRANT_URL=":memory:"): nessun servizio esterno né rete. Dopo il caricamento
+di un corpus iniziale, N utenti simulati ripetono per la durata di ogni step
+un mix di operazioni:
+
+- query: POST /api/query e attesa del risultato (SSE di stato)
+- stream: POST /api/query/stream fino all'evento done
+- upload: POST /api/upload di un PDF nuovo e attesa della fine dell'ingest
+
+Per ogni step riporta throughput, latenze p50/p95/p99 ed error rate per
+operazione e per fase (invio, primo token, completamento); le risposte 429
+del controllo di ammissione sono contate a parte. Se nel server è installato
+prometheus_client riporta anche gli stage della pipeline (embed, qdrant_*,
+llm_generate, ...) dalla differenza di /metrics tra inizio e fine dello step:
+i percentili sono stimati dai bucket degli istogrammi.
+
+Operazioni, domande e documenti sono scelti da generatori con seed fisso: a
+parità di argomenti ogni run esegue lo stesso carico.
+
+Uso:
+    python -m benchmarks.load [--users 1,8,32] [--duration 30] [--mix query=0.7,stream=0.2,upload=0.1]
+        [--provider ollama] [--embed-latency 0.02] [--chat-latency 0.2] [--tokens-per-second 50]
+        [--documents 10] [--pages 5] [--output load.json]
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from benchmarks.fixtures import HASH_EMBEDDING_DIM, fixture_documents, fixture_queries, write_fixture_pdf
+from benchmarks.stub_providers import DEFAULT_ANSWER_TOKENS, StubProviderServer
+
+# ============================================================================
+# CONSTANTS - Load test settings
+# ============================================================================
+DEFAULT_USERS = "1,8,32"  # Utenti concorrenti per step
+DEFAULT_DURATION = 30.0  # Secondi di carico per step
+DEFAULT_MIX = "query=0.7,stream=0.2,upload=0.1"  # Peso di ogni operazione nel mix
+DEFAULT_SEED = 42  # Seed delle scelte degli utenti
+DEFAULT_SEED_DOCUMENTS = 10  # Documenti caricati prima del carico
+DEFAULT_PAGES = 5  # Pagine di ogni PDF caricato
+DEFAULT_EMBED_LATENCY = 0.02  # Latenza di ogni chiamata di embedding dello stub (secondi)
+DEFAULT_CHAT_LATENCY = 0.2  # Latenza del primo token dello stub (secondi)
+DEFAULT_TOKENS_PER_SECOND = 50.0  # Ritmo dei token generati dallo stub
+QUERY_POOL_SIZE = 200  # Domande distinte tra cui scelgono gli utenti
+SEED_CONCURRENCY = 4  # Upload concorrenti del corpus iniziale
+SERVER_STARTUP_TIMEOUT = 60.0  # Attesa massima dell'avvio dell'applicazione (secondi)
+REQUEST_TIMEOUT = 300.0  # Timeout di ogni operazione (secondi)
+PERCENTILES = (50, 95, 99)
+OPERATIONS = ("query", "stream", "upload")
+
+# Stati terminali restituiti da /api/query/status e /api/upload/status
+QUERY_DONE = {"completed", "failed"}
+UPLOAD_DONE = {"Completed", "Succeeded", "Success", "Finished", "Failed", "Cancelled"}
+UPLOAD_OK = {"Completed", "Succeeded", "Success", "Finished"}
+
+
+class OperationFailed(Exception):
+    """Operazione terminata con un errore (HTTP, run fallito o evento error)."""
+
+
+class Rejected(Exception):
+    """Operazione respinta dal controllo di ammissione (429)."""
+
+
+class StepStats:
+    """Campioni di latenza ed esiti delle operazioni di uno step."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = collections.defaultdict(list)
+        self.outcomes: dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        self.errors: collections.Counter = collections.Counter()
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.latencies[phase].append(seconds * 1000)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in mix: {name} (expected one of {', '.join(OPERATIONS)})")
+        weights[name] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Percentile nearest-rank di campioni già ordinati."""
+    return samples[max(0, min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1))]
+
+
+def latency_summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    summary = {"count": len(samples)}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(percentile(samples, p), 1) if samples else None
+    return summary
+
+
+# ============================================================================
+# Server metrics (/metrics, formato di esposizione Prometheus)
+# ============================================================================
+_SAMPLE_RE = re.compile(r"^(\w+)\{(.*)\}\s+(\S+)$")
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_stage_metrics(text: str) -> dict:
+    """Bucket cumulativi e errori per stage (sommati su provider e modello)."""
+    buckets: dict = collections.defaultdict(lambda: collections.defaultdict(float))
+    errors: dict = collections.defaultdict(float)
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(_LABEL_RE.findall(labels))
+        if name == "fastrag_stage_duration_seconds_bucket":
+            buckets[labels["stage"]][float(labels["le"])] += float(value)
+        elif name == "fastrag_stage_errors_total":
+            errors[labels["stage"]] += float(value)
+    return {"buckets": buckets, "errors": errors}
+
+
+def _bucket_quantile(q: float, buckets: list[tuple[float, float]]) -> Optional[float]:
+    """Quantile stimato da bucket cumulativi (le, conteggio) come histogram_quantile."""
+    total = buckets[-1][1] if buckets else 0
+    if total <= 0:
+        return None
+    rank = q * total
+    lower, lower_count = 0.0, 0.0
+    for upper, count in buckets:
+        if count >= rank:
+            if math.isinf(upper):
+                return lower
+            if count == lower_count:
+                return upper
+            return lower + (upper - lower) * (rank - lower_count) / (count - lower_count)
+        lower, lower_count = upper, count
+    return lower
+
+
+def stage_deltas(before: dict, after: dict) -> dict:
+    """Latenze (percentili stimati) ed error rate per stage tra due letture di /metrics."""
+    stages = {}
+    for stage, after_buckets in after["buckets"].items():
+        before_buckets = before["buckets"].get(stage, {})
+        buckets = sorted((le, count - before_buckets.get(le, 0.0)) for le, count in after_buckets.items())
+        count = buckets[-1][1] if buckets else 0
+        if count <= 0:
+            continue
+        errors = after["errors"].get(stage, 0.0) - before["errors"].get(stage, 0.0)
+        summary = {"count": int(count), "errors": int(errors), "error_rate": round(errors / count, 4)}
+        for p in PERCENTILES:
+            value = _bucket_quantile(p / 100, buckets)
+            summary[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+        stages[stage] = summary
+    return stages
+
+
+async def read_stage_metrics(client: httpx.AsyncClient) -> Optional[dict]:
+    response = await client.get("/metrics")
+    if response.status_code != 200:
+        return None  # prometheus_client non installato nel server
+    return parse_stage_metrics(response.text)
+
+
+# ============================================================================
+# Application server
+# ============================================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """Istanza dell'applicazione in un sottoprocesso uvicorn, con directory di lavoro temporanea."""
+
+    def __init__(self, workdir: Path, env: dict):
+        self.workdir = workdir
+        self.env = env
+        self.port = _free_port()
+        self.log_path = workdir / "server.log"
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        repo_root = Path(__file__).resolve().parent.parent
+        pythonpath = os.pathsep.join(filter(None, [str(repo_root), os.environ.get("PYTHONPATH")]))
+        env = {**os.environ, "PYTHONPATH": pythonpath, **self.env}
+        self._log = self.log_path.open("w")
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app:app",
+                "--app-dir", str(repo_root),
+                "--host", "127.0.0.1",
+                "--port", str(self.port),
+                "--log-level", "warning",
+            ],
+            cwd=self.workdir,
+            env=env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT
+        async with httpx.AsyncClient(base_url=self.url) as client:
+            while time.monotonic() < deadline:
+                if self._process.poll() is not None:
+                    break
+                try:
+                    if (await client.get("/api/scheduler")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Application did not start, see log:\n{self.log_path.read_text()[-4000:]}")
+
+    def stop(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+        self._log.close()
+
+
+# ============================================================================
+# Operations
+# ============================================================================
+def _raise_for_status(response: httpx.Response) -> None:
+    if response.status_code == 429:
+        raise Rejected()
+    if response.status_code >= 400:
+        raise OperationFailed(f"HTTP {response.status_code}")
+
+
+async def _wait_status(client: httpx.AsyncClient, path: str, done: set) -> dict:
+    """Segue lo stato di un job (SSE) fino a uno stato terminale."""
+    async with client.stream("GET", path) as response:
+        _raise_for_status(response)
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise OperationFailed(data.get("detail", "status stream error"))
+                if data.get("status") in done:
+                    return data
+    raise OperationFailed("status stream ended before completion")
+
+
+async def run_query(client: httpx.AsyncClient, question: str, stats: StepStats) -> None:
+    started = time.perf_counter()
+    response = await client.post("/api/query", json={"question": question})
+    _raise_for_status(response)
+    stats.record("query.submit", time.perf_counter() - started)
+    event_id = response.json()["event_id"]
+    status = await _wait_status(client, f"/api/query/status/{event_id}/events", QUERY_DONE)
+    if status["status"] != "completed":
+        raise OperationFailed(str(status.get("error")))
+    stats.record("query.total", time.perf_counter() - started)
+
+
+async def run_stream(client: httpx.AsyncClient, question: str, stats: StepStats) -> None:
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", "/api/query/stream", json={"question": question}) as response:
+        _raise_for_status(response)
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+            elif line.startswith("data: ") and event == "error":
+                raise OperationFailed(json.loads(line[len("data: "):]).get("detail"))
+            elif line.startswith("data: ") and event == "done":
+                break
+        else:
+            raise OperationFailed("stream ended without a done event")
+    if first_token is not None:
+        stats.record("stream.first_token", first_token)
+    stats.record("stream.total", time.perf_counter() - started)
+
+
+async def run_upload(client: httpx.AsyncClient, name: str, pdf: bytes, stats: StepStats) -> None:
+    started = time.perf_counter()
+    response = await client.post("/api/upload", files={"file": (name, pdf, "application/pdf")})
+    _raise_for_status(response)
+    stats.record("upload.submit", time.perf_counter() - started)
+    event_id = response.json().get("event_id")
+    if event_id is None:
+        raise OperationFailed("upload treated as a duplicate")
+    status = await _wait_status(client, f"/api/upload/status/{event_id}/events", UPLOAD_DONE)
+    if status["status"] not in UPLOAD_OK:
+        raise OperationFailed(str((status.get("run") or {}).get("error")))
+    stats.record("upload.total", time.perf_counter() - started)
+
+
+class Workload:
+    """Domande e documenti del carico, deterministici a parità di seed."""
+
+    def __init__(self, workdir: Path, documents: dict[str, str], pages: int, seed: int):
+        self.workdir = workdir
+        self.texts = list(documents.values())
+        self.pages = pages
+        self.queries = fixture_queries(documents, QUERY_POOL_SIZE, seed)
+        self._uploads = 0
+
+    def pdf(self, text: str, marker: str) -> bytes:
+        """PDF di `pages` pagine con un marcatore che lo rende unico (niente deduplica)."""
+        path = self.workdir / f"{marker}.pdf"
+        write_fixture_pdf(path, f"{marker}. {text}", self.pages)
+        data = path.read_bytes()
+        path.unlink()
+        return data
+
+    def next_upload(self, rng: random.Random) -> tuple[str, bytes]:
+        self._uploads += 1
+        name = f"load-{self._uploads:06d}"
+        return f"{name}.pdf", self.pdf(rng.choice(self.texts), name)
+
+
+async def run_operation(
+    client: httpx.AsyncClient, operation: str, workload: Workload, rng: random.Random, stats: StepStats
+) -> None:
+    try:
+        if operation == "upload":
+            name, pdf = await asyncio.to_thread(workload.next_upload, rng)
+            await asyncio.wait_for(run_upload(client, name, pdf, stats), REQUEST_TIMEOUT)
+        elif operation == "stream":
+            await asyncio.wait_for(run_stream(client, rng.choice(workload.queries), stats), REQUEST_TIMEOUT)
+        else:
+            await asyncio.wait_for(run_query(client, rng.choice(workload.queries), stats), REQUEST_TIMEOUT)
+        stats.outcomes[operation]["ok"] += 1
+    except Rejected:
+        stats.outcomes[operation]["rejected"] += 1
+    except (OperationFailed, httpx.HTTPError, asyncio.TimeoutError) as e:
+        stats.outcomes[operation]["errors"] += 1
+        stats.errors[f"{operation}: {type(e).__name__}: {str(e)[:120]}"] += 1
+
+
+async def run_step(
+    client: httpx.AsyncClient, workload: Workload, users: int, duration: float, mix: dict, seed: int
+) -> dict:
+    stats = StepStats()
+    before = await read_stage_metrics(client)
+    deadline = time.perf_counter() + duration
+    operations, weights = list(mix), list(mix.values())
+
+    async def user(index: int) -> None:
+        # Ogni utente ha il suo generatore: stessa sequenza di operazioni a ogni run
+        rng = random.Random(seed * 1000003 + users * 1009 + index)
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            await run_operation(client, operation, workload, rng, stats)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    after = await read_stage_metrics(client)
+
+    operations_report = {}
+    for operation in operations:
+        outcome = stats.outcomes[operation]
+        total = sum(outcome.values())
+        operations_report[operation] = {
+            "count": total,
+            "ok": outcome["ok"],
+            "errors": outcome["errors"],
+            "rejected": outcome["rejected"],
+            "error_rate": round(outcome["errors"] / total, 4) if total else 0.0,
+            "throughput_rps": round(outcome["ok"] / elapsed, 2),
+        }
+    return {
+        "users": users,
+        "elapsed_s": round(elapsed, 1),
+        "throughput_rps": round(sum(o["ok"] for o in operations_report.values()) / elapsed, 2),
+        "operations": operations_report,
+        "phases": {phase: latency_summary(samples) for phase, samples in sorted(stats.latencies.items())},
+        "server_stages": stage_deltas(before, after) if before and after else None,
+        "error_samples": dict(stats.errors.most_common(5)),
+    }
+
+
+async def seed_corpus(client: httpx.AsyncClient, workload: Workload, documents: int) -> None:
+    """Carica il corpus iniziale (non misurato) e attende la fine dell'ingest."""
+    semaphore = asyncio.Semaphore(SEED_CONCURRENCY)
+    stats = StepStats()
+
+    async def upload(index: int) -> None:
+        async with semaphore:
+            name = f"seed-{index:04d}"
+            pdf = await asyncio.to_thread(workload.pdf, workload.texts[index % len(workload.texts)], name)
+            await run_upload(client, f"{name}.pdf", pdf, stats)
+
+    await asyncio.gather(*(upload(i) for i in range(documents)))
+
+
+# ============================================================================
+# Report
+# ============================================================================
+def _format_latency(summary: dict) -> str:
+    return "  ".join(
+        f"p{p} {summary[f'p{p}_ms']:>9.1f}" if summary.get(f"p{p}_ms") is not None else f"p{p} {'-':>9}"
+        for p in PERCENTILES
+    )
+
+
+def print_step(step: dict) -> None:
+    print(f"\n=== {step['users']} users, {step['elapsed_s']} s, {step['throughput_rps']} ops/s ===")
+    for name, op in step["operations"].items():
+        print(
+            f"{name:24s} {op['ok']:6d} ok  {op['throughput_rps']:8.2f}/s  "
+            f"errors {op['error_rate']:6.1%}  rejected {op['rejected']}"
+        )
+    print("-- phases (ms)")
+    for phase, summary in step["phases"].items():
+        print(f"{phase:24s} n={summary['count']:<6d} {_format_latency(summary)}")
+    if step["server_stages"]:
+        print("-- server stages (ms, estimated from histogram buckets)")
+        for stage, summary in sorted(step["server_stages"].items()):
+            print(
+                f"{stage:24s} n={summary['count']:<6d} {_format_latency(summary)}  "
+                f"errors {summary['error_rate']:6.1%}"
+            )
+    for message, count in step["error_samples"].items():
+        print(f"!! {count}x {message}")
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    users_steps = [int(u) for u in args.users.split(",")]
+    documents = fixture_documents()
+
+    stub = StubProviderServer(
+        HASH_EMBEDDING_DIM,
+        embed_latency=args.embed_latency,
+        chat_latency=args.chat_latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    with tempfile.TemporaryDirectory() as workdir, stub as stub_url:
+        workdir = Path(workdir)
+        server = AppServer(
+            workdir,
+            {
+                "LLM_PROVIDER": args.provider,
+                "EMBEDDING_PROVIDER": args.provider,
+                "OLLAMA_BASE_URL": stub_url,
+                "OPENAI_BASE_URL": f"{stub_url}/v1",
+                "OPENAI_API_KEY": "stub",
+                "EMBEDDING_DIMENSION": str(HASH_EMBEDDING_DIM),
+                "QDRANT_URL": ":memory:",
+                "EXECUTION_BACKEND": "local",
+                "WARMUP_MODELS": "false",
+                "LLM_FALLBACK_PROVIDERS": "",
+                "TRACING_ENABLED": "false",
+                "PROFILING_ALWAYS": "false",
+            },
+        )
+        await server.start()
+        try:
+            limits = httpx.Limits(max_connections=max(users_steps) * 2 + 10)
+            async with httpx.AsyncClient(
+                base_url=server.url, timeout=REQUEST_TIMEOUT, limits=limits
+            ) as client:
+                workload = Workload(workdir, documents, args.pages, args.seed)
+                started = time.perf_counter()
+                await seed_corpus(client, workload, args.documents)
+                print(
+                    f"Seeded {args.documents} documents in {time.perf_counter() - started:.1f} s",
+                    file=sys.stderr,
+                )
+                steps = []
+                for users in users_steps:
+                    step = await run_step(client, workload, users, args.duration, mix, args.seed)
+                    print_step(step)
+                    steps.append(step)
+        finally:
+            server.stop()
+
+    return {
+        "suite": "load",
+        "config": {
+            "provider": args.provider,
+            "mix": mix,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "documents": args.documents,
+            "pages": args.pages,
+            "embed_latency_s": args.embed_latency,
+            "chat_latency_s": args.chat_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "answer_tokens": args.answer_tokens,
+        },
+        "steps": steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", default=DEFAULT_USERS, help="concurrent users per step, comma separated")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of load per step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. query=0.7,stream=0.2,upload=0.1")
+    parser.add_argument("--provider", choices=("ollama", "openai"), default="ollama")
+    parser.add_argument("--embed-latency", type=float, default=DEFAULT_EMBED_LATENCY)
+    parser.add_argument("--chat-latency", type=float, default=DEFAULT_CHAT_LATENCY)
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_TOKENS_PER_SECOND)
+    parser.add_argument("--answer-tokens", type=int, default=DEFAULT_ANSWER_TOKENS)
+    parser.add_argument("--documents", type=int, default=DEFAULT_SEED_DOCUMENTS, help="documents seeded before the load")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="pages of every uploaded PDF")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default=None, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
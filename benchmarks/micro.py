@@ -0,0 +1,301 @@
+"""
+Component microbenchmarks with JSON baselines and regression comparison.
+
+Misura, offline, i componenti su cui lavora l'ottimizzazione delle prestazioni:
+
+- parsing e chunking (load_and_chunk_pdf) di PDF fixture da 1, 10 e 50 pagine
+- ogni EmbeddingProvider HTTP (Ollama, OpenAI) contro lo stub locale
+- QdrantStorage upsert / search / scroll / delete su Qdrant in memoria
+- assemblaggio del prompt di rag_query_pdf_ai (assemble_context + messaggi)
+
+GoogleEmbeddingProvider non è incluso: l'SDK google-generativeai non permette
+di puntare a un endpoint locale.
+
+I risultati (mediana, p95 e minimo in ms per operazione) si salvano come JSON;
+`compare` confronta due file e termina con codice 1 se il tempo minimo (la
+statistica meno sensibile al rumore della macchina, --stat per cambiarla)
+peggiora oltre la soglia. Le baseline valgono solo per la macchina su cui sono
+state registrate: una regressione va confermata ripetendo la misura.
+
+Uso:
+    python -m benchmarks.micro run [--repeat 20] [--filter qdrant] [--output benchmarks/baselines/micro.json]
+    python -m benchmarks.micro run --compare benchmarks/baselines/micro.json
+    python -m benchmarks.micro compare BASELINE CURRENT [--threshold 0.25] [--stat min_ms]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from benchmarks.fixtures import (
+    HASH_EMBEDDING_DIM,
+    fixture_chunks,
+    fixture_documents,
+    fixture_queries,
+    hash_embedding,
+    write_fixture_pdf,
+)
+from benchmarks.stub_providers import StubProviderServer
+
+# ============================================================================
+# CONSTANTS - Microbenchmark settings
+# ============================================================================
+DEFAULT_REPEAT = 20  # Misure per benchmark (dopo il warm-up)
+WARMUP_RUNS = 2  # Esecuzioni scartate prima delle misure
+DEFAULT_THRESHOLD = 0.25  # Peggioramento massimo prima di segnalare una regressione
+DEFAULT_STAT = "min_ms"  # Statistica confrontata (min_ms, median_ms o p95_ms)
+STATS = ("min_ms", "median_ms", "p95_ms")
+BASELINE_PATH = Path("benchmarks/baselines/micro.json")  # Baseline registrata nel repository
+PDF_PAGE_COUNTS = (1, 10, 50)  # Dimensioni dei PDF fixture (pagine)
+EMBED_BATCH_SIZE = 32  # Testi per chiamata di embedding
+QDRANT_CORPUS_DOCUMENTS = 20  # Documenti precaricati in Qdrant per search/scroll
+QDRANT_UPSERT_BATCH = 64  # Punti per upsert misurato
+SEARCH_TOP_K = 5  # top_k delle ricerche (con over-fetch come in pipeline.search)
+PROMPT_TOKEN_BUDGET = 3000  # Budget di token per l'assemblaggio del prompt
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    setup: Optional[Callable[[], None]] = None  # Eseguita prima di ogni misura, non cronometrata
+
+
+def measure(benchmark: Benchmark, repeat: int) -> dict:
+    samples = []
+    for i in range(WARMUP_RUNS + repeat):
+        if benchmark.setup is not None:
+            benchmark.setup()
+        started = time.perf_counter()
+        benchmark.run()
+        elapsed = (time.perf_counter() - started) * 1000
+        if i >= WARMUP_RUNS:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def _pdf_benchmarks(workdir: Path, text: str) -> list[Benchmark]:
+    from src.core.data_loader import load_and_chunk_pdf
+
+    benchmarks = []
+    for pages in PDF_PAGE_COUNTS:
+        path = workdir / f"fixture-{pages}p.pdf"
+        write_fixture_pdf(path, text, pages)
+        benchmarks.append(
+            Benchmark(f"load_and_chunk_pdf[pages={pages}]", lambda p=str(path): load_and_chunk_pdf(p))
+        )
+    return benchmarks
+
+
+def _embedding_benchmarks(stub_url: str, texts: list[str]) -> list[Benchmark]:
+    from src.providers.embedding_providers import OllamaEmbeddingProvider, OpenAIEmbeddingProvider
+
+    # L'SDK OpenAI legge l'endpoint da OPENAI_BASE_URL alla creazione del client
+    os.environ["OPENAI_BASE_URL"] = f"{stub_url}/v1"
+    providers = {
+        "ollama": OllamaEmbeddingProvider(base_url=stub_url, model="stub-embed"),
+        "openai": OpenAIEmbeddingProvider(api_key="stub", model="stub-embed"),
+    }
+    batch = texts[:EMBED_BATCH_SIZE]
+    return [
+        Benchmark(f"embed[{name},batch={len(batch)}]", lambda p=provider: p.embed(batch))
+        for name, provider in providers.items()
+    ]
+
+
+def _qdrant_benchmarks(chunks: list[dict], queries: list[str]) -> list[Benchmark]:
+    from src.core.context import CONTEXT_OVERFETCH_FACTOR
+    from src.core.vector_db import QdrantStorage, make_chunk_id
+
+    store = QdrantStorage(url=":memory:", dim=HASH_EMBEDDING_DIM)
+    sources = sorted({c["source"] for c in chunks})[:QDRANT_CORPUS_DOCUMENTS]
+    corpus = [c for c in chunks if c["source"] in sources]
+    vectors = [hash_embedding(c["text"]) for c in corpus]
+    ids = [make_chunk_id(c["source"], c["chunk_index"]) for c in corpus]
+    for start in range(0, len(corpus), QDRANT_UPSERT_BATCH):
+        end = start + QDRANT_UPSERT_BATCH
+        store.upsert(ids[start:end], vectors[start:end], corpus[start:end])
+
+    # Documento scritto e cancellato a ogni misura di upsert/delete
+    scratch = [
+        {**c, "source": "scratch.pdf", "chunk_index": i}
+        for i, c in enumerate(corpus[:QDRANT_UPSERT_BATCH])
+    ]
+    scratch_ids = [make_chunk_id("scratch.pdf", c["chunk_index"]) for c in scratch]
+    scratch_vectors = vectors[: len(scratch)]
+    query_vectors = [hash_embedding(q) for q in queries]
+    query_cycle = iter(range(10**9))
+
+    def upsert_scratch():
+        store.upsert(scratch_ids, scratch_vectors, scratch)
+
+    def search():
+        vector = query_vectors[next(query_cycle) % len(query_vectors)]
+        return store.search_hits(vector, SEARCH_TOP_K * CONTEXT_OVERFETCH_FACTOR, with_vectors=True)
+
+    return [
+        Benchmark(f"qdrant_upsert[points={len(scratch)}]", upsert_scratch),
+        Benchmark(f"qdrant_search[limit={SEARCH_TOP_K * CONTEXT_OVERFETCH_FACTOR}]", search),
+        Benchmark("qdrant_scroll[get_chunks_by_source]", lambda: store.get_chunks_by_source(sources[0])),
+        Benchmark(
+            f"qdrant_delete[points={len(scratch)}]",
+            lambda: store.delete_by_source("scratch.pdf"),
+            setup=upsert_scratch,
+        ),
+    ]
+
+
+def _prompt_benchmarks(chunks: list[dict], queries: list[str]) -> list[Benchmark]:
+    from src.core.context import CONTEXT_OVERFETCH_FACTOR, assemble_context
+    from src.core.pipeline import build_query_messages
+
+    for chunk in chunks:
+        chunk.setdefault("vector", hash_embedding(chunk["text"]))
+    limit = SEARCH_TOP_K * CONTEXT_OVERFETCH_FACTOR
+    cases = []
+    for question in queries:
+        query_vector = hash_embedding(question)
+        scored = sorted(
+            chunks, key=lambda c: sum(q * v for q, v in zip(query_vector, c["vector"])), reverse=True
+        )
+        cases.append((question, query_vector, scored[:limit]))
+
+    def assemble():
+        # Il lavoro di rag_query_pdf_ai tra la ricerca e la chiamata LLM
+        for question, query_vector, hits in cases:
+            contexts, _ = assemble_context(query_vector, hits, SEARCH_TOP_K, PROMPT_TOKEN_BUDGET)
+            build_query_messages(question, contexts)
+
+    return [Benchmark(f"prompt_assembly[queries={len(cases)}]", assemble)]
+
+
+def run_suite(repeat: int, name_filter: Optional[str] = None) -> dict:
+    documents = fixture_documents()
+    chunks = fixture_chunks(documents)
+    queries = fixture_queries(documents, 20)
+    texts = [c["text"] for c in chunks]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, StubProviderServer(HASH_EMBEDDING_DIM) as stub_url:
+        groups = [
+            lambda: _pdf_benchmarks(Path(workdir), next(iter(documents.values()))),
+            lambda: _embedding_benchmarks(stub_url, texts),
+            lambda: _qdrant_benchmarks(chunks, queries),
+            lambda: _prompt_benchmarks(chunks[:400], queries),
+        ]
+        for build in groups:
+            for benchmark in build():
+                if name_filter and name_filter not in benchmark.name:
+                    continue
+                results[benchmark.name] = measure(benchmark, repeat)
+                print(f"{benchmark.name:45s} {results[benchmark.name]['median_ms']:10.3f} ms", file=sys.stderr)
+
+    return {
+        "suite": "micro",
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float, stat: str = DEFAULT_STAT
+) -> tuple[list[dict], bool]:
+    """Confronta la statistica `stat`; regressione se current > baseline * (1 + threshold)."""
+    rows = []
+    regressed = False
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            rows.append({"name": name, "status": "missing"})
+            continue
+        ratio = cur[stat] / base[stat] if base[stat] else 1.0
+        status = "regression" if ratio > 1 + threshold else "improved" if ratio < 1 - threshold else "ok"
+        regressed = regressed or status == "regression"
+        rows.append(
+            {
+                "name": name,
+                "baseline_ms": base[stat],
+                "current_ms": cur[stat],
+                "ratio": round(ratio, 2),
+                "status": status,
+            }
+        )
+    for name in current["results"].keys() - baseline["results"].keys():
+        rows.append({"name": name, "current_ms": current["results"][name][stat], "status": "new"})
+    return rows, regressed
+
+
+def _print_comparison(rows: list[dict]) -> None:
+    for row in rows:
+        if "ratio" in row:
+            print(
+                f"{row['name']:45s} {row['baseline_ms']:10.3f} -> {row['current_ms']:10.3f} ms"
+                f"  x{row['ratio']:<5} {row['status']}"
+            )
+        else:
+            print(f"{row['name']:45s} {row['status']}")
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and print/save the results")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--filter", default=None, help="only benchmarks whose name contains this")
+    run_parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    run_parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    run_parser.add_argument("--stat", choices=STATS, default=DEFAULT_STAT)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument("--stat", choices=STATS, default=DEFAULT_STAT)
+
+    args = parser.parse_args()
+    # I log INFO per operazione (QdrantStorage, httpx) falserebbero le misure
+    logging.disable(logging.INFO)
+    if args.command == "compare":
+        rows, regressed = compare(_load(args.baseline), _load(args.current), args.threshold, args.stat)
+        _print_comparison(rows)
+        sys.exit(1 if regressed else 0)
+
+    results = run_suite(args.repeat, args.filter)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        rows, regressed = compare(_load(args.compare), results, args.threshold, args.stat)
+        _print_comparison(rows)
+        sys.exit(1 if regressed else 0)
+    if not args.output:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Local stand-ins for the Ollama and OpenAI HTTP APIs used by the benchmarks.
+
+Rispondono con embedding deterministici (hash_embedding) e risposte chat
+deterministiche dopo una latenza configurabile, così i benchmark misurano il
+costo del client e della pipeline senza rete né modelli. Endpoint:
+
+    POST /api/embed             (Ollama)
+    POST /api/chat              (Ollama, anche in streaming NDJSON)
+    POST /v1/embeddings         (OpenAI)
+    POST /v1/chat/completions   (OpenAI, anche in streaming SSE)
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+from benchmarks.fixtures import hash_embedding
+
+STUB_HOST = "127.0.0.1"  # Interfaccia su cui ascolta lo stub (porta scelta dal sistema)
+DEFAULT_ANSWER_TOKENS = 64  # Token generati per risposta (se max_tokens non è più basso)
+
+
+class Stream:
+    """Risposta in streaming di una route: chunk già serializzati, inviati con chunked encoding."""
+
+    def __init__(self, content_type: str, chunks: Iterator[bytes]):
+        self.content_type = content_type
+        self.chunks = chunks
+
+
+class StubProviderServer:
+    """
+    Server HTTP in un thread: `with StubProviderServer(dim) as url: ...`.
+
+    embed_latency è il ritardo di ogni richiesta di embedding (secondi),
+    indipendente dal numero di testi. Le chat rispondono con answer_tokens
+    token: il primo dopo chat_latency secondi, i successivi al ritmo di
+    tokens_per_second (0 = tutti subito).
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        embed_latency: float = 0.0,
+        chat_latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        answer_tokens: int = DEFAULT_ANSWER_TOKENS,
+    ):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # Nessun log per richiesta: falserebbe le misure
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests += 1
+                route = stub.routes().get(self.path)
+                if route is None:
+                    self._send(404, {"error": f"unknown path {self.path}"})
+                    return
+                result = route(body)
+                if isinstance(result, Stream):
+                    self._send_stream(result)
+                else:
+                    self._send(200, result)
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, stream: Stream):
+                self.send_response(200)
+                self.send_header("Content-Type", stream.content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in stream.chunks:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._server = ThreadingHTTPServer((STUB_HOST, 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def routes(self) -> dict:
+        return {
+            "/api/embed": self._ollama_embed,
+            "/api/chat": self._ollama_chat,
+            "/v1/embeddings": self._openai_embeddings,
+            "/v1/chat/completions": self._openai_chat,
+        }
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        if self.embed_latency > 0:
+            time.sleep(self.embed_latency)
+        return [hash_embedding(text, self.dim) for text in texts]
+
+    def _ollama_embed(self, body: dict) -> dict:
+        texts = body.get("input", body.get("prompt", ""))
+        texts = [texts] if isinstance(texts, str) else texts
+        return {
+            "model": body.get("model"),
+            "embeddings": self._embed(texts),
+            "prompt_eval_count": sum(len(text.split()) for text in texts),
+        }
+
+    def _openai_embeddings(self, body: dict) -> dict:
+        texts = body["input"]
+        texts = [texts] if isinstance(texts, str) else texts
+        tokens = sum(len(text.split()) for text in texts)
+        return {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(self._embed(texts))
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _answer(self, messages: list[dict], max_tokens: int) -> tuple[int, list[str]]:
+        """Token del prompt (parole) e token della risposta, scelti dal prompt in modo deterministico."""
+        words = " ".join(m.get("content", "") for m in messages).split() or ["ok"]
+        count = min(self.answer_tokens, max_tokens or self.answer_tokens)
+        return len(words), [words[(i * 7919) % len(words)] + " " for i in range(count)]
+
+    def _paced(self, tokens: list[str]) -> Iterator[str]:
+        """Genera i token con la latenza del primo token e il ritmo configurati."""
+        if self.chat_latency > 0:
+            time.sleep(self.chat_latency)
+        for i, token in enumerate(tokens):
+            if i and self.tokens_per_second > 0:
+                time.sleep(1 / self.tokens_per_second)
+            yield token
+
+    def _ollama_chat(self, body: dict):
+        options = body.get("options") or {}
+        prompt_tokens, tokens = self._answer(body.get("messages", []), options.get("num_predict"))
+        usage = {"prompt_eval_count": prompt_tokens, "eval_count": len(tokens)}
+        if not body.get("stream", True):
+            content = "".join(self._paced(tokens))
+            return {
+                "model": body.get("model"),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                **usage,
+            }
+
+        def lines() -> Iterator[bytes]:
+            for token in self._paced(tokens):
+                yield json.dumps(
+                    {"model": body.get("model"), "message": {"role": "assistant", "content": token}, "done": False}
+                ).encode() + b"\n"
+            yield json.dumps(
+                {"model": body.get("model"), "message": {"role": "assistant", "content": ""}, "done": True, **usage}
+            ).encode() + b"\n"
+
+        return Stream("application/x-ndjson", lines())
+
+    def _openai_chat(self, body: dict):
+        prompt_tokens, tokens = self._answer(body.get("messages", []), body.get("max_tokens"))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model")}
+        if not body.get("stream"):
+            content = "".join(self._paced(tokens))
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            }
+
+        def events() -> Iterator[bytes]:
+            chunk = {**base, "object": "chat.completion.chunk"}
+            for token in self._paced(tokens):
+                choice = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                yield f"data: {json.dumps({**chunk, 'choices': [choice]})}\n\n".encode()
+            done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+            yield f"data: {json.dumps({**chunk, 'choices': [done]})}\n\n".encode()
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return Stream("text/event-stream", events())
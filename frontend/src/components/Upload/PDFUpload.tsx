@@ -1,6 +1,6 @@
 import { useState, useCallback, DragEvent, ChangeEvent, useEffect } from 'react';
 import { Upload, AlertCircle, Loader2 } from 'lucide-react';
-import { uploadAPI, pollUntilComplete, UploadStatus } from '../../services/api';
+import { uploadAPI, watchUntilComplete, UploadStatus } from '../../services/api';
 import { useUploadStore } from '../../stores/uploadStore';
 import { useToastContext } from '../Toast/ToastContainer';
 
@@ -59,15 +59,29 @@ const PDFUpload = () => {
     try {
       // Upload file
       const uploadResult = await uploadAPI.uploadPDF(file);
+
+      // Same content already ingested: the server skipped ingestion
+      if (!uploadResult.event_id) {
+        setUploadStatus({
+          status: 'completed',
+          message: uploadResult.message,
+          filename: file.name,
+        });
+        showToast(uploadResult.message, 'success');
+        return;
+      }
+      const eventId = uploadResult.event_id;
+
       setUploadStatus({
         status: 'processing',
         message: 'Processing file...',
-        eventId: uploadResult.event_id,
+        eventId,
       });
 
-      // Poll for completion
-      const finalStatus = await pollUntilComplete(
-        () => uploadAPI.getUploadStatus(uploadResult.event_id),
+      // Wait for completion (pushed by the server)
+      const finalStatus = await watchUntilComplete(
+        uploadAPI.getUploadStatusEventsUrl(eventId),
+        () => uploadAPI.getUploadStatus(eventId),
         (status) => {
           const uploadStatus = status as UploadStatus;
           const statusLower = uploadStatus.status.toLowerCase();
@@ -75,7 +89,7 @@ const PDFUpload = () => {
             setUploadStatus({
               status: 'processing',
               message: 'Processing file...',
-              eventId: uploadResult.event_id,
+              eventId,
             });
           }
         },
@@ -90,7 +104,7 @@ const PDFUpload = () => {
         status: 'completed',
         message: 'File uploaded and processed successfully!',
         filename: file.name,
-        eventId: uploadResult.event_id,
+        eventId,
       });
       
       // Show toast notification
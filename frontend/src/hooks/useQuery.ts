@@ -1,5 +1,5 @@
 import { useCallback } from 'react';
-import { queryAPI, pollUntilComplete } from '../services/api';
+import { queryAPI, watchUntilComplete } from '../services/api';
 import { useQueryStore } from '../stores/queryStore';
 import type { UseQueryReturn } from '../types';
 
@@ -27,8 +27,9 @@ export const useQuery = (): UseQueryReturn => {
       const { event_id } = await queryAPI.submitQuery(question, topK);
       setProgress({ status: 'running', message: 'Processing query...', eventId: event_id });
 
-      // Poll for result
-      const finalStatus = await pollUntilComplete(
+      // Wait for result (pushed by the server)
+      const finalStatus = await watchUntilComplete(
+        queryAPI.getQueryStatusEventsUrl(event_id),
         () => queryAPI.getQueryStatus(event_id),
         (status) => {
           if (status.status === 'running') {
@@ -1,8 +1,10 @@
 import axios, { AxiosInstance } from 'axios';
 import type {
   UploadResponse,
+  BulkUploadResponse,
   UploadStatus,
   QueryRequest,
+  QueryFilters,
   QueryResponse,
   QueryStatus,
   FileInfo,
@@ -54,8 +56,10 @@ api.interceptors.response.use(
 // Re-export types for convenience
 export type {
   UploadResponse,
+  BulkUploadResponse,
   UploadStatus,
   QueryRequest,
+  QueryFilters,
   QueryResponse,
   QueryStatus,
   FileInfo,
@@ -80,18 +84,38 @@ export const uploadAPI = {
     return response.data;
   },
 
+  // Più PDF e/o archivi zip/tar in una sola richiesta
+  uploadBulk: async (files: File[]): Promise<BulkUploadResponse> => {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+    const response = await api.post<BulkUploadResponse>('/api/upload/bulk', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  },
+
   getUploadStatus: async (eventId: string): Promise<UploadStatus> => {
     const response = await api.get<UploadStatus>(`/api/upload/status/${eventId}`);
     return response.data;
   },
+
+  getUploadStatusEventsUrl: (eventId: string): string =>
+    `${API_BASE_URL}/api/upload/status/${eventId}/events`,
 };
 
 // Query API
 export const queryAPI = {
-  submitQuery: async (question: string, topK: number = 5): Promise<QueryResponse> => {
+  submitQuery: async (
+    question: string,
+    topK: number = 5,
+    filters: QueryFilters = {}
+  ): Promise<QueryResponse> => {
     const response = await api.post<QueryResponse>('/api/query', {
       question,
       top_k: topK,
+      ...filters,
     });
     return response.data;
   },
@@ -100,6 +124,9 @@ export const queryAPI = {
     const response = await api.get<QueryStatus>(`/api/query/status/${eventId}`);
     return response.data;
   },
+
+  getQueryStatusEventsUrl: (eventId: string): string =>
+    `${API_BASE_URL}/api/query/status/${eventId}/events`,
 };
 
 // Files API
@@ -185,5 +212,64 @@ export const pollUntilComplete = async (
   }
 };
 
+// Status push utility: listens to the SSE status stream, falls back to polling
+export const watchUntilComplete = (
+  eventsUrl: string,
+  checkStatus: () => Promise<QueryStatus | UploadStatus>,
+  onProgress?: (status: QueryStatus | UploadStatus) => void,
+  options: PollOptions = {}
+): Promise<QueryStatus | UploadStatus> => {
+  if (typeof EventSource === 'undefined') {
+    return pollUntilComplete(checkStatus, onProgress, options);
+  }
+
+  const { timeout = 600000 } = options;
+
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(eventsUrl);
+    let done = false;
+
+    const finish = (callback: () => void) => {
+      if (done) return;
+      done = true;
+      clearTimeout(timer);
+      source.close();
+      callback();
+    };
+
+    const timer = setTimeout(() => {
+      finish(() => reject(new Error('Status stream timeout')));
+    }, timeout);
+
+    source.addEventListener('status', (event) => {
+      const status = JSON.parse((event as MessageEvent).data) as QueryStatus | UploadStatus;
+
+      if (onProgress) {
+        onProgress(status);
+      }
+
+      const statusLower = typeof status.status === 'string' ? status.status.toLowerCase() : '';
+
+      if (statusLower === 'completed' || statusLower === 'finished') {
+        finish(() => resolve(status));
+      } else if (statusLower === 'failed' || statusLower === 'error') {
+        const queryStatus = status as QueryStatus;
+        finish(() => reject(new Error(queryStatus.error || 'Operation failed')));
+      }
+    });
+
+    source.addEventListener('error', (event) => {
+      const data = (event as MessageEvent).data;
+      if (data) {
+        // Error event sent by the server
+        finish(() => reject(new Error(JSON.parse(data).detail || 'Operation failed')));
+      } else {
+        // Connection lost: fall back to polling
+        finish(() => resolve(pollUntilComplete(checkStatus, onProgress, options)));
+      }
+    });
+  });
+};
+
 export default api;
 
@@ -7,7 +7,14 @@ import type { LucideIcon } from 'lucide-react';
 export interface UploadResponse {
   message: string;
   filename: string;
-  event_id: string;
+  event_id: string | null;
+  duplicate_of?: string;
+}
+
+export interface BulkUploadResponse {
+  message: string;
+  files: { filename: string; event_id: string }[];
+  skipped: { filename: string; reason: string }[];
 }
 
 export interface UploadStatus {
@@ -20,7 +27,15 @@ export interface UploadStatus {
   } | null;
 }
 
-export interface QueryRequest {
+export interface QueryFilters {
+  source_ids?: string[];
+  uploaded_after?: string;
+  uploaded_before?: string;
+  page_from?: number;
+  page_to?: number;
+}
+
+export interface QueryRequest extends QueryFilters {
   question: string;
   top_k: number;
 }
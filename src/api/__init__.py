@@ -3,9 +3,13 @@ from fastapi import APIRouter
 api_router = APIRouter(prefix="/api")
 
 # Import all routers
-from . import upload, query, files
+from . import upload, query, files, system
 
 api_router.include_router(upload.router, tags=["upload"])
 api_router.include_router(query.router, tags=["query"])
 api_router.include_router(files.router, tags=["files"])
+api_router.include_router(system.router, tags=["system"])
+
+# Router montato alla radice dell'app (GET /metrics)
+metrics_router = system.metrics_router
 
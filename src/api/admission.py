@@ -0,0 +1,19 @@
+from fastapi import HTTPException, Request
+from src.core.admission import AdmissionController, AdmissionRejected, Ticket
+
+
+def client_id(request: Request) -> str:
+    """Identify the client for fair-share limits (remote address)."""
+    return request.client.host if request.client else "unknown"
+
+
+def admit(controller: AdmissionController, request: Request) -> Ticket:
+    """Reserve a pending slot or fail fast with 429 and Retry-After."""
+    try:
+        return controller.reserve(client_id(request))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from typing import List, Optional
 from pydantic import BaseModel
-from src.core.vector_db import QdrantStorage
+from src.core.accounting import get_source_usage
 import logging
 
 # Usa il logger di uvicorn per logging consistente
@@ -9,9 +9,19 @@ logger = logging.getLogger("uvicorn")
 
 router = APIRouter()
 
+
+def _storage():
+    """Storage Qdrant; qdrant_client viene importato alla prima richiesta, non all'avvio."""
+    from src.core.vector_db import QdrantStorage
+
+    return QdrantStorage()
+
+
 class FileInfo(BaseModel):
     source_id: str
     chunk_count: int
+    # Uso dei provider degli ingest del file (solo quelli eseguiti da questo processo)
+    usage: Optional[dict] = None
 
 class FilesResponse(BaseModel):
     files: List[FileInfo]
@@ -34,11 +44,11 @@ class DeleteFilesRequest(BaseModel):
 async def get_all_files():
     """Get all embedded files with their chunk counts."""
     try:
-        storage = QdrantStorage()
+        storage = _storage()
         sources_data = storage.get_all_sources()
         
         files = [
-            FileInfo(source_id=source_id, chunk_count=count)
+            FileInfo(source_id=source_id, chunk_count=count, usage=get_source_usage().get(source_id))
             for source_id, count in sources_data["sources"].items()
         ]
         
@@ -54,7 +64,7 @@ async def get_all_files():
 async def get_file_chunks(source_id: str, limit: int = 20, offset: int = 0):
     """Get chunks for a specific file."""
     try:
-        storage = QdrantStorage()
+        storage = _storage()
         chunks = storage.get_chunks_by_source(source_id, limit=limit + offset)
         
         # Apply offset
@@ -80,8 +90,9 @@ async def get_file_chunks(source_id: str, limit: int = 20, offset: int = 0):
 async def delete_file(source_id: str):
     """Delete a single file and all its chunks."""
     try:
-        storage = QdrantStorage()
+        storage = _storage()
         deleted_count = storage.delete_by_source(source_id)
+        get_source_usage().forget(source_id)
         
         return {
             "message": "File deleted successfully",
@@ -102,8 +113,9 @@ async def delete_files(request: DeleteFilesRequest):
     for source_id in request.source_ids:
         logger.info(f"[API DELETE] Processing deletion for source_id: {source_id}")
         try:
-            storage = QdrantStorage()
+            storage = _storage()
             deleted_count = storage.delete_by_source(source_id)
+            get_source_usage().forget(source_id)
             logger.info(f"[API DELETE] Successfully deleted {deleted_count} chunks for source_id: {source_id}")
             
             results.append({
@@ -1,115 +1,347 @@
 import asyncio
-from fastapi import APIRouter, HTTPException
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import datetime
 from pydantic import BaseModel
-from typing import Optional
-import inngest
-import os
-import requests
-import time
+from typing import AsyncIterator, List, Optional
 from dotenv import load_dotenv
+from src.core import pipeline
+from src.core.admission import Ticket, get_query_admission
+from src.core import accounting, metrics, profiling
+from src.core.config import ModelConfig
+from src.core.executor import send_event, get_status_broker, is_event_finished
+from src.core.scheduler import work_priority, PRIORITY_BULK
+from src.core.single_flight import SingleFlight, query_key
+from src.providers.llm_providers import get_llm_provider
+from .admission import admit
+from .sse import format_sse, sse_response
 
 load_dotenv()
 
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
 router = APIRouter()
 
-# Inngest client (singleton)
-_inngest_client = None
+# ============================================================================
+# CONSTANTS - Batch query settings
+# ============================================================================
+BATCH_QUERY_MAX_QUESTIONS = 1000  # Numero massimo di domande per richiesta batch
+BATCH_SEARCH_SIZE = 64  # Domande per ogni batch di embedding + query_batch_points
+QUERY_COALESCING_CACHE_NAME = "query_coalescing"  # Label "cache" nelle metriche (hit = query agganciata)
 
-def get_inngest_client() -> inngest.Inngest:
-    global _inngest_client
-    if _inngest_client is None:
-        _inngest_client = inngest.Inngest(
-            app_id="rag_app",
-            is_production=False,
-            serializer=inngest.PydanticSerializer(),
-        )
-    return _inngest_client
+# Query identiche in corso condividono lo stesso run
+_query_flights = SingleFlight()
 
-def _inngest_api_base() -> str:
-    return os.getenv("INNGEST_API_BASE", "http://127.0.0.1:8288/v1")
+class QueryFilters(BaseModel):
+    # Filtri opzionali: limitano la ricerca a documenti, date di caricamento o pagine
+    source_ids: Optional[List[str]] = None
+    uploaded_after: Optional[datetime.datetime] = None
+    uploaded_before: Optional[datetime.datetime] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
 
-def fetch_runs(event_id: str) -> list[dict]:
-    """Fetch runs for an event from Inngest API."""
-    url = f"{_inngest_api_base()}/events/{event_id}/runs"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    data = resp.json()
-    return data.get("data", [])
+    def search_filters(self) -> Optional[dict]:
+        """Filtri per pipeline.search (date come timestamp Unix), None se assenti."""
+        filters = {
+            "source_ids": self.source_ids or None,
+            "uploaded_after": self.uploaded_after.timestamp() if self.uploaded_after else None,
+            "uploaded_before": self.uploaded_before.timestamp() if self.uploaded_before else None,
+            "page_from": self.page_from,
+            "page_to": self.page_to,
+        }
+        filters = {k: v for k, v in filters.items() if v is not None}
+        return filters or None
 
-class QueryRequest(BaseModel):
+class QueryRequest(QueryFilters):
     question: str
     top_k: int = 5
 
+class BatchQueryRequest(QueryFilters):
+    questions: List[str]
+    top_k: int = 5
+
 class QueryResponse(BaseModel):
     event_id: str
     status: str
     message: str
+    coalesced: bool = False
+    profile_id: Optional[str] = None
 
 @router.post("/query", response_model=QueryResponse)
-async def query_pdf(request: QueryRequest):
+async def query_pdf(request: QueryRequest, http_request: Request):
     """Send a query to the LLM and return event ID for polling."""
-    client = get_inngest_client()
+    admission = get_query_admission()
+    ticket = admit(admission, http_request)
+    data = {
+        "question": request.question,
+        "top_k": request.top_k,
+    }
+    filters = request.search_filters()
+    if filters:
+        data["filters"] = filters
+    profile_id = profiling.requested_profile_id(http_request.headers)
+    if profile_id:
+        # Una query profilata ha il suo run: non viene agganciata a query identiche
+        data[profiling.PROFILE_FIELD] = profile_id
     
     try:
-        result = await client.send(
-            inngest.Event(
-                name="rag/query_pdf_ai",
-                data={
-                    "question": request.question,
-                    "top_k": request.top_k,
-                },
+        if ModelConfig.QUERY_COALESCING:
+            from src.core.vector_db import get_corpus_version
+
+            params = {k: v for k, v in data.items() if k != "question"}
+            event_id, coalesced = await _query_flights.submit(
+                query_key(request.question, params, get_corpus_version()),
+                lambda: send_event("rag/query_pdf_ai", data),
+                is_event_finished,
             )
-        )
-        event_id = result[0] if result else None
+            metrics.record_cache(QUERY_COALESCING_CACHE_NAME, coalesced)
+        else:
+            event_id, coalesced = await send_event("rag/query_pdf_ai", data), False
         
         if not event_id:
             raise HTTPException(status_code=500, detail="Failed to create query event")
+
+        if coalesced:
+            # Nessun nuovo job: il posto occupato è quello della query originale
+            admission.release(ticket, completed=False)
+        else:
+            admission.release_when_finished(ticket, event_id)
         
         return QueryResponse(
             event_id=event_id,
             status="pending",
-            message="Query submitted successfully"
+            message=(
+                "Query attached to an identical query in progress"
+                if coalesced
+                else "Query submitted successfully"
+            ),
+            coalesced=coalesced,
+            profile_id=profile_id,
         )
     except Exception as e:
+        admission.release(ticket, completed=False)
         raise HTTPException(status_code=500, detail=f"Error submitting query: {str(e)}")
 
+def query_status_from_runs(event_id: str, runs: list[dict]) -> dict:
+    """Map the runs of a query event to the status response."""
+    if not runs:
+        return {
+            "event_id": event_id,
+            "status": "pending",
+            "result": None,
+        }
+    
+    run = runs[0]
+    status = run.get("status", "Unknown")
+    output = run.get("output")
+    
+    if status in ("Completed", "Succeeded", "Success", "Finished"):
+        return {
+            "event_id": event_id,
+            "status": "completed",
+            "result": output or {},
+        }
+    elif status in ("Failed", "Cancelled"):
+        error = run.get("error", "Unknown error")
+        return {
+            "event_id": event_id,
+            "status": "failed",
+            "error": error,
+            "result": None,
+        }
+    else:
+        return {
+            "event_id": event_id,
+            "status": "running",
+            "result": None,
+        }
+
 @router.get("/query/status/{event_id}")
 async def get_query_status(event_id: str):
     """Get the status and result of a query."""
     try:
-        runs = fetch_runs(event_id)
-        
-        if not runs:
-            return {
-                "event_id": event_id,
-                "status": "pending",
-                "result": None,
-            }
-        
-        run = runs[0]
-        status = run.get("status", "Unknown")
-        output = run.get("output")
-        
-        if status in ("Completed", "Succeeded", "Success", "Finished"):
-            return {
-                "event_id": event_id,
-                "status": "completed",
-                "result": output or {},
-            }
-        elif status in ("Failed", "Cancelled"):
-            error = run.get("error", "Unknown error")
-            return {
-                "event_id": event_id,
-                "status": "failed",
-                "error": error,
-                "result": None,
-            }
-        else:
-            return {
-                "event_id": event_id,
-                "status": "running",
-                "result": None,
-            }
+        runs = await get_status_broker().get_runs(event_id)
+        return query_status_from_runs(event_id, runs)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching query status: {str(e)}")
 
+@router.get("/query/status/{event_id}/events")
+async def stream_query_status(event_id: str):
+    """Push status changes of a query as Server-Sent Events until it finishes."""
+    async def events():
+        try:
+            async for runs in get_status_broker().subscribe(event_id):
+                yield format_sse("status", query_status_from_runs(event_id, runs))
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Error fetching query status: {str(e)}"})
+
+    return sse_response(events())
+
+
+async def stream_query_events(
+    question: str, top_k: int, filters: Optional[dict] = None
+) -> AsyncIterator[str]:
+    """Run embed, search and generate directly, yielding SSE events."""
+    try:
+        found = await asyncio.to_thread(pipeline.search, question, top_k, filters)
+        yield format_sse(
+            "sources",
+            {"sources": found.sources, "num_contexts": len(found.contexts)},
+        )
+
+        answer_parts = []
+        with accounting.tracking() as llm_usage:
+            async for token in get_llm_provider().generate_stream(
+                messages=pipeline.build_query_messages(question, found.contexts),
+                max_tokens=pipeline.DEFAULT_MAX_TOKENS,
+                temperature=pipeline.DEFAULT_TEMPERATURE,
+            ):
+                answer_parts.append(token)
+                yield format_sse("token", {"text": token})
+
+        yield format_sse(
+            "done",
+            {
+                "answer": "".join(answer_parts).strip(),
+                "sources": found.sources,
+                "num_contexts": len(found.contexts),
+                "usage": accounting.summarize(accounting.merge(found.usage, llm_usage.entries())),
+            },
+        )
+    except Exception as e:
+        logger.error(f"[QUERY STREAM] Error streaming query: {str(e)}", exc_info=True)
+        yield format_sse("error", {"detail": f"Error streaming query: {str(e)}"})
+
+
+async def _release_after(
+    ticket: Ticket, items: AsyncIterator, profile_id: Optional[str] = None, label: str = ""
+) -> AsyncIterator:
+    """Re-yield a response stream, profiling it if requested, and free its admission slot when it ends."""
+    try:
+        with profiling.session(profile_id, label):
+            async for item in items:
+                yield item
+    finally:
+        get_query_admission().release(ticket)
+
+
+def _profile_headers(profile_id: Optional[str]) -> dict:
+    return {profiling.PROFILE_ID_HEADER: profile_id} if profile_id else {}
+
+
+@router.post("/query/stream")
+async def query_pdf_stream(request: QueryRequest, http_request: Request):
+    """Answer a query synchronously, streaming sources and LLM tokens as SSE."""
+    ticket = admit(get_query_admission(), http_request)
+    profile_id = profiling.requested_profile_id(http_request.headers)
+    response = sse_response(
+        _release_after(
+            ticket,
+            stream_query_events(request.question, request.top_k, request.search_filters()),
+            profile_id,
+            "query-stream",
+        )
+    )
+    response.headers.update(_profile_headers(profile_id))
+    return response
+
+
+async def run_query_batch(
+    questions: list[str], top_k: int, filters: Optional[dict] = None
+) -> AsyncIterator[dict]:
+    """
+    Answer many questions, yielding one result per question as soon as it is ready.
+
+    Le domande vengono cercate a blocchi di BATCH_SEARCH_SIZE (un batch di
+    embedding e una query_batch_points per blocco) mentre le generazioni dei
+    blocchi precedenti sono in corso, al massimo BATCH_QUERY_CONCURRENCY alla volta.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(ModelConfig.BATCH_QUERY_CONCURRENCY)
+    tasks: set[asyncio.Task] = set()
+
+    async def answer(index: int, question: str, found) -> None:
+        try:
+            text = await get_llm_provider().generate(
+                messages=pipeline.build_query_messages(question, found.contexts),
+                max_tokens=pipeline.DEFAULT_MAX_TOKENS,
+                temperature=pipeline.DEFAULT_TEMPERATURE,
+            )
+            item = {
+                "index": index,
+                "question": question,
+                "status": "completed",
+                "answer": text,
+                "sources": found.sources,
+                "num_contexts": len(found.contexts),
+            }
+        except Exception as e:
+            item = {"index": index, "question": question, "status": "failed", "error": str(e)}
+        finally:
+            slots.release()
+        await results.put(item)
+
+    async def produce() -> None:
+        # Le query in batch sono lavoro bulk (ereditato da thread e task delle generazioni)
+        with work_priority(PRIORITY_BULK):
+            await produce_all()
+
+    async def produce_all() -> None:
+        for start in range(0, len(questions), BATCH_SEARCH_SIZE):
+            batch = questions[start : start + BATCH_SEARCH_SIZE]
+            try:
+                found_batch = await asyncio.to_thread(pipeline.search_batch, batch, top_k, filters)
+            except Exception as e:
+                logger.error(f"[QUERY BATCH] Search failed: {str(e)}", exc_info=True)
+                for offset, question in enumerate(batch):
+                    await results.put(
+                        {"index": start + offset, "question": question, "status": "failed", "error": str(e)}
+                    )
+                continue
+            for offset, (question, found) in enumerate(zip(batch, found_batch)):
+                # Aspetta uno slot libero: la ricerca resta al massimo un blocco avanti
+                await slots.acquire()
+                task = asyncio.create_task(answer(start + offset, question, found))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    producer = asyncio.create_task(produce())
+    try:
+        for _ in range(len(questions)):
+            yield await results.get()
+    finally:
+        # Client disconnesso o fine: nessun lavoro resta orfano
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+@router.post("/query/batch")
+async def query_pdf_batch(request: BatchQueryRequest, http_request: Request):
+    """Answer many questions in one request, streaming results as NDJSON (one line per question)."""
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    if len(request.questions) > BATCH_QUERY_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions: maximum is {BATCH_QUERY_MAX_QUESTIONS} per request",
+        )
+
+    # Un batch occupa un solo posto: le sue generazioni sono già limitate da BATCH_QUERY_CONCURRENCY
+    ticket = admit(get_query_admission(), http_request)
+    profile_id = profiling.requested_profile_id(http_request.headers)
+
+    async def lines():
+        async for item in run_query_batch(
+            request.questions, request.top_k, request.search_filters()
+        ):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(
+        _release_after(ticket, lines(), profile_id, "query-batch"),
+        media_type="application/x-ndjson",
+        headers=_profile_headers(profile_id),
+    )
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import FileResponse
+from src.core import metrics, profiling
+from src.core.admission import admission_stats
+from src.core.config import ModelConfig
+from src.core.ingest_control import get_ingest_controller
+from src.core.scheduler import scheduler_stats
+
+router = APIRouter()
+
+# Endpoint di scraping Prometheus, montato senza il prefisso /api
+metrics_router = APIRouter()
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """Concurrency, queue depth and average wait per priority class of each scheduler."""
+    stats = scheduler_stats()
+    stats["admission"] = admission_stats()
+    if ModelConfig.INGEST_ADAPTIVE:
+        stats["ingest_controller"] = get_ingest_controller().stats()
+    return stats
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Download a request profile (folded stacks, for flamegraph.pl or speedscope)."""
+    path = profiling.profile_path(profile_id)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=path.name)
+
+
+def _update_queue_gauges() -> None:
+    """Copia profondità delle code e lavoro in corso negli indicatori Prometheus."""
+    for name, stats in scheduler_stats().items():
+        for priority, cls in stats["classes"].items():
+            metrics.set_queue_depth(name, priority, cls["queued"], cls["running"])
+    for name, stats in admission_stats().items():
+        metrics.set_queue_depth(f"admission_{name}", "all", stats["pending"])
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics: per-stage latency, batch sizes, cache hits, tokens and queue depths."""
+    if not metrics.metrics_available():
+        raise HTTPException(
+            status_code=503, detail="Metrics are disabled: install prometheus-client"
+        )
+    _update_queue_gauges()
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,104 +1,410 @@
 import asyncio
+import hashlib
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import JSONResponse
-import inngest
-import os
+from pydantic import BaseModel
 from dotenv import load_dotenv
+from src.core.admission import Ticket, get_upload_admission
+from src.core import profiling
+from src.core.config import ModelConfig
+from src.core.executor import send_event, send_events, get_status_broker
+from .admission import admit
+from .sse import format_sse, sse_response
 
 load_dotenv()
 
 router = APIRouter()
 
-# Inngest client (singleton)
-_inngest_client = None
+# ============================================================================
+# CONSTANTS - Bulk upload settings
+# ============================================================================
+UPLOADS_DIR = Path("uploads")  # Directory in cui vengono salvati i PDF caricati
+BULK_UPLOAD_MAX_FILES = 10000  # Numero massimo di PDF per richiesta bulk (anche dentro gli archivi)
+COPY_BUFFER_SIZE = 1024 * 1024  # Dimensione dei blocchi copiati su disco (byte)
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+STAGING_SUFFIX = ".part"  # Suffisso dei file temporanei in uploads/ prima del controllo dei duplicati
+
+
+class ImportRequest(BaseModel):
+    directory: str
+    recursive: bool = True
+
+
+class PendingPDF(NamedTuple):
+    """
+    PDF da ingerire: path definitivo, sha256 e, per gli upload, il file
+    temporaneo che diventa path solo se il PDF non è un duplicato.
+    """
+
+    path: Path
+    content_hash: str
+    staged: Optional[Path] = None
+
+
+def save_uploaded_pdf(file: UploadFile, uploads_dir: Path) -> PendingPDF:
+    """Stream the uploaded PDF to a staging file and return it with its final path and sha256."""
+    return _save_stream(file.file, Path(file.filename).name, uploads_dir)
 
 
-def get_inngest_client() -> inngest.Inngest:
-    global _inngest_client
-    if _inngest_client is None:
-        _inngest_client = inngest.Inngest(
-            app_id="rag_app",
-            is_production=False,
-            serializer=inngest.PydanticSerializer(),
-        )
-    return _inngest_client
+def ingest_event_data(
+    pdf_path: Path, content_hash: Optional[str] = None, profile_id: Optional[str] = None
+) -> dict:
+    """Data of the rag/ingest_pdf event for a PDF on disk."""
+    data = {
+        "pdf_path": str(pdf_path.resolve()),
+        "source_id": pdf_path.name,
+        "uploaded_at": time.time(),
+    }
+    if content_hash:
+        data["content_hash"] = content_hash
+    if profile_id:
+        data[profiling.PROFILE_FIELD] = profile_id
+    return data
 
 
-def save_uploaded_pdf(file: UploadFile, uploads_dir: Path) -> Path:
-    """Save uploaded PDF file to disk."""
+async def send_rag_ingest_event(
+    pdf_path: Path, content_hash: Optional[str] = None, profile_id: Optional[str] = None
+) -> str:
+    """Send the PDF ingestion event to the execution backend and return its ID."""
+    return await send_event("rag/ingest_pdf", ingest_event_data(pdf_path, content_hash, profile_id))
+
+
+def _save_stream(stream: BinaryIO, name: str, uploads_dir: Path) -> PendingPDF:
+    """
+    Copia uno stream su disco a blocchi di COPY_BUFFER_SIZE calcolando lo sha256
+    durante la copia: la memoria usata non dipende dalla dimensione del file.
+
+    Il contenuto va in un file temporaneo nella stessa directory: un file già
+    presente con lo stesso nome (magari ancora in ingest) non viene toccato
+    finché _promote_upload non decide che il PDF va ingerito.
+    """
     uploads_dir.mkdir(parents=True, exist_ok=True)
-    file_path = uploads_dir / file.filename
-    with open(file_path, "wb") as f:
-        content = file.file.read()
-        f.write(content)
-    return file_path
-
-
-async def send_rag_ingest_event(pdf_path: Path) -> str:
-    """Send Inngest event for PDF ingestion and return event ID."""
-    client = get_inngest_client()
-    result = await client.send(
-        inngest.Event(
-            name="rag/ingest_pdf",
-            data={
-                "pdf_path": str(pdf_path.resolve()),
-                "source_id": pdf_path.name,
-            },
-        )
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=uploads_dir, prefix=f".{name}.", suffix=STAGING_SUFFIX, delete=False
+    ) as f:
+        try:
+            while chunk := stream.read(COPY_BUFFER_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+        except BaseException:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+    return PendingPDF(uploads_dir / name, digest.hexdigest(), Path(f.name))
+
+
+def _promote_upload(pdf: PendingPDF) -> None:
+    """Sposta (atomicamente) il file temporaneo sul nome definitivo."""
+    if pdf.staged is not None:
+        os.replace(pdf.staged, pdf.path)
+
+
+def _discard_upload(pdf: PendingPDF) -> None:
+    """Cancella il file temporaneo di un upload non ingerito (il file definitivo resta)."""
+    if pdf.staged is not None:
+        pdf.staged.unlink(missing_ok=True)
+
+
+def _discard_uploads(pdfs) -> None:
+    for pdf in pdfs:
+        _discard_upload(pdf)
+
+
+def _file_sha256(path: Path) -> str:
+    """sha256 di un file su disco, letto a blocchi."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def find_ingested_source(content_hash: str) -> Optional[str]:
+    """Source di un PDF con lo stesso contenuto già presente nella collezione."""
+    from src.core.vector_db import QdrantStorage
+
+    return await asyncio.to_thread(lambda: QdrantStorage().find_source_by_hash(content_hash))
+
+
+def _iter_archive_pdfs(file: UploadFile) -> Iterator[Tuple[str, BinaryIO]]:
+    """Restituisce (nome, stream) dei PDF contenuti in un archivio zip o tar, uno alla volta."""
+    filename = file.filename.lower()
+    if filename.endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".pdf"):
+                    with archive.open(info) as stream:
+                        yield info.filename, stream
+    else:
+        # Modalità stream ("r|*"): le entry vengono lette in ordine, senza seek
+        with tarfile.open(fileobj=file.file, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(".pdf"):
+                    stream = archive.extractfile(member)
+                    if stream is not None:
+                        yield member.name, stream
+
+
+def _iter_uploaded_pdfs(files: List[UploadFile]) -> Iterator[Tuple[str, BinaryIO]]:
+    """Restituisce (nome, stream) di ogni PDF caricato, espandendo gli archivi."""
+    for file in files:
+        filename = file.filename.lower()
+        if filename.endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS):
+            yield from _iter_archive_pdfs(file)
+        else:
+            yield file.filename, file.file
+
+
+def _save_uploaded_pdfs(files: List[UploadFile]) -> Tuple[List[PendingPDF], List[dict]]:
+    """Salva su disco i PDF caricati (archivi espansi), in file temporanei: restituisce i PDF e i file saltati."""
+    saved: dict[str, PendingPDF] = {}
+    skipped: List[dict] = []
+    try:
+        for name, stream in _iter_uploaded_pdfs(files):
+            # I percorsi interni agli archivi vengono appiattiti (niente path traversal)
+            safe_name = Path(name).name
+            if not safe_name.lower().endswith(".pdf"):
+                skipped.append({"filename": name, "reason": "Only PDF files are allowed"})
+                continue
+            if safe_name in saved:
+                skipped.append({"filename": name, "reason": "Duplicate file name in this upload"})
+                continue
+            if len(saved) >= BULK_UPLOAD_MAX_FILES:
+                skipped.append({"filename": name, "reason": f"More than {BULK_UPLOAD_MAX_FILES} files"})
+                continue
+            saved[safe_name] = _save_stream(stream, safe_name, UPLOADS_DIR)
+    except BaseException:
+        _discard_uploads(saved.values())
+        raise
+    return list(saved.values()), skipped
+
+
+def _track_ingest_jobs(ticket: Ticket, event_ids: List[str]) -> None:
+    """
+    Tiene in coda i job di una richiesta bulk finché non terminano.
+
+    La richiesta è stata ammessa con un solo posto: i job successivi al primo
+    lo occupano comunque, quindi una richiesta bulk può superare il limite
+    della coda, ma le richieste seguenti vengono rifiutate finché non si svuota.
+    """
+    admission = get_upload_admission()
+    if not event_ids:
+        admission.release(ticket, completed=False)
+        return
+    admission.release_when_finished(ticket, event_ids[0])
+    for event_id in event_ids[1:]:
+        admission.release_when_finished(admission.reserve(ticket.client, force=True), event_id)
+
+
+async def _dispatch_ingest(
+    pdfs: List[PendingPDF],
+    skipped: List[dict],
+    ticket: Ticket,
+) -> JSONResponse:
+    """
+    Salta i PDF già ingeriti (stesso sha256, anche con un altro nome), porta
+    gli altri al nome definitivo, invia i loro eventi di ingest a batch e
+    costruisce la risposta delle rotte bulk.
+    """
+    queued: List[PendingPDF] = []
+    seen_hashes: dict[str, str] = {}
+    try:
+        for pdf in pdfs:
+            duplicate_of = seen_hashes.get(pdf.content_hash) or await find_ingested_source(pdf.content_hash)
+            if duplicate_of is not None:
+                await asyncio.to_thread(_discard_upload, pdf)
+                skipped.append(
+                    {"filename": pdf.path.name, "reason": "Already ingested", "duplicate_of": duplicate_of}
+                )
+                continue
+            seen_hashes[pdf.content_hash] = pdf.path.name
+            await asyncio.to_thread(_promote_upload, pdf)
+            queued.append(pdf)
+    except BaseException:
+        await asyncio.to_thread(_discard_uploads, pdfs)
+        raise
+
+    event_ids = await send_events(
+        "rag/ingest_pdf", [ingest_event_data(pdf.path, pdf.content_hash) for pdf in queued]
+    )
+    _track_ingest_jobs(ticket, [event_id for event_id in event_ids if event_id])
+    return JSONResponse(
+        content={
+            "message": f"{len(queued)} files queued for ingestion",
+            "files": [
+                {"filename": pdf.path.name, "event_id": event_id}
+                for pdf, event_id in zip(queued, event_ids)
+            ],
+            "skipped": skipped,
+        }
     )
-    return result[0] if result else None
 
 
 @router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(http_request: Request, file: UploadFile = File(...)):
     """Upload a PDF file and trigger ingestion."""
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-    uploads_dir = Path("uploads")
+    # Coda piena: 429 prima di scrivere il file su disco
+    admission = get_upload_admission()
+    ticket = admit(admission, http_request)
+
+    uploads_dir = UPLOADS_DIR
+    pdf = None
     try:
-        pdf_path = save_uploaded_pdf(file, uploads_dir)
-        event_id = await send_rag_ingest_event(pdf_path)
-
-        return JSONResponse(
-            content={
-                "message": "File uploaded successfully",
-                "filename": file.filename,
-                "event_id": event_id,
-            }
-        )
+        pdf = await asyncio.to_thread(save_uploaded_pdf, file, uploads_dir)
+
+        # Stesso contenuto già nella collezione: niente re-ingest, il file esistente non cambia
+        duplicate_of = await find_ingested_source(pdf.content_hash)
+        if duplicate_of is not None:
+            await asyncio.to_thread(_discard_upload, pdf)
+            admission.release(ticket, completed=False)
+            return JSONResponse(
+                content={
+                    "message": f"File already ingested as {duplicate_of}",
+                    "filename": file.filename,
+                    "event_id": None,
+                    "duplicate_of": duplicate_of,
+                }
+            )
+
+        profile_id = profiling.requested_profile_id(http_request.headers)
+        await asyncio.to_thread(_promote_upload, pdf)
+        event_id = await send_rag_ingest_event(pdf.path, pdf.content_hash, profile_id)
+        admission.release_when_finished(ticket, event_id)
+
+        content = {
+            "message": "File uploaded successfully",
+            "filename": file.filename,
+            "event_id": event_id,
+        }
+        if profile_id:
+            content["profile_id"] = profile_id
+        return JSONResponse(content=content)
     except Exception as e:
+        if pdf is not None:
+            # Dopo _promote_upload il file temporaneo non esiste più: il file definitivo resta
+            await asyncio.to_thread(_discard_upload, pdf)
+        admission.release(ticket, completed=False)
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
 
+def upload_status_from_runs(event_id: str, runs: list[dict]) -> dict:
+    """Map the runs of an ingest event to the status response."""
+    if runs:
+        run = runs[0]
+        status = run.get("status", "Unknown")
+        return {
+            "event_id": event_id,
+            "status": status,
+            "run": run,
+            # Uso dei provider dell'ingest (presente a run completato)
+            "usage": (run.get("output") or {}).get("usage"),
+        }
+    else:
+        return {
+            "event_id": event_id,
+            "status": "Pending",
+            "run": None,
+            "usage": None,
+        }
+
+
 @router.get("/upload/status/{event_id}")
 async def get_upload_status(event_id: str):
     """Get the status of an upload event."""
-    import requests
+    try:
+        runs = await get_status_broker().get_runs(event_id)
+        return upload_status_from_runs(event_id, runs)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching status: {str(e)}")
+
 
-    inngest_api_base = os.getenv("INNGEST_API_BASE", "http://127.0.0.1:8288/v1")
-    url = f"{inngest_api_base}/events/{event_id}/runs"
+@router.get("/upload/status/{event_id}/events")
+async def stream_upload_status(event_id: str):
+    """Push status changes of an upload as Server-Sent Events until it finishes."""
 
+    async def events():
+        try:
+            async for runs in get_status_broker().subscribe(event_id):
+                yield format_sse("status", upload_status_from_runs(event_id, runs))
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Error fetching status: {str(e)}"})
+
+    return sse_response(events())
+
+
+@router.post("/upload/bulk")
+async def upload_bulk(http_request: Request, files: List[UploadFile] = File(...)):
+    """Upload many PDFs and/or zip/tar archives of PDFs and trigger their ingestion."""
+    admission = get_upload_admission()
+    ticket = admit(admission, http_request)
     try:
-        resp = requests.get(url)
-        resp.raise_for_status()
-        data = resp.json()
-        runs = data.get("data", [])
-
-        if runs:
-            run = runs[0]
-            status = run.get("status", "Unknown")
-            return {
-                "event_id": event_id,
-                "status": status,
-                "run": run,
-            }
-        else:
-            return {
-                "event_id": event_id,
-                "status": "Pending",
-                "run": None,
-            }
+        # Lettura degli archivi e scrittura su disco fuori dall'event loop
+        saved, skipped = await asyncio.to_thread(_save_uploaded_pdfs, files)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        admission.release(ticket, completed=False)
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {str(e)}")
+
+    if not saved:
+        admission.release(ticket, completed=False)
+        raise HTTPException(status_code=400, detail="No PDF files found in the upload")
+
+    try:
+        return await _dispatch_ingest(saved, skipped, ticket)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching status: {str(e)}")
+        admission.release(ticket, completed=False)
+        raise HTTPException(status_code=500, detail=f"Error queuing ingestion: {str(e)}")
+
+
+@router.post("/upload/import")
+async def import_directory(request: ImportRequest, http_request: Request):
+    """Ingest PDFs already on the server, from a directory under UPLOAD_IMPORT_ROOT."""
+    if not ModelConfig.UPLOAD_IMPORT_ROOT:
+        raise HTTPException(status_code=403, detail="Directory import is disabled (set UPLOAD_IMPORT_ROOT)")
+
+    root = Path(ModelConfig.UPLOAD_IMPORT_ROOT).resolve()
+    directory = (root / request.directory).resolve()
+    if not directory.is_relative_to(root):
+        raise HTTPException(status_code=403, detail="Directory is outside UPLOAD_IMPORT_ROOT")
+    if not directory.is_dir():
+        raise HTTPException(status_code=404, detail=f"Directory not found: {request.directory}")
+
+    pattern = "**/*" if request.recursive else "*"
+    pdf_paths: List[Path] = []
+    skipped: List[dict] = []
+    seen: set[str] = set()
+    for path in sorted(directory.glob(pattern)):
+        if not path.is_file() or path.suffix.lower() != ".pdf":
+            continue
+        if path.name in seen:
+            # Il source_id è il nome del file: due file omonimi si sovrascriverebbero
+            skipped.append({"filename": str(path.relative_to(root)), "reason": "Duplicate file name"})
+            continue
+        if len(pdf_paths) >= BULK_UPLOAD_MAX_FILES:
+            skipped.append({"filename": str(path.relative_to(root)), "reason": f"More than {BULK_UPLOAD_MAX_FILES} files"})
+            continue
+        seen.add(path.name)
+        pdf_paths.append(path)
+
+    if not pdf_paths:
+        raise HTTPException(status_code=400, detail="No PDF files found in the directory")
+
+    admission = get_upload_admission()
+    ticket = admit(admission, http_request)
+    try:
+        # I file importati restano dove sono: non vengono mai cancellati
+        pdfs = [PendingPDF(path, await asyncio.to_thread(_file_sha256, path)) for path in pdf_paths]
+        return await _dispatch_ingest(pdfs, skipped, ticket)
+    except Exception as e:
+        admission.release(ticket, completed=False)
+        raise HTTPException(status_code=500, detail=f"Error queuing ingestion: {str(e)}")
@@ -0,0 +1,197 @@
+"""Provider usage accounting: requests, tokens and estimated cost per job, source and provider."""
+
+import contextlib
+import contextvars
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+
+from src.core import metrics
+from src.core.config import ModelConfig
+
+# ============================================================================
+# CONSTANTS - Usage accounting settings
+# ============================================================================
+KIND_EMBEDDING = "embedding"  # Chiamate di embedding (solo token di input)
+KIND_LLM = "llm"  # Generazioni (token di input e di output)
+TOKENS_PER_PRICE_UNIT = 1_000_000  # I prezzi di USAGE_PRICES sono in USD per milione di token
+COST_DECIMALS = 8  # Cifre decimali dei costi stimati nelle risposte
+SOURCE_TABLE_MAX_ENTRIES = 10000  # Source di cui si conserva l'uso dell'ingest (i più vecchi escono)
+
+
+class UsageLedger:
+    """
+    Uso dei provider raccolto durante un job, per (provider, modello, tipo).
+
+    È condiviso dai thread e dai task del job (ricevono il contesto del
+    chiamante), quindi gli aggiornamenti sono protetti da un lock.
+    """
+
+    def __init__(self):
+        self._entries: dict = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        provider: str,
+        model: str,
+        kind: str,
+        input_tokens: Optional[int],
+        output_tokens: Optional[int],
+        requests: int = 1,
+    ) -> None:
+        with self._lock:
+            entry = self._entries.get((provider, model, kind))
+            if entry is None:
+                entry = {
+                    "provider": provider,
+                    "model": model,
+                    "kind": kind,
+                    "requests": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                }
+                self._entries[(provider, model, kind)] = entry
+            entry["requests"] += requests
+            entry["input_tokens"] += input_tokens or 0
+            entry["output_tokens"] += output_tokens or 0
+
+    def extend(self, entries: Iterable[dict]) -> None:
+        """Aggiunge voci già aggregate (es. l'uso restituito da uno step)."""
+        for entry in entries:
+            self.add(
+                entry["provider"],
+                entry["model"],
+                entry["kind"],
+                entry["input_tokens"],
+                entry["output_tokens"],
+                entry["requests"],
+            )
+
+    def entries(self) -> list[dict]:
+        """Voci serializzabili: possono far parte dell'output memoizzato di uno step."""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+
+# Ledger del job in esecuzione (None = chiamate fuori da un job, contate solo nelle metriche)
+_current_ledger: contextvars.ContextVar[Optional[UsageLedger]] = contextvars.ContextVar(
+    "usage_ledger", default=None
+)
+
+
+@contextlib.contextmanager
+def tracking() -> Iterator[UsageLedger]:
+    """
+    Raccoglie nel ledger restituito l'uso dei provider delle chiamate del blocco,
+    comprese quelle eseguite in thread (asyncio.to_thread) e task avviati al suo interno.
+    """
+    ledger = UsageLedger()
+    previous = _current_ledger.get()
+    _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.set(previous)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Costo stimato in USD, None se il modello non ha un prezzo in USAGE_PRICES."""
+    price = ModelConfig.get_usage_price(model)
+    if price is None:
+        return None
+    input_price, output_price = price
+    return (input_tokens * input_price + output_tokens * output_price) / TOKENS_PER_PRICE_UNIT
+
+
+def record(
+    provider: str,
+    model: str,
+    kind: str,
+    input_tokens: Optional[int],
+    output_tokens: Optional[int] = None,
+) -> None:
+    """
+    Registra una chiamata a un provider (token None = non riportati): metriche
+    per provider e modello e ledger del job corrente, se presente.
+    """
+    cost = estimate_cost(model, input_tokens or 0, output_tokens or 0)
+    metrics.record_provider_call(provider, model, kind, cost)
+    if kind == KIND_LLM:
+        metrics.record_tokens(provider, model, input_tokens, output_tokens)
+    else:
+        metrics.record_embedding_tokens(provider, model, input_tokens)
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(provider, model, kind, input_tokens, output_tokens)
+
+
+def merge(*entry_lists: Optional[Iterable[dict]]) -> list[dict]:
+    """Somma le voci di più ledger (es. gli step di un run)."""
+    ledger = UsageLedger()
+    for entries in entry_lists:
+        ledger.extend(entries or [])
+    return ledger.entries()
+
+
+def summarize(entries: Iterable[dict]) -> dict:
+    """
+    Uso per provider (con costo stimato) e totali, come esposto dalle risposte di stato.
+
+    cost_usd dei totali somma solo i modelli con un prezzo; è None se nessuno ne ha.
+    """
+    providers = []
+    costs = []
+    for entry in entries:
+        cost = estimate_cost(entry["model"], entry["input_tokens"], entry["output_tokens"])
+        if cost is not None:
+            costs.append(cost)
+        providers.append({**entry, "cost_usd": _round_cost(cost)})
+    return {
+        "providers": providers,
+        "requests": sum(p["requests"] for p in providers),
+        "input_tokens": sum(p["input_tokens"] for p in providers),
+        "output_tokens": sum(p["output_tokens"] for p in providers),
+        "cost_usd": _round_cost(sum(costs)) if costs else None,
+    }
+
+
+def _round_cost(cost: Optional[float]) -> Optional[float]:
+    return round(cost, COST_DECIMALS) if cost is not None else None
+
+
+class SourceUsageTable:
+    """Uso cumulativo degli ingest di ogni source nel processo, con eviction dei più vecchi."""
+
+    def __init__(self, max_entries: int = SOURCE_TABLE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._sources: "OrderedDict[str, UsageLedger]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, source_id: str, entries: Iterable[dict]) -> None:
+        with self._lock:
+            ledger = self._sources.pop(source_id, None) or UsageLedger()
+            self._sources[source_id] = ledger
+            while len(self._sources) > self.max_entries:
+                self._sources.popitem(last=False)
+        ledger.extend(entries)
+
+    def get(self, source_id: str) -> Optional[dict]:
+        with self._lock:
+            ledger = self._sources.get(source_id)
+        return summarize(ledger.entries()) if ledger is not None else None
+
+    def forget(self, source_id: str) -> None:
+        with self._lock:
+            self._sources.pop(source_id, None)
+
+
+# Uso degli ingest per source (singleton)
+_source_usage: Optional[SourceUsageTable] = None
+
+
+def get_source_usage() -> SourceUsageTable:
+    global _source_usage
+    if _source_usage is None:
+        _source_usage = SourceUsageTable()
+    return _source_usage
@@ -0,0 +1,209 @@
+"""Admission control: bounded pending work per endpoint with per-client fair share."""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from src.core.config import ModelConfig
+from src.core.executor import get_status_broker
+from src.core.status_broker import is_terminal
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Admission settings
+# ============================================================================
+DRAIN_WINDOW = 50  # Completamenti recenti usati per stimare la velocità di smaltimento
+DEFAULT_RETRY_AFTER_SECONDS = 5  # Retry-After quando non ci sono ancora misure
+MAX_RETRY_AFTER_SECONDS = 300  # Retry-After massimo suggerito al client
+ADMISSION_JOB_TTL_SECONDS = 3600  # Un job mai visto terminare libera comunque il suo posto
+ADMISSION_SWEEP_INTERVAL = 1.0  # Intervallo tra due controlli dei job in coda (secondi)
+ADMISSION_SWEEP_BATCH = 20  # Job controllati per ciclo: il costo non cresce con la coda
+
+
+class AdmissionRejected(Exception):
+    """La coda è piena (o il client ha superato la sua quota): riprovare dopo retry_after secondi."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Posto occupato in coda da un client, fino al rilascio."""
+
+    def __init__(self, client: str):
+        self.client = client
+        self.released = False
+        self.created_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Limita il lavoro in attesa di un endpoint a max_pending job.
+
+    Oltre il limite la richiesta viene rifiutata subito (429) con un
+    Retry-After stimato dalla velocità con cui i job terminano. Quando più
+    client competono, ognuno può occupare al massimo una quota equa della coda
+    (max_pending diviso i client attivi), così un client che invia un burst
+    non blocca gli altri. max_pending = 0 disabilita il controllo.
+    """
+
+    def __init__(self, name: str, max_pending: int):
+        self.name = name
+        self.max_pending = max_pending
+        self._pending: Dict[str, int] = {}
+        self._completions: deque = deque(maxlen=DRAIN_WINDOW)
+        self._jobs: "OrderedDict[str, Ticket]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(self._pending.values())
+
+    def retry_after(self, excess: int = 1) -> int:
+        """Secondi stimati prima che si liberino `excess` posti."""
+        if len(self._completions) < 2:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        elapsed = time.monotonic() - self._completions[0]
+        rate = len(self._completions) / elapsed if elapsed > 0 else 0.0
+        if rate <= 0:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(excess / rate)))
+
+    def fair_share(self, client: str) -> int:
+        active = len(self._pending) + (0 if client in self._pending else 1)
+        return max(1, math.ceil(self.max_pending / active))
+
+    def reserve(self, client: str, force: bool = False) -> Ticket:
+        """
+        Occupa un posto per il client o solleva AdmissionRejected.
+
+        force=True occupa il posto senza controlli: serve per i job generati da
+        una richiesta già ammessa (upload in blocco).
+        """
+        if self.max_pending > 0 and not force:
+            pending = self.pending
+            if pending >= self.max_pending:
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"Too many pending {self.name} requests, retry later",
+                    self.retry_after(pending - self.max_pending + 1),
+                )
+            held = self._pending.get(client, 0)
+            if held >= self.fair_share(client):
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"Too many pending {self.name} requests from this client, retry later",
+                    self.retry_after(held - self.fair_share(client) + 1),
+                )
+        self._pending[client] = self._pending.get(client, 0) + 1
+        self.admitted += 1
+        return Ticket(client)
+
+    def release(self, ticket: Ticket, completed: bool = True) -> None:
+        """Libera il posto (idempotente); completed=False se il lavoro non è mai partito."""
+        if ticket.released:
+            return
+        ticket.released = True
+        held = self._pending.get(ticket.client, 0) - 1
+        if held > 0:
+            self._pending[ticket.client] = held
+        else:
+            self._pending.pop(ticket.client, None)
+        if completed:
+            self._completions.append(time.monotonic())
+
+    def release_when_finished(self, ticket: Ticket, event_id: Optional[str]) -> None:
+        """Libera il posto quando il job dell'evento arriva in uno stato terminale."""
+        if not event_id:
+            self.release(ticket, completed=False)
+            return
+        self._jobs[event_id] = ticket
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self) -> None:
+        """
+        Controlla a rotazione i job in coda, ADMISSION_SWEEP_BATCH alla volta.
+
+        Gli stati terminali già letti dai client sono nella cache del broker,
+        quindi la maggior parte dei controlli non tocca il backend.
+        """
+        broker = get_status_broker()
+        while self._jobs:
+            batch: list[Tuple[str, Ticket]] = []
+            for _ in range(min(ADMISSION_SWEEP_BATCH, len(self._jobs))):
+                batch.append(self._jobs.popitem(last=False))
+            for event_id, ticket in batch:
+                try:
+                    finished = is_terminal(await broker.get_runs(event_id))
+                except Exception as e:
+                    logger.warning(f"[ADMISSION] Error checking job {event_id}: {str(e)}")
+                    finished = False
+                expired = time.monotonic() - ticket.created_at > ADMISSION_JOB_TTL_SECONDS
+                if finished or expired:
+                    if expired and not finished:
+                        logger.warning(f"[ADMISSION] Job {event_id} not finished after TTL, releasing its slot")
+                    self.release(ticket)
+                else:
+                    # Ancora in corso: torna in fondo alla rotazione
+                    self._jobs[event_id] = ticket
+            await asyncio.sleep(ADMISSION_SWEEP_INTERVAL)
+
+    def stats(self) -> dict:
+        return {
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "clients": len(self._pending),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "retry_after_seconds": self.retry_after(),
+        }
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+
+# Admission delle query (singleton)
+_query_admission: Optional[AdmissionController] = None
+
+# Admission degli upload (singleton)
+_upload_admission: Optional[AdmissionController] = None
+
+
+def get_query_admission() -> AdmissionController:
+    global _query_admission
+    if _query_admission is None:
+        _query_admission = AdmissionController("query", ModelConfig.QUERY_MAX_PENDING)
+    return _query_admission
+
+
+def get_upload_admission() -> AdmissionController:
+    global _upload_admission
+    if _upload_admission is None:
+        _upload_admission = AdmissionController("upload", ModelConfig.UPLOAD_MAX_PENDING)
+    return _upload_admission
+
+
+def admission_stats() -> dict:
+    return {
+        "query": get_query_admission().stats(),
+        "upload": get_upload_admission().stats(),
+    }
+
+
+async def close_admission() -> None:
+    """Ferma il monitoraggio dei job (chiusura dell'applicazione)."""
+    await get_query_admission().close()
+    await get_upload_admission().close()
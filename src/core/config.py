@@ -14,6 +14,8 @@ class ModelConfig:
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai").lower()
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_LLM_MODEL: str = os.getenv("OLLAMA_LLM_MODEL", "llama3:8b")
+    # Durata di permanenza in memoria dei modelli Ollama (es. "30m", "-1" = sempre)
+    OLLAMA_KEEP_ALIVE: Optional[str] = os.getenv("OLLAMA_KEEP_ALIVE")
 
     # Embedding Provider settings
     EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
@@ -21,6 +23,16 @@ class ModelConfig:
         "OLLAMA_EMBEDDING_MODEL", "embeddinggemma:latest"
     )
 
+    # Qdrant: URL del server oppure ":memory:" (modalità locale in-process, per i benchmark)
+    QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
+    # Indice HNSW e quantizzazione, applicati alla creazione della collezione (0 / vuoto = default
+    # di Qdrant); QDRANT_QUANTIZATION: "scalar" (int8), "binary" o vuoto (nessuna)
+    QDRANT_HNSW_M: int = int(os.getenv("QDRANT_HNSW_M", "0"))
+    QDRANT_HNSW_EF_CONSTRUCT: int = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "0"))
+    QDRANT_QUANTIZATION: str = os.getenv("QDRANT_QUANTIZATION", "").lower()
+    # ef delle ricerche HNSW (0 = default di Qdrant): più alto = recall maggiore, ricerche più lente
+    QDRANT_SEARCH_HNSW_EF: int = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "0"))
+
     # Embedding dimensions (provider-specific)
     EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "3072"))
 
@@ -46,6 +58,85 @@ class ModelConfig:
         "ANTHROPIC_LLM_MODEL", "claude-3-5-sonnet-20241022"
     )
 
+    # LLM client settings
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "240"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    # Chiamate di embedding concorrenti nel processo
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    # Quota massima di slot (embedding e LLM) usabile dal lavoro bulk (ingest, query in batch)
+    SCHEDULER_BULK_SHARE: float = float(os.getenv("SCHEDULER_BULK_SHARE", "0.75"))
+    # Generazioni concorrenti di una singola richiesta /api/query/batch
+    BATCH_QUERY_CONCURRENCY: int = int(
+        os.getenv("BATCH_QUERY_CONCURRENCY", os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    )
+
+    # Prezzi dei modelli per la stima dei costi, in USD per milione di token di input/output
+    # (es. USAGE_PRICES="gpt-4o-mini=0.15/0.6,text-embedding-3-large=0.13"; modelli assenti = costo non stimato)
+    USAGE_PRICES: str = os.getenv("USAGE_PRICES", "")
+
+    # Context assembly settings
+    # Budget di token del contesto nel prompt, con override per modello
+    # (es. CONTEXT_TOKEN_BUDGETS="llama3:8b=2000,gpt-4o-mini=6000")
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_TOKEN_BUDGETS: str = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+
+    # Chunk vicini (±N) aggiunti a ogni hit, recuperati per ID deterministico
+    CONTEXT_NEIGHBORS: int = int(os.getenv("CONTEXT_NEIGHBORS", "0"))
+
+    # Ricerca a due stadi: prima i documenti più vicini, poi i chunk al loro interno
+    SEARCH_ROUTING: bool = os.getenv("SEARCH_ROUTING", "false").lower() in ("1", "true", "yes")
+    ROUTING_TOP_SOURCES: int = int(os.getenv("ROUTING_TOP_SOURCES", "10"))
+
+    # Chunking settings (chunk piccoli + CONTEXT_NEIGHBORS danno contesto ampio)
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+    # Coalescing delle query identiche in corso (single-flight)
+    QUERY_COALESCING: bool = os.getenv("QUERY_COALESCING", "true").lower() in ("1", "true", "yes")
+
+    # Warm-up dei modelli all'avvio dell'applicazione
+    WARMUP_MODELS: bool = os.getenv("WARMUP_MODELS", "false").lower() in ("1", "true", "yes")
+
+    # LLM routing settings (hedging e failover)
+    # Lista separata da virgole di provider da usare dopo LLM_PROVIDER (es. "anthropic,google")
+    LLM_FALLBACK_PROVIDERS: str = os.getenv("LLM_FALLBACK_PROVIDERS", "").lower()
+    LLM_HEDGING: bool = os.getenv("LLM_HEDGING", "true").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2.0"))
+
+    # Directory del server da cui POST /api/upload/import può importare PDF (vuoto = disabilitato)
+    UPLOAD_IMPORT_ROOT: Optional[str] = os.getenv("UPLOAD_IMPORT_ROOT")
+
+    # Ingest: throttle e rate limit delle funzioni Inngest (limite 0 = disabilitato)
+    INGEST_THROTTLE_LIMIT: int = int(os.getenv("INGEST_THROTTLE_LIMIT", "2"))
+    INGEST_THROTTLE_PERIOD_SECONDS: int = int(os.getenv("INGEST_THROTTLE_PERIOD_SECONDS", "60"))
+    INGEST_RATE_LIMIT_LIMIT: int = int(os.getenv("INGEST_RATE_LIMIT_LIMIT", "1"))
+    INGEST_RATE_LIMIT_PERIOD_SECONDS: int = int(os.getenv("INGEST_RATE_LIMIT_PERIOD_SECONDS", "14400"))
+
+    # Ingest: dimensione iniziale dei batch e controllo adattivo (AIMD) di batch e parallelismo
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+    INGEST_ADAPTIVE: bool = os.getenv("INGEST_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+    INGEST_TARGET_BATCH_SECONDS: float = float(os.getenv("INGEST_TARGET_BATCH_SECONDS", "10"))
+
+    # Admission control: job in attesa ammessi per endpoint (0 = illimitato)
+    QUERY_MAX_PENDING: int = int(os.getenv("QUERY_MAX_PENDING", "100"))
+    UPLOAD_MAX_PENDING: int = int(os.getenv("UPLOAD_MAX_PENDING", "50"))
+
+    # Tracing OpenTelemetry: export OTLP degli span (endpoint con OTEL_EXPORTER_OTLP_ENDPOINT)
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+    TRACING_SERVICE_NAME: str = os.getenv("TRACING_SERVICE_NAME", "fastrag")
+
+    # Profiling a campionamento: su richiesta (header X-Profile) o per ogni richiesta
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILING_ALWAYS: bool = os.getenv("PROFILING_ALWAYS", "false").lower() in ("1", "true", "yes")
+    PROFILING_INTERVAL_SECONDS: float = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.01"))
+
+    # Execution backend settings
+    # "inngest" usa il dev server Inngest, "local" esegue le pipeline in-process
+    EXECUTION_BACKEND: str = os.getenv("EXECUTION_BACKEND", "inngest").lower()
+    LOCAL_WORKERS: int = int(os.getenv("LOCAL_WORKERS", "4"))
+    LOCAL_PROCESS_WORKERS: int = int(os.getenv("LOCAL_PROCESS_WORKERS", "2"))
+
     @classmethod
     def get_embedding_dimension(cls) -> int:
         """Get the embedding dimension based on the current provider."""
@@ -61,11 +152,48 @@ class ModelConfig:
         else:
             return cls.EMBEDDING_DIMENSION
 
+    @classmethod
+    def get_llm_model(cls, provider: str = None) -> str:
+        """Get the LLM model name for a provider (default: LLM_PROVIDER)."""
+        provider = provider or cls.LLM_PROVIDER
+        return {
+            "ollama": cls.OLLAMA_LLM_MODEL,
+            "openai": cls.OPENAI_LLM_MODEL,
+            "google": cls.GOOGLE_LLM_MODEL,
+            "anthropic": cls.ANTHROPIC_LLM_MODEL,
+        }.get(provider, "")
+
+    @classmethod
+    def get_context_token_budget(cls, model: str = None) -> int:
+        """Get the prompt context token budget for a model (default: current LLM model)."""
+        model = model or cls.get_llm_model()
+        for entry in cls.CONTEXT_TOKEN_BUDGETS.split(","):
+            name, _, budget = entry.strip().rpartition("=")
+            if name == model and budget:
+                return int(budget)
+        return cls.CONTEXT_TOKEN_BUDGET
+
+    @classmethod
+    def get_usage_price(cls, model: str) -> Optional[tuple[float, float]]:
+        """Get the (input, output) price of a model in USD per million tokens, None if not priced."""
+        for entry in cls.USAGE_PRICES.split(","):
+            name, _, prices = entry.strip().rpartition("=")
+            if name == model and prices:
+                input_price, _, output_price = prices.partition("/")
+                return float(input_price), float(output_price or 0)
+        return None
+
+    @classmethod
+    def get_llm_fallback_providers(cls) -> list[str]:
+        """Get the fallback LLM providers, in routing order."""
+        return [p.strip() for p in cls.LLM_FALLBACK_PROVIDERS.split(",") if p.strip()]
+
     @classmethod
     def validate(cls) -> None:
         """Validate the current configuration."""
         valid_llm_providers = {"ollama", "openai", "google", "anthropic"}
         valid_embedding_providers = {"ollama", "openai", "google"}
+        valid_execution_backends = {"inngest", "local"}
 
         if cls.LLM_PROVIDER not in valid_llm_providers:
             raise ValueError(
@@ -79,6 +207,12 @@ class ModelConfig:
                 f"Must be one of {valid_embedding_providers}"
             )
 
+        if cls.EXECUTION_BACKEND not in valid_execution_backends:
+            raise ValueError(
+                f"Invalid EXECUTION_BACKEND: {cls.EXECUTION_BACKEND}. "
+                f"Must be one of {valid_execution_backends}"
+            )
+
         # Validate API keys for non-Ollama providers
         if cls.LLM_PROVIDER == "openai" and not cls.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is required when LLM_PROVIDER=openai")
@@ -91,6 +225,25 @@ class ModelConfig:
                 "ANTHROPIC_API_KEY is required when LLM_PROVIDER=anthropic"
             )
 
+        for provider in cls.get_llm_fallback_providers():
+            if provider not in valid_llm_providers:
+                raise ValueError(
+                    f"Invalid provider in LLM_FALLBACK_PROVIDERS: {provider}. "
+                    f"Must be one of {valid_llm_providers}"
+                )
+            if provider == cls.LLM_PROVIDER:
+                raise ValueError(
+                    f"LLM_FALLBACK_PROVIDERS must not contain LLM_PROVIDER ({provider})"
+                )
+            if provider == "openai" and not cls.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY is required for fallback provider openai")
+            if provider == "google" and not cls.GOOGLE_API_KEY:
+                raise ValueError("GOOGLE_API_KEY is required for fallback provider google")
+            if provider == "anthropic" and not cls.ANTHROPIC_API_KEY:
+                raise ValueError(
+                    "ANTHROPIC_API_KEY is required for fallback provider anthropic"
+                )
+
         if cls.EMBEDDING_PROVIDER == "openai" and not cls.OPENAI_API_KEY:
             raise ValueError(
                 "OPENAI_API_KEY is required when EMBEDDING_PROVIDER=openai"
@@ -100,3 +253,17 @@ class ModelConfig:
             raise ValueError(
                 "GOOGLE_API_KEY is required when EMBEDDING_PROVIDER=google"
             )
+
+        for entry in cls.USAGE_PRICES.split(","):
+            if not entry.strip():
+                continue
+            name, _, prices = entry.strip().rpartition("=")
+            try:
+                valid = bool(name) and all(float(price) >= 0 for price in prices.split("/", 1))
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ValueError(
+                    f"Invalid USAGE_PRICES entry: {entry.strip()}. "
+                    "Expected model=input_price[/output_price]"
+                )
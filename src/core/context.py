@@ -0,0 +1,183 @@
+"""Context assembly: redundancy pruning, adjacent-chunk merging and token budgeting."""
+
+import math
+from typing import Callable, Optional
+
+import numpy as np
+
+# ============================================================================
+# CONSTANTS - Context assembly settings
+# ============================================================================
+CONTEXT_OVERFETCH_FACTOR = 3  # Candidati recuperati per ogni contesto richiesto (top_k * fattore)
+MMR_LAMBDA = 0.7  # Peso rilevanza vs diversità nella selezione MMR (1.0 = solo rilevanza)
+DUPLICATE_SIMILARITY = 0.95  # Similarità coseno oltre cui un candidato è considerato duplicato
+MAX_OVERLAP_CHARS = 2000  # Lunghezza massima di overlap cercata tra chunk adiacenti (caratteri)
+MIN_OVERLAP_CHARS = 20  # Overlap minimo per considerare due chunk sovrapposti (caratteri)
+CHARS_PER_TOKEN = 4  # Stima dei caratteri per token usata per il budget
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima approssimativa del numero di token di un testo."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    """Vettori normalizzati (norma 1) per riga; i vettori nulli restano nulli."""
+    matrix = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def merge_overlapping(first: str, second: str, max_overlap: int = MAX_OVERLAP_CHARS) -> str:
+    """Concatena due chunk consecutivi rimuovendo il testo in overlap."""
+    tail = first[-max_overlap:]
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return f"{first}\n{second}"
+    # Cerca l'overlap più lungo: la prima occorrenza del probe nella coda di first
+    pos = tail.find(probe)
+    while pos != -1:
+        overlap = len(tail) - pos
+        if second[:overlap] == tail[pos:]:
+            return first + second[overlap:]
+        pos = tail.find(probe, pos + 1)
+    return f"{first}\n{second}"
+
+
+def mmr_select(
+    query_vector: Optional[list[float]],
+    hits: list[dict],
+    k: int,
+    lambda_: float = MMR_LAMBDA,
+) -> list[dict]:
+    """
+    Seleziona fino a k hit con Maximal Marginal Relevance.
+
+    Gli hit senza vettore (o senza vettore della query) vengono selezionati in
+    ordine di score. I quasi-duplicati di un hit già scelto vengono scartati.
+
+    La rilevanza è lo score di Qdrant (coseno con la query) quando presente; le
+    similarità tra i candidati si calcolano una volta sola, come matrice.
+    """
+    if not hits or query_vector is None or any(not h.get("vector") for h in hits):
+        return hits[:k]
+
+    unit = _unit_rows([h["vector"] for h in hits])
+    if all(h.get("score") is not None for h in hits):
+        relevance = np.array([h["score"] for h in hits], dtype=np.float64)
+    else:
+        relevance = unit @ _unit_rows(query_vector)
+    similarity = unit @ unit.T
+
+    # Similarità massima di ogni candidato con gli hit già scelti (0 finché non ce ne sono)
+    redundancy = np.zeros(len(hits), dtype=np.float64)
+    available = np.ones(len(hits), dtype=bool)
+    selected: list[int] = []
+    while len(selected) < k:
+        available &= redundancy < DUPLICATE_SIMILARITY
+        if not available.any():
+            break
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = similarity[best] if len(selected) == 1 else np.maximum(redundancy, similarity[best])
+    return [hits[i] for i in selected]
+
+
+def neighbor_keys(hits: list[dict], neighbors: int) -> list[tuple[str, int]]:
+    """Coppie (source, chunk_index) dei ±neighbors vicini di ogni hit, esclusi quelli già presenti."""
+    present = {(h["source"], h["chunk_index"]) for h in hits if h.get("chunk_index") is not None}
+    keys = []
+    for hit in hits:
+        index = hit.get("chunk_index")
+        if index is None:
+            continue
+        for offset in range(-neighbors, neighbors + 1):
+            key = (hit["source"], index + offset)
+            if key[1] >= 0 and key not in present:
+                present.add(key)
+                keys.append(key)
+    return keys
+
+
+def merge_adjacent(hits: list[dict]) -> list[dict]:
+    """
+    Unisce gli hit consecutivi dello stesso source in un unico passaggio.
+
+    I passaggi mantengono l'ordine del loro hit più rilevante. Gli hit senza
+    chunk_index (ingeriti prima che fosse salvato) restano passaggi singoli.
+    """
+    passages: list[dict] = []
+    by_source: dict[str, list[tuple[int, dict]]] = {}
+    for rank, hit in enumerate(hits):
+        if hit.get("chunk_index") is None:
+            passages.append({"rank": rank, "source": hit["source"], "text": hit["text"]})
+        else:
+            by_source.setdefault(hit["source"], []).append((rank, hit))
+
+    for source, ranked in by_source.items():
+        ranked.sort(key=lambda item: item[1]["chunk_index"])
+        current = None
+        for rank, hit in ranked:
+            if current is not None and hit["chunk_index"] == current["last_index"] + 1:
+                current["text"] = merge_overlapping(current["text"], hit["text"])
+                current["last_index"] = hit["chunk_index"]
+                current["rank"] = min(current["rank"], rank)
+                continue
+            current = {
+                "rank": rank,
+                "source": source,
+                "text": hit["text"],
+                "last_index": hit["chunk_index"],
+            }
+            passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def pack_to_budget(passages: list[dict], token_budget: int) -> list[dict]:
+    """Tiene i passaggi in ordine di rilevanza finché rientrano nel budget di token."""
+    packed = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage["text"])
+        if used + tokens > token_budget:
+            if not packed:
+                # Il passaggio più rilevante viene troncato piuttosto che scartato
+                packed.append(
+                    {**passage, "text": passage["text"][: token_budget * CHARS_PER_TOKEN]}
+                )
+            break
+        packed.append(passage)
+        used += tokens
+    return packed
+
+
+def assemble_context(
+    query_vector: Optional[list[float]],
+    hits: list[dict],
+    top_k: int,
+    token_budget: int,
+    neighbors: int = 0,
+    fetch_chunks: Optional[Callable[[list[tuple[str, int]]], list[dict]]] = None,
+) -> tuple[list[str], list[str]]:
+    """
+    Costruisce i contesti del prompt dagli hit (sovra-recuperati) della ricerca.
+
+    Con neighbors > 0 ogni hit selezionato viene esteso con i ±neighbors chunk
+    vicini dello stesso documento, recuperati con fetch_chunks e uniti all'hit.
+
+    Returns:
+        (contexts, sources): i testi da inserire nel prompt e i source usati
+    """
+    hits = [h for h in hits if h.get("text")]
+    selected = mmr_select(query_vector, hits, top_k)
+    if neighbors > 0 and fetch_chunks is not None:
+        keys = neighbor_keys(selected, neighbors)
+        selected = selected + [h for h in fetch_chunks(keys) if h.get("text")]
+    passages = pack_to_budget(merge_adjacent(selected), token_budget)
+    contexts = [p["text"] for p in passages]
+    sources = list(dict.fromkeys(p["source"] for p in passages))
+    return contexts, sources
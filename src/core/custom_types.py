@@ -4,15 +4,19 @@ import pydantic
 class RAGChunkAndSrc(pydantic.BaseModel):
     chunks: list[str]
     source_id: str = None
+    pages: list[int] = []
+    batch_size: int = 0  # Dimensione dei batch scelta all'inizio dell'ingest (0 = default)
 
 
 class RAGUpsertResult(pydantic.BaseModel):
     ingested: int
+    usage: list[dict] = []  # Uso dei provider dello step (voci di accounting.UsageLedger)
 
 
 class RAGSearchResult(pydantic.BaseModel):
     contexts: list[str]
     sources: list[str]
+    usage: list[dict] = []  # Uso dei provider dello step (voci di accounting.UsageLedger)
 
 
 class RAQQueryResult(pydantic.BaseModel):
@@ -1,43 +1,101 @@
-from llama_index.readers.file import PDFReader
-from llama_index.core.node_parser import SentenceSplitter
+import functools
+import time
+from typing import Callable, ContextManager, Optional
 from src.providers.embedding_providers import get_embedding_provider
+from src.core.config import ModelConfig
+from src.core.scheduler import get_embedding_scheduler
+from src.core import metrics
 
 # ============================================================================
 # CONSTANTS - Text chunking settings
 # ============================================================================
-DEFAULT_CHUNK_SIZE = 1000  # Dimensione massima di ogni chunk di testo (caratteri)
-DEFAULT_CHUNK_OVERLAP = 200  # Numero di caratteri di overlap tra chunk consecutivi
+DEFAULT_CHUNK_SIZE = ModelConfig.CHUNK_SIZE  # Dimensione massima di ogni chunk di testo (configurabile con CHUNK_SIZE)
+DEFAULT_CHUNK_OVERLAP = ModelConfig.CHUNK_OVERLAP  # Overlap tra chunk consecutivi (configurabile con CHUNK_OVERLAP)
 
-splitter = SentenceSplitter(chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP)
+# Splitter creato al primo uso: llama_index si importa solo quando serve il chunking
+_splitter = None
 
-# Get the embedding provider instance
-_embedding_provider = None
 
+def get_splitter():
+    """Get the shared sentence splitter (llama_index is imported on first use)."""
+    global _splitter
+    if _splitter is None:
+        from llama_index.core.node_parser import SentenceSplitter
 
-def _get_embedding_provider():
-    """Lazy initialization of embedding provider."""
-    global _embedding_provider
-    if _embedding_provider is None:
-        _embedding_provider = get_embedding_provider()
-    return _embedding_provider
+        _splitter = SentenceSplitter(chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP)
+    return _splitter
 
 
 def load_and_chunk_pdf(path: str):
-    docs = PDFReader().load_data(file=path)
-    texts = [d.text for d in docs if getattr(d, "text", None)]
-    chunks = []
-    for t in texts:
-        chunks.extend(splitter.split_text(t))
+    chunks, _ = load_and_chunk_pdf_pages(path)
     return chunks
 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Generate embeddings using the configured provider."""
-    provider = _get_embedding_provider()
-    return provider.embed(texts)
+def load_and_chunk_pdf_pages(path: str) -> tuple[list[str], list[int]]:
+    """Divide il PDF in chunk e restituisce anche il numero di pagina (da 1) di ogni chunk."""
+    return _split_pdf_pages(path, metrics.stage_timer)
+
+
+def load_and_chunk_pdf_pages_timed(path: str) -> tuple[list[str], list[int], dict]:
+    """
+    Come load_and_chunk_pdf_pages, per l'esecuzione in un process pool: restituisce
+    anche la durata di parsing e chunking, da registrare nel processo del server
+    con metrics.observe_stages.
+    """
+    durations = {}
+    chunks, pages = _split_pdf_pages(path, functools.partial(metrics.collect_duration, durations))
+    return chunks, pages, durations
+
+
+def _split_pdf_pages(
+    path: str, timer: Callable[[str], ContextManager[None]]
+) -> tuple[list[str], list[int]]:
+    from llama_index.readers.file import PDFReader
+
+    splitter = get_splitter()
+    with timer(metrics.STAGE_PDF_PARSE):
+        docs = PDFReader().load_data(file=path)
+    chunks = []
+    pages = []
+    with timer(metrics.STAGE_CHUNK):
+        for page, d in enumerate(docs, start=1):
+            text = getattr(d, "text", None)
+            if not text:
+                continue
+            page_chunks = splitter.split_text(text)
+            chunks.extend(page_chunks)
+            pages.extend([page] * len(page_chunks))
+    return chunks, pages
+
+
+def embed_texts(
+    texts: list[str],
+    observe: Optional[Callable[[float, Optional[Exception]], None]] = None,
+) -> list[list[float]]:
+    """
+    Generate embeddings using the configured provider.
+
+    Le chiamate passano dallo scheduler di embedding: la classe di priorità è
+    quella del chiamante (vedi scheduler.work_priority). observe riceve la
+    latenza della sola chiamata al provider (attesa in coda esclusa) e l'eventuale errore.
+    """
+    provider = get_embedding_provider()
+    metrics.observe_batch_size(metrics.STAGE_EMBED, len(texts), provider.name, provider.model)
+    with get_embedding_scheduler().slot():
+        started = time.monotonic()
+        try:
+            with metrics.stage_timer(metrics.STAGE_EMBED, provider.name, provider.model):
+                vectors = provider.embed(texts)
+        except Exception as e:
+            if observe is not None:
+                observe(time.monotonic() - started, e)
+            raise
+    if observe is not None:
+        observe(time.monotonic() - started, None)
+    return vectors
 
 
 def get_embedding_dimension() -> int:
     """Get the embedding dimension for the current provider."""
-    provider = _get_embedding_provider()
+    provider = get_embedding_provider()
     return provider.get_dimension()
@@ -0,0 +1,147 @@
+"""Execution backend selection: Inngest events or in-process local jobs."""
+
+import os
+from typing import Optional
+
+import httpx
+import inngest
+
+from src.core import tracing
+from src.core.config import ModelConfig
+from src.core.local_executor import LocalExecutor
+from src.core.status_broker import StatusBroker, is_terminal
+
+# ============================================================================
+# CONSTANTS - Inngest API client settings
+# ============================================================================
+INNGEST_API_TIMEOUT = 10  # Timeout per le richieste all'API REST di Inngest (secondi)
+INNGEST_API_MAX_CONNECTIONS = 20  # Connessioni massime nel pool verso l'API Inngest
+EVENT_SEND_BATCH_SIZE = 100  # Eventi inviati a Inngest con una sola chiamata client.send
+
+# Inngest client (singleton)
+_inngest_client = None
+
+# Local executor (singleton)
+_local_executor: Optional[LocalExecutor] = None
+
+# Async HTTP client for the Inngest REST API (singleton, pooled)
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Status broker (singleton)
+_status_broker: Optional[StatusBroker] = None
+
+
+def get_inngest_client() -> inngest.Inngest:
+    global _inngest_client
+    if _inngest_client is None:
+        _inngest_client = inngest.Inngest(
+            app_id="rag_app",
+            is_production=False,
+            serializer=inngest.PydanticSerializer(),
+        )
+    return _inngest_client
+
+
+def get_local_executor() -> LocalExecutor:
+    global _local_executor
+    if _local_executor is None:
+        _local_executor = LocalExecutor(
+            num_workers=ModelConfig.LOCAL_WORKERS,
+            process_workers=ModelConfig.LOCAL_PROCESS_WORKERS,
+            status_listener=_publish_local_status,
+        )
+    return _local_executor
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=INNGEST_API_TIMEOUT,
+            limits=httpx.Limits(max_connections=INNGEST_API_MAX_CONNECTIONS),
+        )
+    return _http_client
+
+
+def get_status_broker() -> StatusBroker:
+    global _status_broker
+    if _status_broker is None:
+        # I job locali notificano da soli i cambi di stato: il polling serve solo per Inngest
+        _status_broker = StatusBroker(fetch_runs, poll=not is_local_backend())
+    return _status_broker
+
+
+def _publish_local_status(job_id: str, runs: list[dict]) -> None:
+    get_status_broker().publish(job_id, runs)
+
+
+def is_local_backend() -> bool:
+    return ModelConfig.EXECUTION_BACKEND == "local"
+
+
+def _inngest_api_base() -> str:
+    return os.getenv("INNGEST_API_BASE", "http://127.0.0.1:8288/v1")
+
+
+async def send_event(name: str, data: dict) -> Optional[str]:
+    """Invia un evento al backend configurato e restituisce l'event ID."""
+    with tracing.span(f"send {name}"):
+        # Il run dell'evento prosegue la traccia della richiesta
+        data = tracing.with_trace_context(data)
+        if is_local_backend():
+            return await get_local_executor().submit(name, data)
+
+        client = get_inngest_client()
+        result = await client.send(inngest.Event(name=name, data=data))
+        return result[0] if result else None
+
+
+async def send_events(name: str, data_list: list[dict]) -> list[Optional[str]]:
+    """Invia più eventi (a batch di EVENT_SEND_BATCH_SIZE) e restituisce gli event ID in ordine."""
+    with tracing.span(f"send {name}", {"events": len(data_list)}):
+        data_list = [tracing.with_trace_context(data) for data in data_list]
+        if is_local_backend():
+            executor = get_local_executor()
+            return [await executor.submit(name, data) for data in data_list]
+
+        client = get_inngest_client()
+        event_ids: list[Optional[str]] = []
+        for start in range(0, len(data_list), EVENT_SEND_BATCH_SIZE):
+            batch = data_list[start : start + EVENT_SEND_BATCH_SIZE]
+            result = await client.send([inngest.Event(name=name, data=data) for data in batch])
+            event_ids.extend(result)
+        return event_ids
+
+
+async def fetch_runs(event_id: str) -> list[dict]:
+    """Fetch runs for an event from the configured backend."""
+    if is_local_backend():
+        return get_local_executor().get_runs(event_id)
+
+    url = f"{_inngest_api_base()}/events/{event_id}/runs"
+    resp = await get_http_client().get(url)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("data", [])
+
+
+async def is_event_finished(event_id: str) -> bool:
+    """True se il run dell'evento è in uno stato terminale."""
+    return is_terminal(await get_status_broker().get_runs(event_id))
+
+
+async def start_executor() -> None:
+    """Avvia il backend di esecuzione configurato."""
+    if is_local_backend():
+        await get_local_executor().start()
+
+
+async def stop_executor() -> None:
+    """Ferma il backend di esecuzione e rilascia le risorse condivise."""
+    global _http_client
+    await get_status_broker().close()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if is_local_backend():
+        await get_local_executor().stop()
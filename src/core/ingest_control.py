@@ -0,0 +1,163 @@
+"""AIMD controller for ingest parallelism and batch size."""
+
+import contextlib
+import logging
+import threading
+import time
+from typing import ContextManager, Iterator, Optional
+
+from src.core.config import ModelConfig
+from src.core.scheduler import PRIORITY_BULK, get_embedding_scheduler
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - AIMD settings
+# ============================================================================
+BATCH_SIZE_MIN = 8  # Chunk minimi per batch embed-and-upsert
+BATCH_SIZE_MAX = 256  # Chunk massimi per batch embed-and-upsert
+BATCH_SIZE_STEP = 8  # Incremento additivo del batch dopo un batch veloce
+DECREASE_FACTOR = 0.5  # Riduzione moltiplicativa dopo un errore o un 429
+SLOW_DECREASE_FACTOR = 0.75  # Riduzione del batch quando la latenza supera il target
+DECREASE_COOLDOWN_SECONDS = 5.0  # Una sola riduzione per finestra (errori simultanei = un evento)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True se l'errore è un 429 (OpenAI, requests/httpx o messaggio del provider)."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return status == 429 or "429" in str(error)
+
+
+class ConcurrencyLimit:
+    """Limite di chiamate concorrenti modificabile a runtime (anche da un altro thread)."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.running = 0
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit: int) -> None:
+        with self._condition:
+            self.limit = max(1, limit)
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Attende uno slot bloccando il thread corrente."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.running < self.limit)
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running -= 1
+                self._condition.notify()
+
+
+class AIMDController:
+    """
+    Regola parallelismo e dimensione dei batch di ingest dalle misure reali.
+
+    - batch sotto la latenza target: aumento additivo (batch + BATCH_SIZE_STEP,
+      parallelismo + 1 ogni `parallelism` batch riusciti)
+    - batch oltre la latenza target: il batch si riduce
+    - errore o 429: batch e parallelismo si dimezzano
+
+    Il parallelismo è un limite proprio dei batch di ingest (slot()), valido
+    per entrambi i backend di esecuzione: le query in batch, che usano la
+    stessa classe bulk dello scheduler di embedding, non ne risentono.
+    """
+
+    def __init__(
+        self,
+        initial_batch_size: int,
+        max_parallelism: int,
+        target_latency: float,
+    ):
+        self._lock = threading.Lock()
+        self.batch_size = min(max(initial_batch_size, BATCH_SIZE_MIN), BATCH_SIZE_MAX)
+        self.max_parallelism = max(1, max_parallelism)
+        self.parallelism = self.max_parallelism
+        self._slots = ConcurrencyLimit(self.parallelism)
+        self.target_latency = target_latency
+        self._successes = 0
+        self._last_decrease = 0.0
+        self.batches = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def slot(self) -> ContextManager[None]:
+        """Slot di un batch di ingest: al massimo `parallelism` embedding in corso."""
+        return self._slots.slot()
+
+    def _apply_parallelism(self) -> None:
+        self._slots.set_limit(self.parallelism)
+
+    def _decrease(self, batch_factor: float, parallelism: bool) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        self.batch_size = max(BATCH_SIZE_MIN, int(self.batch_size * batch_factor))
+        if parallelism:
+            self.parallelism = max(1, int(self.parallelism * DECREASE_FACTOR))
+            self._apply_parallelism()
+        logger.info(
+            f"[INGEST AIMD] Backing off: batch_size={self.batch_size}, parallelism={self.parallelism}"
+        )
+
+    def record(self, batch_size: int, latency: float, error: Optional[Exception] = None) -> None:
+        """Registra l'esito di un batch di embedding."""
+        with self._lock:
+            self.batches += 1
+            if error is not None:
+                self.errors += 1
+                if is_rate_limited(error):
+                    self.rate_limited += 1
+                self._decrease(DECREASE_FACTOR, parallelism=True)
+                return
+            if latency > self.target_latency:
+                self._decrease(SLOW_DECREASE_FACTOR, parallelism=False)
+                return
+            # Si cresce solo se il batch era pieno: un batch corto non dice nulla sul limite
+            if batch_size >= self.batch_size:
+                self.batch_size = min(BATCH_SIZE_MAX, self.batch_size + BATCH_SIZE_STEP)
+            self._successes += 1
+            if self._successes >= self.parallelism and self.parallelism < self.max_parallelism:
+                self._successes = 0
+                self.parallelism += 1
+                self._apply_parallelism()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "parallelism": self.parallelism,
+                "running": self._slots.running,
+                "max_parallelism": self.max_parallelism,
+                "target_latency_seconds": self.target_latency,
+                "batches": self.batches,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+            }
+
+
+# Controller dell'ingest (singleton)
+_ingest_controller: Optional[AIMDController] = None
+
+
+def get_ingest_controller() -> AIMDController:
+    global _ingest_controller
+    if _ingest_controller is None:
+        _ingest_controller = AIMDController(
+            initial_batch_size=ModelConfig.INGEST_BATCH_SIZE,
+            max_parallelism=get_embedding_scheduler().limits[PRIORITY_BULK],
+            target_latency=ModelConfig.INGEST_TARGET_BATCH_SECONDS,
+        )
+    return _ingest_controller
@@ -0,0 +1,71 @@
+"""Application lifecycle: execution backend, provider singletons and model warm-up."""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI
+
+from src.core import tracing
+from src.core.admission import close_admission
+from src.core.config import ModelConfig
+from src.core.executor import start_executor, stop_executor
+from src.providers.embedding_providers import get_embedding_provider
+from src.providers.llm_providers import get_llm_provider, close_http_client
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+
+async def warmup_models() -> None:
+    """Carica in memoria i modelli LLM e di embedding prima della prima query."""
+    results = await asyncio.gather(
+        get_llm_provider().warmup(),
+        asyncio.to_thread(get_embedding_provider().warmup),
+        return_exceptions=True,
+    )
+    for name, result in zip(("LLM", "embedding"), results):
+        if isinstance(result, Exception):
+            # Un warm-up fallito non deve impedire l'avvio dell'applicazione
+            logger.warning(f"[STARTUP] Warm-up of {name} model failed: {str(result)}")
+        else:
+            logger.info(f"[STARTUP] {name} model warmed up")
+
+
+async def backfill_source_vectors() -> None:
+    """Crea i vettori riassuntivi dei documenti ingeriti prima del routing, poi abilita il routing."""
+    from src.core.vector_db import QdrantStorage
+
+    try:
+        created = await asyncio.to_thread(lambda: QdrantStorage().backfill_source_vectors())
+    except Exception as e:
+        # Senza backfill la ricerca resta piatta: corretta, solo senza routing
+        logger.warning(f"[STARTUP] Source vector backfill failed, routing disabled: {str(e)}")
+        return
+    logger.info(f"[STARTUP] Source vector backfill done ({created} created), routing enabled")
+
+
+# Backfill in corso (riferimento tenuto per non perdere il task)
+_backfill_task: Optional[asyncio.Task] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvia e ferma backend di esecuzione e provider insieme all'applicazione."""
+    global _backfill_task
+    # Crea subito i provider singleton, così la prima richiesta non paga il setup
+    tracing.setup_tracing()
+    get_llm_provider()
+    get_embedding_provider()
+    await start_executor()
+    if ModelConfig.SEARCH_ROUTING:
+        # In background: le ricerche nel frattempo restano piatte
+        _backfill_task = asyncio.create_task(backfill_source_vectors())
+    if ModelConfig.WARMUP_MODELS:
+        await warmup_models()
+    yield
+    await close_admission()
+    await stop_executor()
+    await close_http_client()
+    tracing.shutdown_tracing()
@@ -0,0 +1,239 @@
+"""In-process execution backend: asyncio job queue plus a process pool."""
+
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.core import accounting, metrics, pipeline, profiling, tracing
+from src.core.data_loader import load_and_chunk_pdf_pages_timed
+from src.providers.llm_providers import get_llm_provider
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Local execution settings
+# ============================================================================
+JOB_TABLE_MAX_ENTRIES = 10000  # Numero massimo di job conservati nella tabella locale
+LOCAL_BATCH_CONCURRENCY = 4  # Batch embed-and-upsert eseguiti in parallelo per documento
+
+# Stati dei run, allineati a quelli restituiti dall'API REST di Inngest
+STATUS_RUNNING = "Running"
+STATUS_COMPLETED = "Completed"
+STATUS_FAILED = "Failed"
+
+# Chiamata a ogni cambio di stato di un run locale con (job_id, runs)
+StatusListener = Callable[[str, list[dict]], None]
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class JobTable:
+    """Tabella in memoria dei job locali, con eviction dei job più vecchi."""
+
+    def __init__(
+        self,
+        max_entries: int = JOB_TABLE_MAX_ENTRIES,
+        listener: Optional[StatusListener] = None,
+    ):
+        self.max_entries = max_entries
+        self.listener = listener
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def create(self, name: str, data: dict) -> str:
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "event_id": job_id,
+            "event_name": name,
+            "data": data,
+            "run": None,
+        }
+        while len(self._jobs) > self.max_entries:
+            self._jobs.popitem(last=False)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    def set_run(self, job_id: str, **fields) -> None:
+        """
+        Aggiorna lo stato del run associato al job (se ancora presente) e lo
+        notifica al listener, così i client non attendono un ciclo di polling.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        if job["run"] is None:
+            job["run"] = {"run_id": job_id, "run_started_at": _now()}
+        job["run"].update(fields)
+        if self.listener is not None:
+            self.listener(job_id, self.runs(job_id))
+
+    def runs(self, job_id: str) -> list[dict]:
+        """Restituisce i run del job nello stesso formato dell'API Inngest."""
+        job = self._jobs.get(job_id)
+        if job is None or job["run"] is None:
+            return []
+        return [dict(job["run"])]
+
+
+class LocalExecutor:
+    """
+    Esegue le pipeline di ingest e query nello stesso processo dell'API.
+
+    I job vengono accodati su una asyncio.Queue e consumati da un numero fisso
+    di worker. Il parsing dei PDF (CPU-bound) gira in un process pool, mentre
+    embedding, Qdrant e LLM (I/O-bound) restano sull'event loop o in thread.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        process_workers: int = 2,
+        status_listener: Optional[StatusListener] = None,
+    ):
+        self.num_workers = num_workers
+        self.process_workers = process_workers
+        self.jobs = JobTable(listener=status_listener)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._handlers: Dict[str, Callable[[dict], Awaitable[dict]]] = {
+            "rag/ingest_pdf": self._run_ingest,
+            "rag/query_pdf_ai": self._run_query,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        # spawn: il fork di un server con più thread (event loop, pool di thread,
+        # client HTTP) può lasciare lock acquisiti nei processi figli
+        self._process_pool = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"local-executor-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"[LOCAL] Executor started with {self.num_workers} workers")
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        logger.info("[LOCAL] Executor stopped")
+
+    async def submit(self, name: str, data: dict) -> str:
+        """Accoda un job e restituisce il suo ID (usato come event_id)."""
+        if name not in self._handlers:
+            raise ValueError(f"Unsupported event for local execution: {name}")
+        if not self.running:
+            await self.start()
+        job_id = self.jobs.create(name, data)
+        await self._queue.put(job_id)
+        return job_id
+
+    def get_runs(self, job_id: str) -> list[dict]:
+        return self.jobs.runs(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                self.jobs.set_run(job_id, status=STATUS_RUNNING)
+                name, data = job["event_name"], job["data"]
+                try:
+                    with (
+                        tracing.span(f"run {name}", {"job_id": job_id}, parent=data),
+                        profiling.session(data.get(profiling.PROFILE_FIELD), name),
+                    ):
+                        output = await self._handlers[name](data)
+                    self.jobs.set_run(
+                        job_id, status=STATUS_COMPLETED, output=output, ended_at=_now()
+                    )
+                except Exception as e:
+                    logger.error(f"[LOCAL] Job {job_id} failed: {str(e)}", exc_info=True)
+                    self.jobs.set_run(
+                        job_id, status=STATUS_FAILED, error=str(e), ended_at=_now()
+                    )
+            finally:
+                self._queue.task_done()
+
+    async def _run_ingest(self, data: dict) -> dict:
+        pdf_path = data["pdf_path"]
+        source_id = data.get("source_id", pdf_path)
+        metadata = pipeline.document_metadata(data)
+
+        loop = asyncio.get_running_loop()
+        chunks, pages, durations = await loop.run_in_executor(
+            self._process_pool, load_and_chunk_pdf_pages_timed, pdf_path
+        )
+        # Le metriche del processo figlio non arrivano qui: le durate si registrano nel server
+        metrics.observe_stages(durations)
+
+        semaphore = asyncio.Semaphore(LOCAL_BATCH_CONCURRENCY)
+
+        async def _upsert(start: int, batch: list[str]):
+            async with semaphore:
+                return await asyncio.to_thread(
+                    pipeline.upsert_batch,
+                    source_id,
+                    start,
+                    batch,
+                    pages[start : start + len(batch)],
+                    metadata,
+                )
+
+        batch_results = await asyncio.gather(
+            *(
+                _upsert(start, batch)
+                for start, batch in pipeline.split_batches(chunks, pipeline.ingest_batch_size())
+            )
+        )
+        ingested = await asyncio.to_thread(
+            pipeline.reconcile,
+            source_id,
+            len(chunks),
+            sum(r.ingested for r in batch_results),
+        )
+        usage = accounting.merge(*(r.usage for r in batch_results))
+        accounting.get_source_usage().add(source_id, usage)
+        return {**ingested.model_dump(), "usage": accounting.summarize(usage)}
+
+    async def _run_query(self, data: dict) -> dict:
+        question = data["question"]
+        top_k = int(data.get("top_k", pipeline.DEFAULT_TOP_K))
+
+        found = await asyncio.to_thread(pipeline.search, question, top_k, data.get("filters"))
+        with accounting.tracking() as llm_usage:
+            answer = await get_llm_provider().generate(
+                messages=pipeline.build_query_messages(question, found.contexts),
+                max_tokens=pipeline.DEFAULT_MAX_TOKENS,
+                temperature=pipeline.DEFAULT_TEMPERATURE,
+            )
+        return {
+            "answer": answer,
+            "sources": found.sources,
+            "num_contexts": len(found.contexts),
+            "usage": accounting.summarize(accounting.merge(found.usage, llm_usage.entries())),
+        }
@@ -0,0 +1,204 @@
+"""Prometheus metrics: per-stage latency, batch sizes, cache hits, LLM tokens and queue depths."""
+
+import contextlib
+import time
+from typing import Iterator, Optional, Tuple
+
+from src.core import tracing
+
+try:
+    import prometheus_client
+except ImportError:  # Dipendenza opzionale: senza, le metriche sono no-op
+    prometheus_client = None
+
+# ============================================================================
+# CONSTANTS - Metrics settings
+# ============================================================================
+METRICS_NAMESPACE = "fastrag"  # Prefisso di tutte le metriche esportate
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # Secondi
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)  # Elementi per batch
+
+# Stage della pipeline misurati (label "stage")
+STAGE_PDF_PARSE = "pdf_parse"
+STAGE_CHUNK = "chunk"
+STAGE_EMBED = "embed"
+STAGE_QDRANT_UPSERT = "qdrant_upsert"
+STAGE_QDRANT_SEARCH = "qdrant_search"
+STAGE_QDRANT_RETRIEVE = "qdrant_retrieve"
+STAGE_CONTEXT_ASSEMBLY = "context_assembly"
+STAGE_LLM_GENERATE = "llm_generate"
+
+QDRANT_PROVIDER = "qdrant"  # Label provider degli stage Qdrant
+
+
+class _NoopMetric:
+    """Sostituto delle metriche quando prometheus_client non è installato."""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, value: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+def _histogram(name: str, doc: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Histogram(
+        name, doc, labels, namespace=METRICS_NAMESPACE, buckets=buckets
+    )
+
+
+def _counter(name: str, doc: str, labels: Tuple[str, ...]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, doc, labels, namespace=METRICS_NAMESPACE)
+
+
+def _gauge(name: str, doc: str, labels: Tuple[str, ...]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Gauge(name, doc, labels, namespace=METRICS_NAMESPACE)
+
+
+STAGE_DURATION = _histogram(
+    "stage_duration_seconds",
+    "Latency of each pipeline stage",
+    ("stage", "provider", "model"),
+    LATENCY_BUCKETS,
+)
+STAGE_ERRORS = _counter(
+    "stage_errors_total",
+    "Failed calls of each pipeline stage",
+    ("stage", "provider", "model"),
+)
+BATCH_SIZE = _histogram(
+    "batch_size",
+    "Items per batch sent to a provider or to Qdrant",
+    ("stage", "provider", "model"),
+    BATCH_SIZE_BUCKETS,
+)
+CACHE_REQUESTS = _counter(
+    "cache_requests_total",
+    "Cache lookups by result (hit or miss)",
+    ("cache", "result"),
+)
+LLM_TOKENS = _counter(
+    "llm_tokens_total",
+    "LLM tokens by direction (input or output)",
+    ("provider", "model", "direction"),
+)
+EMBEDDING_TOKENS = _counter(
+    "embedding_tokens_total",
+    "Embedding input tokens reported by the provider",
+    ("provider", "model"),
+)
+PROVIDER_REQUESTS = _counter(
+    "provider_requests_total",
+    "Provider API calls by kind (llm or embedding)",
+    ("provider", "model", "kind"),
+)
+PROVIDER_COST = _counter(
+    "provider_cost_usd_total",
+    "Estimated provider cost in USD (only models priced in USAGE_PRICES)",
+    ("provider", "model", "kind"),
+)
+QUEUE_DEPTH = _gauge(
+    "queue_depth",
+    "Waiting work per queue and priority class",
+    ("queue", "priority"),
+)
+QUEUE_RUNNING = _gauge(
+    "queue_running",
+    "Work in progress per queue and priority class",
+    ("queue", "priority"),
+)
+
+
+def metrics_available() -> bool:
+    return prometheus_client is not None
+
+
+def observe_stage(stage: str, seconds: float, provider: str = "", model: str = "") -> None:
+    STAGE_DURATION.labels(stage, provider, model).observe(seconds)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, provider: str = "", model: str = "") -> Iterator[None]:
+    """Misura la durata del blocco (anche se fallisce), conta gli errori e lo traccia in uno span."""
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage, {"provider": provider, "model": model}):
+            yield
+    except Exception:
+        STAGE_ERRORS.labels(stage, provider, model).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, provider, model)
+
+
+@contextlib.contextmanager
+def collect_duration(durations: dict, stage: str) -> Iterator[None]:
+    """
+    Salva in durations la durata del blocco, per il codice che gira in un processo
+    figlio (le sue metriche non arrivano al server): il padre la registra con observe_stages.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        durations[stage] = time.perf_counter() - started
+
+
+def observe_stages(durations: dict, provider: str = "", model: str = "") -> None:
+    """Registra le durate (stage -> secondi) raccolte con collect_duration."""
+    for stage, seconds in durations.items():
+        observe_stage(stage, seconds, provider, model)
+
+
+def observe_batch_size(stage: str, size: int, provider: str = "", model: str = "") -> None:
+    BATCH_SIZE.labels(stage, provider, model).observe(size)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_tokens(
+    provider: str, model: str, input_tokens: Optional[int], output_tokens: Optional[int]
+) -> None:
+    """Conta i token di una generazione (None = non riportati dal provider)."""
+    if input_tokens:
+        LLM_TOKENS.labels(provider, model, "input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels(provider, model, "output").inc(output_tokens)
+
+
+def record_embedding_tokens(provider: str, model: str, input_tokens: Optional[int]) -> None:
+    """Conta i token di una chiamata di embedding (None = non riportati dal provider)."""
+    if input_tokens:
+        EMBEDDING_TOKENS.labels(provider, model).inc(input_tokens)
+
+
+def record_provider_call(provider: str, model: str, kind: str, cost_usd: Optional[float]) -> None:
+    """Conta una chiamata a un provider e il suo costo stimato (None = modello senza prezzo)."""
+    PROVIDER_REQUESTS.labels(provider, model, kind).inc()
+    if cost_usd:
+        PROVIDER_COST.labels(provider, model, kind).inc(cost_usd)
+
+
+def set_queue_depth(queue: str, priority: str, queued: int, running: Optional[int] = None) -> None:
+    QUEUE_DEPTH.labels(queue, priority).set(queued)
+    if running is not None:
+        QUEUE_RUNNING.labels(queue, priority).set(running)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Testo di esposizione del registry di default e relativo content type."""
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
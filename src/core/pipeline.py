@@ -0,0 +1,226 @@
+"""Ingest and query pipeline steps shared by every execution backend."""
+
+import contextlib
+import functools
+
+from src.core.config import ModelConfig
+from src.core import accounting, metrics
+from src.core.context import assemble_context, CONTEXT_OVERFETCH_FACTOR
+from src.core.data_loader import load_and_chunk_pdf_pages, embed_texts
+from src.core.scheduler import work_priority, PRIORITY_BULK
+from src.core.ingest_control import get_ingest_controller
+from src.core.custom_types import (
+    RAGSearchResult,
+    RAGUpsertResult,
+    RAGChunkAndSrc,
+)
+
+# ============================================================================
+# CONSTANTS - LLM generation settings
+# ============================================================================
+DEFAULT_MAX_TOKENS = 1024  # Numero massimo di token da generare per risposta LLM
+DEFAULT_TEMPERATURE = (
+    0.2  # Temperatura per generazione LLM (0.0-1.0, più bassa = più deterministica)
+)
+DEFAULT_TOP_K = 5  # Numero di chunk da recuperare per default nelle query
+
+# ============================================================================
+# CONSTANTS - Ingest batching settings
+# ============================================================================
+INGEST_BATCH_SIZE = ModelConfig.INGEST_BATCH_SIZE  # Chunk per ogni step embed-and-upsert (checkpoint indipendente)
+DOCUMENT_METADATA_FIELDS = ("uploaded_at", "content_hash")  # Dati dell'evento copiati nel payload di ogni chunk
+
+SYSTEM_PROMPT = "You answer questions using only the provided context."
+
+
+def load_chunks(pdf_path: str, source_id: str = None) -> RAGChunkAndSrc:
+    """
+    Carica il PDF e lo divide in chunk (con il numero di pagina di ciascuno).
+
+    Fissa anche la dimensione dei batch dell'ingest: essendo parte dell'output
+    memoizzato dello step, la divisione in batch resta identica nei replay.
+    """
+    chunks, pages = load_and_chunk_pdf_pages(pdf_path)
+    return RAGChunkAndSrc(
+        chunks=chunks,
+        source_id=source_id or pdf_path,
+        pages=pages,
+        batch_size=ingest_batch_size(),
+    )
+
+
+def ingest_batch_size() -> int:
+    """Dimensione dei batch per un nuovo ingest: quella del controller AIMD se attivo."""
+    if ModelConfig.INGEST_ADAPTIVE:
+        return get_ingest_controller().batch_size
+    return INGEST_BATCH_SIZE
+
+
+def document_metadata(event_data: dict) -> dict:
+    """Metadati del documento (data di caricamento, hash del contenuto) presenti nell'evento di ingest."""
+    return {k: event_data[k] for k in DOCUMENT_METADATA_FIELDS if event_data.get(k) is not None}
+
+
+def split_batches(chunks: list[str], batch_size: int = INGEST_BATCH_SIZE) -> list[tuple[int, list[str]]]:
+    """Divide i chunk in batch (indice del primo chunk, chunk del batch)."""
+    return [
+        (start, chunks[start : start + batch_size])
+        for start in range(0, len(chunks), batch_size)
+    ]
+
+
+def upsert_batch(
+    source_id: str,
+    start: int,
+    chunks: list[str],
+    pages: list[int] = None,
+    metadata: dict = None,
+) -> RAGUpsertResult:
+    """
+    Genera gli embedding di un batch di chunk e li inserisce in Qdrant.
+
+    pages (pagina di ogni chunk) e metadata (document_metadata dell'evento)
+    finiscono nel payload: permettono le ricerche filtrate per pagina e data
+    di caricamento e il riconoscimento dei PDF già ingeriti.
+    """
+    observe = None
+    slot = contextlib.nullcontext()
+    if ModelConfig.INGEST_ADAPTIVE:
+        controller = get_ingest_controller()
+        slot = controller.slot()
+
+        def observe(latency: float, error) -> None:
+            controller.record(len(chunks), latency, error)
+
+    # L'ingest è lavoro bulk: le query interattive gli passano davanti
+    with slot, work_priority(PRIORITY_BULK), accounting.tracking() as ledger:
+        vecs = embed_texts(chunks, observe=observe)
+    from src.core.vector_db import QdrantStorage, make_chunk_id
+
+    ids = [make_chunk_id(source_id, start + i) for i in range(len(chunks))]
+    payloads = [
+        {"source": source_id, "text": chunks[i], "chunk_index": start + i}
+        for i in range(len(chunks))
+    ]
+    for i, payload in enumerate(payloads):
+        if pages:
+            payload["page"] = pages[i]
+        payload.update(metadata or {})
+    QdrantStorage().upsert(ids, vecs, payloads)
+    return RAGUpsertResult(ingested=len(chunks), usage=ledger.entries())
+
+
+def reconcile(source_id: str, expected: int, ingested: int) -> RAGUpsertResult:
+    """
+    Rimuove i chunk di una versione precedente (più lunga) dello stesso source,
+    verifica che tutti i batch abbiano scritto i propri punti e aggiorna il
+    vettore riassuntivo del source usato dal routing della ricerca.
+    """
+    from src.core.vector_db import QdrantStorage
+
+    store = QdrantStorage()
+    store.delete_stale_chunks(source_id, expected)
+    stored = store.count_by_source(source_id)
+    if stored != expected:
+        raise RuntimeError(
+            f"Reconcile failed for {source_id}: expected {expected} chunks, found {stored}"
+        )
+    store.update_source_vector(source_id)
+    return RAGUpsertResult(ingested=ingested)
+
+
+def search(question: str, top_k: int = DEFAULT_TOP_K, filters: dict = None) -> RAGSearchResult:
+    """
+    Genera l'embedding della domanda e recupera i contesti per il prompt.
+
+    filters accetta source_ids, uploaded_after/uploaded_before (timestamp Unix)
+    e page_from/page_to, applicati come filtri indicizzati di Qdrant.
+
+    Senza source_ids espliciti e con SEARCH_ROUTING la ricerca sceglie prima i
+    ROUTING_TOP_SOURCES documenti più vicini alla domanda (tra quelli che
+    rispettano il filtro per data; con un filtro per pagina niente routing) e
+    cerca i chunk solo al loro interno. Recupera top_k * CONTEXT_OVERFETCH_FACTOR candidati, scarta
+    i duplicati (MMR), aggiunge i chunk vicini (CONTEXT_NEIGHBORS), unisce i
+    chunk adiacenti e tiene i passaggi entro il budget di token.
+
+    Il risultato riporta anche l'uso dei provider (embedding della domanda).
+    """
+    with accounting.tracking() as ledger:
+        found = search_batch([question], top_k, filters)[0]
+    return found.model_copy(update={"usage": ledger.entries()})
+
+
+def search_batch(
+    questions: list[str], top_k: int = DEFAULT_TOP_K, filters: dict = None
+) -> list[RAGSearchResult]:
+    """
+    Come search, per più domande: un solo batch di embedding e una sola
+    query_batch_points su Qdrant per tutte le domande.
+    """
+    from src.core.vector_db import QdrantStorage
+
+    query_vecs = embed_texts(questions)
+    store = QdrantStorage()
+    filters = dict(filters or {})
+    source_ids = filters.pop("source_ids", None)
+    # Il filtro per pagina riguarda i singoli chunk, non il vettore riassuntivo:
+    # il routing potrebbe scegliere documenti senza chunk nelle pagine richieste
+    page_filtered = filters.get("page_from") is not None or filters.get("page_to") is not None
+    # Finché il backfill dei vettori riassuntivi non è completato la ricerca resta piatta:
+    # il routing non vedrebbe i documenti ingeriti prima della sua introduzione
+    if not source_ids and ModelConfig.SEARCH_ROUTING and not page_filtered and store.routing_ready():
+        # Lista vuota (nessun vettore riassuntivo ancora) = ricerca piatta
+        scopes = [
+            store.route_sources(
+                vec,
+                ModelConfig.ROUTING_TOP_SOURCES,
+                uploaded_after=filters.get("uploaded_after"),
+                uploaded_before=filters.get("uploaded_before"),
+            )
+            or None
+            for vec in query_vecs
+        ]
+    else:
+        scopes = [source_ids] * len(query_vecs)
+    hits_batch = store.search_hits_batch(
+        query_vecs,
+        top_k * CONTEXT_OVERFETCH_FACTOR,
+        with_vectors=True,
+        source_ids_batch=scopes,
+        filters=filters,
+    )
+
+    # I chunk vicini rispettano il filtro per pagina degli hit (gli altri filtri sono per documento)
+    fetch_chunks = functools.partial(
+        store.get_chunks_by_index,
+        page_from=filters.get("page_from"),
+        page_to=filters.get("page_to"),
+    )
+    results = []
+    for query_vec, hits in zip(query_vecs, hits_batch):
+        with metrics.stage_timer(metrics.STAGE_CONTEXT_ASSEMBLY):
+            contexts, sources = assemble_context(
+                query_vec,
+                hits,
+                top_k,
+                ModelConfig.get_context_token_budget(),
+                neighbors=ModelConfig.CONTEXT_NEIGHBORS,
+                fetch_chunks=fetch_chunks,
+            )
+        results.append(RAGSearchResult(contexts=contexts, sources=sources))
+    return results
+
+
+def build_query_messages(question: str, contexts: list[str]) -> list[dict]:
+    """Costruisce i messaggi (system + user) da inviare all'LLM."""
+    context_block = "\n\n".join(f"- {c}" for c in contexts)
+    user_content = (
+        "Use the following context to answer the question.\n\n"
+        f"Context:\n{context_block}\n\n"
+        f"Question: {question}\n"
+        "Answer concisely using the context above."
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
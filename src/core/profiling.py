@@ -0,0 +1,138 @@
+"""On-demand sampling profiler: folded stacks of the pipeline, stored per request for download."""
+
+import collections
+import contextlib
+import logging
+import re
+import sys
+import threading
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.core.config import ModelConfig
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Profiling settings
+# ============================================================================
+PROFILES_DIR = Path("profiles")  # Directory dei profili salvati (uno per richiesta)
+PROFILE_FIELD = "profile_id"  # Campo dei dati dell'evento che attiva il profiling dei run
+PROFILE_HEADER = "X-Profile"  # Header con cui un client chiede il profiling della richiesta
+PROFILE_ID_HEADER = "X-Profile-Id"  # Header della risposta con l'ID del profilo
+PROFILE_EXTENSION = ".folded"  # Formato folded stacks (flamegraph.pl, speedscope)
+PROFILES_MAX_FILES = 200  # Profili conservati: oltre, i più vecchi vengono cancellati
+MAX_STACK_DEPTH = 128  # Frame massimi registrati per stack
+
+_PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Serializza le scritture dei profili (più step possono scrivere lo stesso file)
+_write_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Campiona lo stack di tutti i thread del processo ogni `interval` secondi.
+
+    Gira in un thread separato e non strumenta il codice: il costo è
+    proporzionale alla frequenza di campionamento, non al lavoro profilato.
+    Il profilo include tutto ciò che il processo esegue nel frattempo (anche
+    le richieste concorrenti), come ogni profiler a campionamento di processo.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self, root: str) -> str:
+        """Stack in formato folded, ciascuno preceduto dal frame radice `root`."""
+        return "".join(
+            f"{root};{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Percorso del profilo, None se l'ID non è valido (mai un percorso arbitrario)."""
+    if not _PROFILE_ID_RE.match(profile_id or ""):
+        return None
+    return PROFILES_DIR / f"{profile_id}{PROFILE_EXTENSION}"
+
+
+def requested_profile_id(headers) -> Optional[str]:
+    """Nuovo ID di profilo se il profiling è abilitato e la richiesta lo chiede (header X-Profile)."""
+    if ModelConfig.PROFILING_ALWAYS:
+        return new_profile_id()
+    if not ModelConfig.PROFILING_ENABLED:
+        return None
+    if headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return new_profile_id()
+    return None
+
+
+def _prune() -> None:
+    profiles = sorted(PROFILES_DIR.glob(f"*{PROFILE_EXTENSION}"), key=lambda p: p.stat().st_mtime)
+    for path in profiles[:-PROFILES_MAX_FILES]:
+        path.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def session(profile_id: Optional[str], label: str) -> Iterator[None]:
+    """
+    Profila il blocco se profile_id è impostato e aggiunge i campioni al suo file.
+
+    Ogni step di un run scrive sotto il proprio frame radice `label`, quindi lo
+    stesso profilo raccoglie tutti gli step della richiesta anche se vengono
+    eseguiti in invocazioni diverse.
+    """
+    path = profile_path(profile_id) if profile_id else None
+    if path is None:
+        yield
+        return
+    profiler = SamplingProfiler(ModelConfig.PROFILING_INTERVAL_SECONDS)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        try:
+            with _write_lock:
+                PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+                with path.open("a", encoding="utf-8") as f:
+                    f.write(profiler.folded(label))
+                _prune()
+        except OSError as e:
+            logger.warning(f"[PROFILING] Could not write profile {profile_id}: {str(e)}")
@@ -0,0 +1,219 @@
+"""Priority work scheduler shared by embedding and LLM calls in the process."""
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional
+
+from src.core.config import ModelConfig
+
+# ============================================================================
+# CONSTANTS - Priority classes
+# ============================================================================
+PRIORITY_INTERACTIVE = "interactive"  # Query degli utenti: servite per prime
+PRIORITY_BULK = "bulk"  # Ingest e query in batch: usano la capacità rimasta
+PRIORITY_ORDER = (PRIORITY_INTERACTIVE, PRIORITY_BULK)  # Ordine in cui i waiter vengono serviti
+
+# Classe di priorità del lavoro corrente (copiata in thread e task asyncio)
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "work_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def work_priority(priority: str) -> Iterator[None]:
+    """Esegue il blocco con la classe di priorità indicata."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class _Waiter:
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class WorkScheduler:
+    """
+    Limita le chiamate concorrenti verso un backend e le serve per priorità.
+
+    Quando si libera uno slot viene servita prima la coda interattiva: le query
+    passano davanti ai batch di ingest già in coda. Ogni classe può occupare al
+    massimo la sua quota (shares) della capacità, così il lavoro bulk lascia
+    sempre slot liberi per le query. Funziona sia da thread (chiamate di
+    embedding sincrone) sia da coroutine (generazioni LLM).
+    """
+
+    def __init__(self, name: str, capacity: int, shares: Dict[str, float]):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.limits = {
+            priority: max(1, math.floor(self.capacity * shares.get(priority, 1.0)))
+            for priority in PRIORITY_ORDER
+        }
+        self._lock = threading.Lock()
+        self._queues: Dict[str, deque] = {p: deque() for p in PRIORITY_ORDER}
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITY_ORDER}
+        self._granted: Dict[str, int] = {p: 0 for p in PRIORITY_ORDER}
+        self._wait_seconds: Dict[str, float] = {p: 0.0 for p in PRIORITY_ORDER}
+
+    def _can_start(self, priority: str) -> bool:
+        return (
+            sum(self._running.values()) < self.capacity
+            and self._running[priority] < self.limits[priority]
+        )
+
+    def _try_start(self, priority: str) -> bool:
+        """Avvia subito se c'è capacità e nessuno di priorità uguale o maggiore è in coda."""
+        ahead = PRIORITY_ORDER[: PRIORITY_ORDER.index(priority) + 1]
+        if any(self._queues[p] for p in ahead) or not self._can_start(priority):
+            return False
+        self._running[priority] += 1
+        self._granted[priority] += 1
+        return True
+
+    def _dispatch(self) -> None:
+        """Assegna gli slot liberi ai waiter, in ordine di priorità (con il lock preso)."""
+        for priority in PRIORITY_ORDER:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._running[priority] += 1
+                self._granted[priority] += 1
+                self._wait_seconds[priority] += time.monotonic() - waiter.enqueued_at
+                waiter.wake()
+
+    def set_limit(self, priority: str, limit: int) -> None:
+        """Cambia la quota massima di una classe (usato dal controller AIMD dell'ingest)."""
+        with self._lock:
+            self.limits[priority] = max(1, min(limit, self.capacity))
+            self._dispatch()
+
+    def release(self, priority: str) -> None:
+        with self._lock:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    def acquire(self, priority: Optional[str] = None) -> str:
+        """Attende uno slot bloccando il thread corrente; restituisce la classe usata."""
+        priority = priority or current_priority()
+        with self._lock:
+            if self._try_start(priority):
+                return priority
+            event = threading.Event()
+            self._queues[priority].append(_Waiter(event.set))
+        event.wait()
+        return priority
+
+    async def acquire_async(self, priority: Optional[str] = None) -> str:
+        """Attende uno slot senza bloccare l'event loop; restituisce la classe usata."""
+        priority = priority or current_priority()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            # Può essere chiamata da un altro thread (rilascio da un embedding sincrono)
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if self._try_start(priority):
+                return priority
+            waiter = _Waiter(wake)
+            self._queues[priority].append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Slot già assegnato ma mai usato: va restituito
+                    self._running[priority] -= 1
+                    self._dispatch()
+                else:
+                    self._queues[priority].remove(waiter)
+            raise
+        return priority
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[None]:
+        acquired = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, priority: Optional[str] = None):
+        acquired = await self.acquire_async(priority)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def stats(self) -> dict:
+        """Capacità, slot occupati, profondità delle code e attesa media per classe."""
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "classes": {
+                    priority: {
+                        "limit": self.limits[priority],
+                        "running": self._running[priority],
+                        "queued": len(self._queues[priority]),
+                        "granted": self._granted[priority],
+                        "avg_wait_seconds": (
+                            self._wait_seconds[priority] / self._granted[priority]
+                            if self._granted[priority]
+                            else 0.0
+                        ),
+                    }
+                    for priority in PRIORITY_ORDER
+                },
+            }
+
+
+# Scheduler delle chiamate di embedding (singleton)
+_embedding_scheduler: Optional[WorkScheduler] = None
+
+# Scheduler delle generazioni LLM (singleton)
+_llm_scheduler: Optional[WorkScheduler] = None
+
+
+def _shares() -> Dict[str, float]:
+    return {PRIORITY_INTERACTIVE: 1.0, PRIORITY_BULK: ModelConfig.SCHEDULER_BULK_SHARE}
+
+
+def get_embedding_scheduler() -> WorkScheduler:
+    global _embedding_scheduler
+    if _embedding_scheduler is None:
+        _embedding_scheduler = WorkScheduler(
+            "embedding", ModelConfig.EMBEDDING_MAX_CONCURRENCY, _shares()
+        )
+    return _embedding_scheduler
+
+
+def get_llm_scheduler() -> WorkScheduler:
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        _llm_scheduler = WorkScheduler("llm", ModelConfig.LLM_MAX_CONCURRENCY, _shares())
+    return _llm_scheduler
+
+
+def scheduler_stats() -> dict:
+    """Statistiche di tutti gli scheduler del processo."""
+    return {
+        "embedding": get_embedding_scheduler().stats(),
+        "llm": get_llm_scheduler().stats(),
+    }
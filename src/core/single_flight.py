@@ -0,0 +1,100 @@
+"""Single-flight coalescing: concurrent identical requests share one in-flight job."""
+
+import asyncio
+import json
+import re
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# ============================================================================
+# CONSTANTS - Coalescing settings
+# ============================================================================
+SINGLE_FLIGHT_TTL_SECONDS = 600  # Dopo questo tempo un job in corso non viene più condiviso
+
+
+def normalize_question(question: str) -> str:
+    """Normalizza una domanda per il confronto (minuscolo, spazi compattati)."""
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def query_key(question: str, params: dict, corpus_version: int) -> Hashable:
+    """Chiave di coalescing: domanda normalizzata, parametri e versione del corpus."""
+    return (
+        normalize_question(question),
+        json.dumps(params, sort_keys=True, default=str),
+        corpus_version,
+    )
+
+
+class SingleFlight:
+    """
+    Associa ogni chiave al job in corso che la sta calcolando.
+
+    La prima richiesta per una chiave avvia il job; le richieste identiche che
+    arrivano mentre il job è ancora in corso ricevono lo stesso event ID invece
+    di avviarne uno nuovo. Quando il job termina (o supera il TTL) la chiave
+    torna libera e la richiesta successiva avvia un nuovo job.
+    """
+
+    def __init__(self, ttl: float = SINGLE_FLIGHT_TTL_SECONDS):
+        self.ttl = ttl
+        self._inflight: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+
+    async def submit(
+        self,
+        key: Hashable,
+        start: Callable[[], Awaitable[str]],
+        is_finished: Callable[[str], Awaitable[bool]],
+    ) -> Tuple[str, bool]:
+        """
+        Restituisce l'event ID del job per la chiave.
+
+        Returns:
+            (event_id, coalesced): coalesced è True se la richiesta è stata
+            agganciata a un job già in corso
+        """
+        self._prune()
+        event_id = await self._attach(key, is_finished)
+        if event_id is not None:
+            return event_id, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (future, time.monotonic())
+        try:
+            event_id = await start()
+        except Exception as e:
+            self._inflight.pop(key, None)
+            future.set_exception(e)
+            # Evita il warning "exception was never retrieved" senza waiter
+            future.exception()
+            raise
+        future.set_result(event_id)
+        return event_id, False
+
+    def _prune(self) -> None:
+        """Rimuove le chiavi scadute, così la mappa non cresce senza limiti."""
+        now = time.monotonic()
+        expired = [k for k, (_, started_at) in self._inflight.items() if now - started_at > self.ttl]
+        for k in expired:
+            del self._inflight[k]
+
+    async def _attach(
+        self, key: Hashable, is_finished: Callable[[str], Awaitable[bool]]
+    ) -> Optional[str]:
+        entry = self._inflight.get(key)
+        if entry is None:
+            return None
+        future, started_at = entry
+        if time.monotonic() - started_at > self.ttl:
+            self._inflight.pop(key, None)
+            return None
+        try:
+            # Se il job è ancora in fase di invio, attende il suo event ID
+            event_id = await asyncio.shield(future)
+        except Exception:
+            return None
+        if await is_finished(event_id):
+            if self._inflight.get(key) is entry:
+                self._inflight.pop(key, None)
+            return None
+        return event_id
@@ -0,0 +1,164 @@
+"""Shared job status broker: one upstream subscription per job, pushed to many clients."""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from src.core import metrics
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Status broker settings
+# ============================================================================
+STATUS_POLL_INTERVAL = 1.0  # Intervallo tra due letture upstream dello stesso job (secondi)
+TERMINAL_CACHE_MAX_ENTRIES = 10000  # Numero massimo di risultati terminali in cache
+STATUS_CACHE_NAME = "job_status"  # Label "cache" nelle metriche
+
+# Stati terminali dei run (API REST Inngest e tabella locale)
+TERMINAL_STATUSES = {"Completed", "Succeeded", "Success", "Finished", "Failed", "Cancelled"}
+
+
+def is_terminal(runs: list[dict]) -> bool:
+    return bool(runs) and runs[0].get("status") in TERMINAL_STATUSES
+
+
+class StatusBroker:
+    """
+    Tiene traccia dello stato dei job per conto di tutti i client.
+
+    Per ogni job con almeno un subscriber gira un solo task di polling verso
+    il backend, indipendentemente dal numero di client collegati. I cambi di
+    stato vengono inoltrati a ogni subscriber e i risultati terminali restano
+    in cache, così le letture successive non toccano più il backend.
+
+    Con poll=False (backend locale, stesso processo) non gira nessun poller:
+    è il backend a notificare i cambi di stato con publish().
+    """
+
+    def __init__(
+        self,
+        fetch_runs: Callable[[str], Awaitable[list[dict]]],
+        poll_interval: float = STATUS_POLL_INTERVAL,
+        cache_size: int = TERMINAL_CACHE_MAX_ENTRIES,
+        poll: bool = True,
+    ):
+        self._fetch_runs = fetch_runs
+        self.poll_interval = poll_interval
+        self.poll = poll
+        self.cache_size = cache_size
+        self._terminal: "OrderedDict[str, list[dict]]" = OrderedDict()
+        self._latest: Dict[str, list[dict]] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+
+    async def get_runs(self, event_id: str) -> list[dict]:
+        """Restituisce lo stato corrente, dalla cache quando possibile."""
+        cached = self._cached(event_id)
+        metrics.record_cache(STATUS_CACHE_NAME, cached is not None)
+        if cached is not None:
+            return cached
+        runs = await self._fetch_runs(event_id)
+        if is_terminal(runs):
+            self._store_terminal(event_id, runs)
+        return runs
+
+    def publish(self, event_id: str, runs: list[dict]) -> None:
+        """Notifica un cambio di stato dal backend (va chiamato dall'event loop)."""
+        if self._cached(event_id) is not None:
+            return
+        if is_terminal(runs):
+            self._store_terminal(event_id, runs)
+        self._publish(event_id, runs)
+
+    async def subscribe(self, event_id: str) -> AsyncIterator[list[dict]]:
+        """Genera lo stato del job a ogni cambiamento, fino a uno stato terminale."""
+        cached = self._cached(event_id)
+        if cached is not None:
+            yield cached
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(event_id, set()).add(queue)
+        if self.poll and event_id not in self._pollers:
+            self._pollers[event_id] = asyncio.create_task(self._poll(event_id))
+        try:
+            runs = self._latest.get(event_id)
+            if runs is None and not self.poll:
+                # Stato corrente letto una volta, i cambi successivi arrivano da publish()
+                runs = await self._fetch_runs(event_id) or None
+                if runs is not None and is_terminal(runs):
+                    self._store_terminal(event_id, runs)
+            if runs is not None:
+                yield runs
+                if is_terminal(runs):
+                    return
+            while True:
+                runs = await queue.get()
+                yield runs
+                if is_terminal(runs):
+                    return
+        finally:
+            subscribers = self._subscribers.get(event_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    # Nessun client in ascolto: interrompe il polling del job
+                    del self._subscribers[event_id]
+                    poller = self._pollers.pop(event_id, None)
+                    if poller is not None:
+                        poller.cancel()
+                    self._latest.pop(event_id, None)
+
+    async def close(self) -> None:
+        """Ferma tutti i task di polling."""
+        pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        self._pollers.clear()
+
+    def _cached(self, event_id: str) -> Optional[list[dict]]:
+        runs = self._terminal.get(event_id)
+        if runs is not None:
+            self._terminal.move_to_end(event_id)
+        return runs
+
+    def _store_terminal(self, event_id: str, runs: list[dict]) -> None:
+        self._terminal[event_id] = runs
+        self._terminal.move_to_end(event_id)
+        while len(self._terminal) > self.cache_size:
+            self._terminal.popitem(last=False)
+
+    def _publish(self, event_id: str, runs: list[dict]) -> None:
+        subscribers = self._subscribers.get(event_id)
+        if not subscribers:
+            return
+        self._latest[event_id] = runs
+        for queue in subscribers:
+            queue.put_nowait(runs)
+
+    async def _poll(self, event_id: str) -> None:
+        last = None
+        try:
+            while True:
+                try:
+                    runs = await self._fetch_runs(event_id)
+                except Exception as e:
+                    logger.warning(f"[STATUS] Error fetching runs for {event_id}: {str(e)}")
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+
+                if runs != last:
+                    last = runs
+                    if is_terminal(runs):
+                        self._store_terminal(event_id, runs)
+                    self._publish(event_id, runs)
+                if is_terminal(runs):
+                    return
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            if self._pollers.get(event_id) is asyncio.current_task():
+                del self._pollers[event_id]
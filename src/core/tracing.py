@@ -0,0 +1,109 @@
+"""OpenTelemetry tracing: spans for API requests, pipeline steps, providers and Qdrant."""
+
+import contextlib
+import importlib.util
+import logging
+from typing import Iterator, Mapping, Optional
+
+from src.core.config import ModelConfig
+
+try:
+    from opentelemetry import propagate, trace
+except ImportError:  # Dipendenza opzionale: senza, gli span sono no-op
+    propagate = None
+    trace = None
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Tracing settings
+# ============================================================================
+TRACER_NAME = "fastrag"  # Nome dello strumento che crea gli span
+TRACE_CONTEXT_FIELD = "trace_context"  # Campo dei dati dell'evento con il contesto W3C (traceparent)
+
+# TracerProvider configurato da setup_tracing (None = nessun export)
+_tracer_provider = None
+
+
+def tracing_available() -> bool:
+    return trace is not None
+
+
+def native_http_tracing() -> bool:
+    """True se FastAPI crea da sé gli span delle richieste HTTP (telemetria nativa)."""
+    return importlib.util.find_spec("fastapi.telemetry") is not None
+
+
+def setup_tracing() -> None:
+    """
+    Configura l'export OTLP degli span se TRACING_ENABLED.
+
+    Richiede opentelemetry-sdk e opentelemetry-exporter-otlp; endpoint e
+    header dell'exporter si impostano con le variabili OTEL_EXPORTER_OTLP_*.
+    """
+    global _tracer_provider
+    if not ModelConfig.TRACING_ENABLED or _tracer_provider is not None:
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "[TRACING] TRACING_ENABLED is set but opentelemetry-sdk / "
+            "opentelemetry-exporter-otlp are not installed: spans are not exported"
+        )
+        return
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": ModelConfig.TRACING_SERVICE_NAME})
+    )
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer_provider = provider
+    logger.info(f"[TRACING] Exporting spans as {ModelConfig.TRACING_SERVICE_NAME}")
+
+
+def shutdown_tracing() -> None:
+    """Invia gli span ancora in buffer (chiusura dell'applicazione)."""
+    global _tracer_provider
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+        _tracer_provider = None
+
+
+def with_trace_context(data: dict) -> dict:
+    """Copia dei dati di un evento con il contesto dello span corrente, per i run che lo eseguono."""
+    if propagate is None or TRACE_CONTEXT_FIELD in data:
+        return data
+    carrier: dict = {}
+    propagate.inject(carrier)
+    return {**data, TRACE_CONTEXT_FIELD: carrier} if carrier else data
+
+
+@contextlib.contextmanager
+def span(
+    name: str,
+    attributes: Optional[dict] = None,
+    parent: Optional[Mapping] = None,
+) -> Iterator[None]:
+    """
+    Esegue il blocco in uno span figlio di quello corrente.
+
+    parent accetta gli header di una richiesta HTTP (traceparent) oppure i dati
+    di un evento (campo TRACE_CONTEXT_FIELD): lo span diventa figlio del
+    contesto che contengono, così i run di Inngest e del backend locale
+    proseguono la traccia della richiesta che li ha avviati.
+    """
+    if trace is None:
+        yield
+        return
+    context = None
+    if parent is not None:
+        carrier = parent.get(TRACE_CONTEXT_FIELD, parent)
+        context = propagate.extract(carrier) if carrier else None
+    attributes = {k: v for k, v in (attributes or {}).items() if v not in (None, "")}
+    tracer = trace.get_tracer(TRACER_NAME)
+    with tracer.start_as_current_span(name, context=context, attributes=attributes):
+        yield
@@ -1,5 +1,13 @@
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
     VectorParams,
     Distance,
     PointStruct,
@@ -7,10 +15,19 @@ from qdrant_client.models import (
     Filter,
     FieldCondition,
     MatchValue,
+    MatchAny,
+    PayloadSchemaType,
+    Range,
+    QueryRequest,
 )
+from src.core.config import ModelConfig
 from src.core.data_loader import get_embedding_dimension
+from src.core import metrics
 from collections import Counter
+from typing import NamedTuple, Optional
 import logging
+import threading
+import uuid
 
 # Usa il logger di uvicorn per logging consistente
 logger = logging.getLogger("uvicorn")
@@ -18,57 +35,499 @@ logger = logging.getLogger("uvicorn")
 # ============================================================================
 # CONSTANTS - Qdrant connection settings
 # ============================================================================
-DEFAULT_QDRANT_URL = "http://localhost:6333"  # URL del server Qdrant
 DEFAULT_COLLECTION_NAME = "docs"  # Nome della collezione Qdrant di default
 DEFAULT_QDRANT_TIMEOUT = 30  # Timeout per connessioni Qdrant (secondi)
+LOCAL_QDRANT_LOCATION = ":memory:"  # Qdrant in-process (benchmark e sviluppo), senza server
+SOURCES_COLLECTION_SUFFIX = "_sources"  # Collezione laterale con un vettore (centroide) per source
+QUANTIZATION_OVERSAMPLING = 2.0  # Candidati letti sui vettori quantizzati per ogni risultato, poi riordinati
 
 # ============================================================================
 # CONSTANTS - Query settings
 # ============================================================================
+# Campi del payload indicizzati per le ricerche filtrate
+PAYLOAD_INDEXES = {
+    "source": PayloadSchemaType.KEYWORD,
+    "page": PayloadSchemaType.INTEGER,
+    "uploaded_at": PayloadSchemaType.FLOAT,
+}
+# Campi indicizzati del vettore riassuntivo dei source (filtri del routing, PDF già ingeriti)
+SOURCE_PAYLOAD_INDEXES = {
+    "uploaded_at": PayloadSchemaType.FLOAT,
+    "content_hash": PayloadSchemaType.KEYWORD,
+}
 SCROLL_BATCH_LIMIT = 1000  # Numero massimo di punti da recuperare per batch nello scroll
 DEFAULT_CHUNKS_BY_SOURCE_LIMIT = 100  # Numero massimo di chunk da recuperare per source di default
 
 
+class _SerializedClient:
+    """
+    QdrantClient con le chiamate serializzate da un lock.
+
+    La modalità locale (":memory:") non è thread-safe: upsert e ricerche
+    concorrenti dai thread dei worker ne corrompono gli array interni.
+    """
+
+    def __init__(self, client: QdrantClient):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+
+        return call
+
+
+# Client condivisi per location: riusano le connessioni e, in modalità locale
+# (":memory:"), fanno vedere a tutto il processo la stessa collezione
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+# Collezioni (location, nome) di cui il processo ha già creato gli indici sul payload
+_indexed_collections: set = set()
+_indexed_collections_lock = threading.Lock()
+
+# Collezioni (location, nome) con il vettore riassuntivo di ogni source (backfill completato):
+# solo su queste la ricerca usa il routing
+_routable_collections: set = set()
+
+
+def get_qdrant_client(url: str) -> QdrantClient:
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = QdrantClient(location=url, timeout=DEFAULT_QDRANT_TIMEOUT)
+            if url == LOCAL_QDRANT_LOCATION:
+                client = _SerializedClient(client)
+            _clients[url] = client
+        return client
+
+
+# Versione del corpus nel processo: incrementata a ogni scrittura o cancellazione,
+# usata per non riutilizzare risultati calcolati su un corpus diverso
+_corpus_version = 0
+
+
+def get_corpus_version() -> int:
+    return _corpus_version
+
+
+def _bump_corpus_version() -> None:
+    global _corpus_version
+    _corpus_version += 1
+
+
+def make_chunk_id(source_id: str, index: int) -> str:
+    """ID deterministico del chunk `index` di un source (stabile tra re-ingest)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{index}"))
+
+
+def make_search_filter(
+    source_ids: list = None,
+    uploaded_after: float = None,
+    uploaded_before: float = None,
+    page_from: int = None,
+    page_to: int = None,
+) -> Optional[Filter]:
+    """
+    Filtro di ricerca sui campi indicizzati del payload (None se non c'è nulla da filtrare).
+
+    Le date sono timestamp Unix; gli intervalli di pagina sono inclusivi.
+    """
+    conditions = []
+    if source_ids:
+        conditions.append(FieldCondition(key="source", match=MatchAny(any=list(source_ids))))
+    if uploaded_after is not None or uploaded_before is not None:
+        conditions.append(
+            FieldCondition(key="uploaded_at", range=Range(gte=uploaded_after, lte=uploaded_before))
+        )
+    if page_from is not None or page_to is not None:
+        conditions.append(FieldCondition(key="page", range=Range(gte=page_from, lte=page_to)))
+    return Filter(must=conditions) if conditions else None
+
+
+def make_source_id(source_id: str) -> str:
+    """ID deterministico del vettore riassuntivo di un source nella collezione laterale."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"source:{source_id}"))
+
+
+class IndexConfig(NamedTuple):
+    """
+    Parametri di indice e ricerca della collezione (0 / "" = default di Qdrant).
+
+    hnsw_m, hnsw_ef_construct e quantization valgono alla creazione della
+    collezione; search_hnsw_ef ed exact a ogni ricerca. La modalità locale
+    (":memory:") esegue sempre una ricerca esatta e li ignora.
+    """
+
+    hnsw_m: int = 0
+    hnsw_ef_construct: int = 0
+    quantization: str = ""  # "scalar", "binary" o "" (nessuna)
+    search_hnsw_ef: int = 0
+    exact: bool = False
+
+    @classmethod
+    def from_config(cls) -> "IndexConfig":
+        return cls(
+            hnsw_m=ModelConfig.QDRANT_HNSW_M,
+            hnsw_ef_construct=ModelConfig.QDRANT_HNSW_EF_CONSTRUCT,
+            quantization=ModelConfig.QDRANT_QUANTIZATION,
+            search_hnsw_ef=ModelConfig.QDRANT_SEARCH_HNSW_EF,
+        )
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if not (self.hnsw_m or self.hnsw_ef_construct):
+            return None
+        return HnswConfigDiff(m=self.hnsw_m or None, ef_construct=self.hnsw_ef_construct or None)
+
+    def quantization_config(self):
+        if not self.quantization:
+            return None
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        raise ValueError(f"Unsupported quantization: {self.quantization}")
+
+    def search_params(self) -> Optional[SearchParams]:
+        if not (self.search_hnsw_ef or self.exact or self.quantization):
+            return None
+        return SearchParams(
+            hnsw_ef=self.search_hnsw_ef or None,
+            exact=self.exact,
+            # I vettori quantizzati selezionano i candidati, quelli originali li riordinano
+            quantization=(
+                QuantizationSearchParams(rescore=True, oversampling=QUANTIZATION_OVERSAMPLING)
+                if self.quantization
+                else None
+            ),
+        )
+
+
 class QdrantStorage:
-    def __init__(self, url=DEFAULT_QDRANT_URL, collection=DEFAULT_COLLECTION_NAME, dim=None):
-        self.client = QdrantClient(url=url, timeout=DEFAULT_QDRANT_TIMEOUT)
+    def __init__(
+        self,
+        url=None,
+        collection=DEFAULT_COLLECTION_NAME,
+        dim=None,
+        index: Optional[IndexConfig] = None,
+    ):
+        # location accetta sia un URL sia ":memory:" (modalità locale, usata dai benchmark)
+        url = url or ModelConfig.QDRANT_URL
+        self.url = url
+        self.client = get_qdrant_client(url)
         self.collection = collection
+        self.index = index or IndexConfig.from_config()
+        self.search_params = self.index.search_params()
+        self.sources_collection = f"{collection}{SOURCES_COLLECTION_SUFFIX}"
         # Use provided dim or get from current embedding provider
         self.dim = dim if dim is not None else get_embedding_dimension()
         if not self.client.collection_exists(self.collection):
             self.client.create_collection(
                 collection_name=self.collection,
                 vectors_config=VectorParams(size=self.dim, distance=Distance.COSINE),
+                hnsw_config=self.index.hnsw_config(),
+                quantization_config=self.index.quantization_config(),
             )
+        self._ensure_payload_indexes(self.collection, PAYLOAD_INDEXES)
+
+    def _ensure_payload_indexes(self, collection: str, indexes: dict) -> None:
+        """
+        Crea gli indici sul payload (le ricerche filtrate non scansionano tutta la
+        collezione) una volta per processo, anche sulle collezioni già esistenti:
+        ricreare un indice con lo stesso schema non ha effetto. In modalità
+        locale (":memory:") gli indici non servono e non vengono creati.
+        """
+        if self.url == LOCAL_QDRANT_LOCATION:
+            return
+        key = (self.url, collection)
+        with _indexed_collections_lock:
+            if key in _indexed_collections:
+                return
+            for field_name, field_schema in indexes.items():
+                self.client.create_payload_index(
+                    collection, field_name=field_name, field_schema=field_schema
+                )
+            _indexed_collections.add(key)
 
     def upsert(self, ids, vectors, payloads):
         points = [
             PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i])
             for i in range(len(ids))
         ]
-        self.client.upsert(self.collection, points=points)
+        metrics.observe_batch_size(metrics.STAGE_QDRANT_UPSERT, len(points), metrics.QDRANT_PROVIDER)
+        with metrics.stage_timer(metrics.STAGE_QDRANT_UPSERT, metrics.QDRANT_PROVIDER):
+            self.client.upsert(self.collection, points=points)
+        _bump_corpus_version()
 
     def search(self, query_vector, top_k: int = 5):
-        # query_points accetta 'query' che può essere un vettore direttamente o un NearestQuery
-        results = self.client.query_points(
-            collection_name=self.collection,
-            query=query_vector,  # Passa il vettore direttamente come query
-            with_payload=True,
-            limit=top_k,
-        )
         contexts = []
         sources = set()
 
-        for r in results:
-            payload = getattr(r, "payload", None) or {}
-            text = payload.get("text", "")
-            source = payload.get("source", "")
-            if text:
-                contexts.append(text)
-                sources.add(source)
+        for hit in self.search_hits(query_vector, top_k):
+            if hit["text"]:
+                contexts.append(hit["text"])
+                sources.add(hit["source"])
 
         return {"contexts": contexts, "sources": list(sources)}
 
+    def search_hits(
+        self,
+        query_vector,
+        limit: int = 5,
+        with_vectors: bool = False,
+        source_ids: list = None,
+        filters: dict = None,
+    ) -> list:
+        """
+        Ricerca con i dettagli di ogni hit (score, source, indice del chunk, vettore).
+
+        Con source_ids la ricerca è limitata ai chunk di quei documenti; filters
+        contiene gli altri argomenti di make_search_filter (date, pagine).
+        """
+        query_filter = make_search_filter(source_ids=source_ids, **(filters or {}))
+        # query_points accetta 'query' che può essere un vettore direttamente o un NearestQuery
+        with metrics.stage_timer(metrics.STAGE_QDRANT_SEARCH, metrics.QDRANT_PROVIDER):
+            results = self.client.query_points(
+                collection_name=self.collection,
+                query=query_vector,  # Passa il vettore direttamente come query
+                query_filter=query_filter,
+                search_params=self.search_params,
+                with_payload=True,
+                with_vectors=with_vectors,
+                limit=limit,
+            )
+        return [self._hit(r) for r in results.points]
+
+    def search_hits_batch(
+        self,
+        query_vectors: list,
+        limit: int = 5,
+        with_vectors: bool = False,
+        source_ids_batch: list = None,
+        filters: dict = None,
+    ) -> list:
+        """
+        Come search_hits per più vettori, con una sola chiamata query_batch_points.
+
+        source_ids_batch contiene i source_ids (o None) di ciascuna query.
+        """
+        if not query_vectors:
+            return []
+        source_ids_batch = source_ids_batch or [None] * len(query_vectors)
+        requests = [
+            QueryRequest(
+                query=vector,
+                filter=make_search_filter(source_ids=source_ids, **(filters or {})),
+                params=self.search_params,
+                limit=limit,
+                with_payload=True,
+                with_vector=with_vectors,
+            )
+            for vector, source_ids in zip(query_vectors, source_ids_batch)
+        ]
+        metrics.observe_batch_size(metrics.STAGE_QDRANT_SEARCH, len(requests), metrics.QDRANT_PROVIDER)
+        with metrics.stage_timer(metrics.STAGE_QDRANT_SEARCH, metrics.QDRANT_PROVIDER):
+            responses = self.client.query_batch_points(
+                collection_name=self.collection, requests=requests
+            )
+        return [[self._hit(r) for r in response.points] for response in responses]
+
+    def route_sources(
+        self,
+        query_vector,
+        num_sources: int,
+        uploaded_after: float = None,
+        uploaded_before: float = None,
+    ) -> list:
+        """
+        Primo stadio della ricerca a due livelli: i num_sources documenti il cui
+        vettore riassuntivo è più vicino alla query, tra quelli caricati
+        nell'intervallo uploaded_after/uploaded_before (se indicato).
+
+        Restituisce una lista vuota se la collezione laterale non esiste ancora
+        (corpus ingerito prima del routing): il chiamante ricade sulla ricerca piatta.
+        """
+        if not self.client.collection_exists(self.sources_collection):
+            return []
+        with metrics.stage_timer(metrics.STAGE_QDRANT_SEARCH, metrics.QDRANT_PROVIDER):
+            results = self.client.query_points(
+                collection_name=self.sources_collection,
+                query=query_vector,
+                query_filter=make_search_filter(
+                    uploaded_after=uploaded_after, uploaded_before=uploaded_before
+                ),
+                with_payload=True,
+                limit=num_sources,
+            )
+        return [(r.payload or {}).get("source", "") for r in results.points]
+
+    def routing_ready(self) -> bool:
+        """True se ogni source della collezione ha il suo vettore riassuntivo (vedi backfill_source_vectors)."""
+        return (self.url, self.collection) in _routable_collections
+
+    def backfill_source_vectors(self) -> int:
+        """
+        Crea i vettori riassuntivi mancanti (documenti ingeriti prima del routing)
+        e abilita il routing sulla collezione. I nuovi ingest aggiungono il
+        proprio vettore in reconcile, quindi basta una volta per processo.
+
+        Returns:
+            Numero di vettori riassuntivi creati
+        """
+        sources = set()
+        offset = None
+        while True:
+            result, next_offset = self.client.scroll(
+                collection_name=self.collection,
+                limit=SCROLL_BATCH_LIMIT,
+                offset=offset,
+                with_payload=["source"],
+                with_vectors=False,
+            )
+            sources.update((p.payload or {}).get("source", "") for p in result)
+            if next_offset is None:
+                break
+            offset = next_offset
+        sources.discard("")
+
+        existing = set()
+        if self.client.collection_exists(self.sources_collection):
+            ordered = sorted(sources)
+            for start in range(0, len(ordered), SCROLL_BATCH_LIMIT):
+                points = self.client.retrieve(
+                    collection_name=self.sources_collection,
+                    ids=[make_source_id(s) for s in ordered[start : start + SCROLL_BATCH_LIMIT]],
+                    with_payload=["source"],
+                    with_vectors=False,
+                )
+                existing.update((p.payload or {}).get("source", "") for p in points)
+
+        missing = sources - existing
+        for source_id in sorted(missing):
+            # Ingest non verificato da reconcile: il documento non conta come già ingerito
+            self.update_source_vector(source_id, completed=False)
+        _routable_collections.add((self.url, self.collection))
+        return len(missing)
+
+    def update_source_vector(self, source_id: str, completed: bool = True) -> int:
+        """
+        Ricalcola il vettore riassuntivo (centroide dei chunk) di un source.
+
+        Il payload riporta anche la data di caricamento e l'hash del contenuto
+        dei chunk: il routing applica lo stesso filtro per data della ricerca e,
+        dato che reconcile lo scrive solo a ingest completato, il vettore
+        riassuntivo segna i documenti da non ingerire di nuovo. Con
+        completed=False (backfill) l'hash non viene scritto.
+
+        Returns:
+            Numero di chunk usati per il centroide
+        """
+        filter_condition = Filter(
+            must=[FieldCondition(key="source", match=MatchValue(value=source_id))]
+        )
+        total = [0.0] * self.dim
+        count = 0
+        document = {}
+        offset = None
+        while True:
+            result, next_offset = self.client.scroll(
+                collection_name=self.collection,
+                scroll_filter=filter_condition,
+                limit=SCROLL_BATCH_LIMIT,
+                offset=offset,
+                with_payload=list(SOURCE_PAYLOAD_INDEXES),
+                with_vectors=True,
+            )
+            for point in result:
+                total = [t + v for t, v in zip(total, point.vector)]
+                count += 1
+                document.update(point.payload or {})
+            if next_offset is None:
+                break
+            offset = next_offset
+
+        if count == 0:
+            self.delete_source_vector(source_id)
+            return 0
+
+        if not self.client.collection_exists(self.sources_collection):
+            self.client.create_collection(
+                collection_name=self.sources_collection,
+                vectors_config=VectorParams(size=self.dim, distance=Distance.COSINE),
+            )
+        self._ensure_payload_indexes(self.sources_collection, SOURCE_PAYLOAD_INDEXES)
+        if not completed:
+            document.pop("content_hash", None)
+        self.client.upsert(
+            self.sources_collection,
+            points=[
+                PointStruct(
+                    id=make_source_id(source_id),
+                    vector=[t / count for t in total],
+                    payload={**document, "source": source_id, "num_chunks": count},
+                )
+            ],
+        )
+        return count
+
+    def delete_source_vector(self, source_id: str) -> None:
+        """Rimuove il vettore riassuntivo di un source dalla collezione laterale."""
+        if self.client.collection_exists(self.sources_collection):
+            self.client.delete(
+                collection_name=self.sources_collection,
+                points_selector=[make_source_id(source_id)],
+            )
+
+    def get_chunks_by_index(
+        self, keys: list, page_from: int = None, page_to: int = None
+    ) -> list:
+        """
+        Recupera i chunk indicati da coppie (source_id, chunk_index) con una sola retrieve.
+
+        Gli ID sono calcolati con make_chunk_id; gli indici fuori dal documento
+        semplicemente non vengono trovati. page_from/page_to (inclusivi) scartano
+        i chunk di pagine fuori dall'intervallo, come il filtro della ricerca.
+        """
+        if not keys:
+            return []
+        with metrics.stage_timer(metrics.STAGE_QDRANT_RETRIEVE, metrics.QDRANT_PROVIDER):
+            points = self.client.retrieve(
+                collection_name=self.collection,
+                ids=[make_chunk_id(source_id, index) for source_id, index in keys],
+                with_payload=True,
+                with_vectors=False,
+            )
+        hits = [self._hit(p) for p in points]
+        if page_from is not None or page_to is not None:
+            hits = [
+                h
+                for h in hits
+                if h["page"] is not None
+                and (page_from is None or h["page"] >= page_from)
+                and (page_to is None or h["page"] <= page_to)
+            ]
+        return hits
+
+    @staticmethod
+    def _hit(point) -> dict:
+        payload = getattr(point, "payload", None) or {}
+        return {
+            "id": str(point.id),
+            "score": getattr(point, "score", None),
+            "text": payload.get("text", ""),
+            "source": payload.get("source", ""),
+            "chunk_index": payload.get("chunk_index"),
+            "page": payload.get("page"),
+            "vector": getattr(point, "vector", None),
+        }
+
     def get_all_sources(self) -> dict:
         """Recupera tutti i source_id unici con conteggio chunk."""
         sources_count = Counter()
@@ -151,6 +610,79 @@ class QdrantStorage:
 
         return chunks
 
+    def find_source_by_hash(self, content_hash: str) -> Optional[str]:
+        """
+        Source di un documento già ingerito con lo stesso hash del contenuto (None se assente).
+
+        Cerca tra i vettori riassuntivi, scritti da reconcile solo quando tutti i
+        chunk del documento sono presenti: i chunk lasciati da un ingest fallito
+        o incompleto non bloccano un nuovo upload dello stesso PDF.
+        """
+        if not self.client.collection_exists(self.sources_collection):
+            return None
+        result, _ = self.client.scroll(
+            collection_name=self.sources_collection,
+            scroll_filter=Filter(
+                must=[FieldCondition(key="content_hash", match=MatchValue(value=content_hash))]
+            ),
+            limit=1,
+            with_payload=["source"],
+            with_vectors=False,
+        )
+        if not result:
+            return None
+        return (result[0].payload or {}).get("source")
+
+    def count_by_source(self, source_id: str) -> int:
+        """Conta i punti memorizzati per un source specifico."""
+        filter_condition = Filter(
+            must=[FieldCondition(key="source", match=MatchValue(value=source_id))]
+        )
+        result = self.client.count(
+            collection_name=self.collection,
+            count_filter=filter_condition,
+            exact=True,
+        )
+        return result.count
+
+    def delete_stale_chunks(self, source_id: str, num_chunks: int) -> int:
+        """
+        Cancella i chunk di un source con indice >= num_chunks.
+
+        Serve quando un documento viene re-ingerito e produce meno chunk
+        della versione precedente: gli ID deterministici coprono solo i primi
+        num_chunks, gli altri resterebbero orfani.
+
+        Returns:
+            Numero di punti cancellati
+        """
+        filter_condition = Filter(
+            must=[FieldCondition(key="source", match=MatchValue(value=source_id))]
+        )
+        expected_ids = {make_chunk_id(source_id, i) for i in range(num_chunks)}
+
+        stale_ids = []
+        offset = None
+        while True:
+            result, next_offset = self.client.scroll(
+                collection_name=self.collection,
+                scroll_filter=filter_condition,
+                limit=SCROLL_BATCH_LIMIT,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            stale_ids.extend(p.id for p in result if str(p.id) not in expected_ids)
+            if next_offset is None:
+                break
+            offset = next_offset
+
+        if stale_ids:
+            logger.info(f"[RECONCILE] Deleting {len(stale_ids)} stale chunks for source_id: {source_id}")
+            self.client.delete(collection_name=self.collection, points_selector=stale_ids)
+            _bump_corpus_version()
+        return len(stale_ids)
+
     def delete_by_source(self, source_id: str) -> int:
         """
         Cancella tutti i punti con un determinato source_id.
@@ -207,6 +739,8 @@ class QdrantStorage:
                 points_selector=point_ids,
             )
             logger.info(f"[DELETE] Delete operation completed. Result: {delete_result}")
+            _bump_corpus_version()
+            self.delete_source_vector(source_id)
             
             # Verifica che la cancellazione sia avvenuta
             # Controlla di nuovo quanti punti ci sono
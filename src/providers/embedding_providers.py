@@ -1,9 +1,9 @@
 """Embedding provider implementations."""
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 import requests
-from openai import OpenAI
+from src.core import accounting
 from src.core.config import ModelConfig
 
 # ============================================================================
@@ -15,6 +15,9 @@ DEFAULT_EMBEDDING_TIMEOUT = 60  # Timeout per richieste embedding API (secondi)
 class EmbeddingProvider(ABC):
     """Base class for embedding providers."""
 
+    name: str = ""  # Label provider nelle metriche
+    model: str = ""
+
     @abstractmethod
     def embed(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for a list of texts."""
@@ -25,10 +28,20 @@ class EmbeddingProvider(ABC):
         """Get the dimension of embeddings produced by this provider."""
         pass
 
+    def record_usage(self, input_tokens: Optional[int]) -> None:
+        """Account one embedding call and its input tokens (None = not reported by the provider)."""
+        accounting.record(self.name, self.model, accounting.KIND_EMBEDDING, input_tokens)
+
+    def warmup(self) -> None:
+        """Run a dummy embedding so that the first real request is not a cold start."""
+        self.embed(["warmup"])
+
 
 class OllamaEmbeddingProvider(EmbeddingProvider):
     """Embedding provider using Ollama API."""
 
+    name = "ollama"
+
     def __init__(
         self,
         base_url: str = None,
@@ -48,11 +61,12 @@ class OllamaEmbeddingProvider(EmbeddingProvider):
                 try:
                     response = requests.post(
                         f"{self.base_url}/api/embed",
-                        json={"model": self.model, field_name: text},
+                        json={"model": self.model, field_name: text, **self._keep_alive()},
                         timeout=DEFAULT_EMBEDDING_TIMEOUT,
                     )
                     response.raise_for_status()
                     result = response.json()
+                    self.record_usage(result.get("prompt_eval_count"))
                     # Ollama restituisce 'embeddings' (plurale) come array di array
                     embedding_list = result.get("embeddings", [])
                     # Se non c'è 'embeddings', prova 'embedding' (singolare) per retrocompatibilità
@@ -132,11 +146,22 @@ class OllamaEmbeddingProvider(EmbeddingProvider):
         """Get the dimension of embeddings."""
         return self.dimension
 
+    @staticmethod
+    def _keep_alive() -> dict:
+        """Ollama `keep_alive` option, if configured (OLLAMA_KEEP_ALIVE)."""
+        if ModelConfig.OLLAMA_KEEP_ALIVE:
+            return {"keep_alive": ModelConfig.OLLAMA_KEEP_ALIVE}
+        return {}
+
 
 class OpenAIEmbeddingProvider(EmbeddingProvider):
     """Embedding provider using OpenAI API."""
 
+    name = "openai"
+
     def __init__(self, api_key: str = None, model: str = None):
+        from openai import OpenAI
+
         api_key = api_key or ModelConfig.OPENAI_API_KEY
         if not api_key:
             raise ValueError("OpenAI API key is required")
@@ -150,6 +175,7 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
             model=self.model,
             input=texts,
         )
+        self.record_usage(response.usage.prompt_tokens if response.usage else None)
         return [item.embedding for item in response.data]
 
     def get_dimension(self) -> int:
@@ -160,6 +186,8 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
 class GoogleEmbeddingProvider(EmbeddingProvider):
     """Embedding provider using Google Generative AI API."""
 
+    name = "google"
+
     def __init__(self, api_key: str = None, model: str = None):
         import google.generativeai as genai
 
@@ -180,6 +208,8 @@ class GoogleEmbeddingProvider(EmbeddingProvider):
                 content=text,
                 task_type="retrieval_document",
             )
+            # embed_content non riporta i token: si conta solo la chiamata
+            self.record_usage(None)
             embeddings.append(result["embedding"])
         return embeddings
 
@@ -188,9 +218,13 @@ class GoogleEmbeddingProvider(EmbeddingProvider):
         return self.dimension
 
 
-def get_embedding_provider() -> EmbeddingProvider:
-    """Factory function to get the appropriate embedding provider."""
-    provider = ModelConfig.EMBEDDING_PROVIDER.lower()
+# Provider di embedding configurato (singleton, riusato tra le richieste)
+_embedding_provider: Optional[EmbeddingProvider] = None
+
+
+def create_embedding_provider(provider: str = None) -> EmbeddingProvider:
+    """Factory function to create a new embedding provider instance."""
+    provider = (provider or ModelConfig.EMBEDDING_PROVIDER).lower()
 
     if provider == "ollama":
         return OllamaEmbeddingProvider()
@@ -200,3 +234,11 @@ def get_embedding_provider() -> EmbeddingProvider:
         return GoogleEmbeddingProvider()
     else:
         raise ValueError(f"Unsupported embedding provider: {provider}")
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Get the configured embedding provider (created once, then cached)."""
+    global _embedding_provider
+    if _embedding_provider is None:
+        _embedding_provider = create_embedding_provider()
+    return _embedding_provider
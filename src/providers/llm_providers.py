@@ -1,16 +1,19 @@
 """LLM provider implementations."""
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
-import requests
+from typing import AsyncIterator, Dict, Any, Optional, List
+import contextlib
+import json
 import os
-from inngest.experimental import ai
+import httpx
+from src.core import accounting, metrics
 from src.core.config import ModelConfig
+from src.core.scheduler import get_llm_scheduler
 
 # ============================================================================
 # CONSTANTS - API timeout settings
 # ============================================================================
-DEFAULT_LLM_TIMEOUT = 240  # Timeout per richieste LLM API (secondi) - modelli locali possono richiedere più tempo
+DEFAULT_LLM_TIMEOUT = ModelConfig.LLM_TIMEOUT  # Timeout per richieste LLM API (secondi) - modelli locali possono richiedere più tempo
 
 # ============================================================================
 # CONSTANTS - LLM generation defaults (usati come fallback se non specificati)
@@ -19,9 +22,60 @@ DEFAULT_MAX_TOKENS = 1024  # Numero massimo di token da generare
 DEFAULT_TEMPERATURE = 0.2  # Temperatura per generazione (0.0-1.0)
 
 
+# Client HTTP asincrono condiviso da tutti i provider (pool di connessioni unico)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client used by the LLM providers."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=DEFAULT_LLM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=ModelConfig.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=ModelConfig.LLM_MAX_CONNECTIONS,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared async HTTP client (e.g. on application shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def generation_slot():
+    """
+    Slot of the process-wide LLM scheduler: at most LLM_MAX_CONCURRENCY
+    generations, served by priority class (interactive before bulk).
+    """
+    return get_llm_scheduler().async_slot()
+
+
 class LLMProvider(ABC):
     """Base class for LLM providers."""
 
+    name: str = ""  # Label provider nelle metriche
+
+    @property
+    def model_label(self) -> str:
+        """Model name used as metrics label."""
+        return str(getattr(self, "model", ""))
+
+    @contextlib.asynccontextmanager
+    async def generation_timer(self):
+        """Time one generation in the llm_generate stage histogram."""
+        with metrics.stage_timer(metrics.STAGE_LLM_GENERATE, self.name, self.model_label):
+            yield
+
+    def record_usage(self, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        """Account one generation and the tokens reported by the provider (metrics and current job)."""
+        accounting.record(self.name, self.model_label, accounting.KIND_LLM, input_tokens, output_tokens)
+
     @abstractmethod
     def get_inngest_adapter(self):
         """Get an inngest adapter if supported, otherwise None."""
@@ -37,10 +91,26 @@ class LLMProvider(ABC):
         """Generate a response from the LLM."""
         pass
 
+    @abstractmethod
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Generate a response from the LLM, yielding text chunks as they arrive."""
+        pass
+
+    async def warmup(self) -> None:
+        """Preload the model so that the first real request is not a cold start."""
+        pass
+
 
 class OllamaLLMProvider(LLMProvider):
     """LLM provider using Ollama API."""
 
+    name = "ollama"
+
     def __init__(
         self,
         base_url: str = None,
@@ -60,53 +130,112 @@ class OllamaLLMProvider(LLMProvider):
         temperature: float = DEFAULT_TEMPERATURE,
     ) -> str:
         """Generate a response using Ollama API."""
-        import asyncio
-
-        # Convert messages to Ollama chat format
-        ollama_messages = []
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            # Ollama chat API accetta "system", "user", "assistant"
-            if role in ["system", "user", "assistant"]:
-                ollama_messages.append({"role": role, "content": content})
-
-        # Run the synchronous request in a thread pool
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: requests.post(
+        async with generation_slot(), self.generation_timer():
+            response = await get_http_client().post(
                 f"{self.base_url}/api/chat",
                 json={
                     "model": self.model,
-                    "messages": ollama_messages,
+                    "messages": self._to_ollama_messages(messages),
                     "options": {
                         "num_predict": max_tokens,
                         "temperature": temperature,
                     },
                     "stream": False,
+                    **self._keep_alive(),
                 },
-                timeout=DEFAULT_LLM_TIMEOUT,
-            ),
-        )
-        response.raise_for_status()
+            )
+            response.raise_for_status()
         result = response.json()
+        self.record_usage(result.get("prompt_eval_count"), result.get("eval_count"))
         # L'API chat restituisce message.content invece di response
         message = result.get("message", {})
         return message.get("content", "").strip()
 
+    async def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Stream a response using Ollama chat API (`stream: true`, NDJSON)."""
+        async with generation_slot(), self.generation_timer():
+            async with get_http_client().stream(
+                "POST",
+                f"{self.base_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": self._to_ollama_messages(messages),
+                    "options": {
+                        "num_predict": max_tokens,
+                        "temperature": temperature,
+                    },
+                    "stream": True,
+                    **self._keep_alive(),
+                },
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    content = data.get("message", {}).get("content", "")
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        # L'ultima riga riporta i token di prompt e risposta
+                        self.record_usage(data.get("prompt_eval_count"), data.get("eval_count"))
+                        break
+
+    async def warmup(self) -> None:
+        """Load the model into memory (a generate request without prompt)."""
+        response = await get_http_client().post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model, **self._keep_alive()},
+        )
+        response.raise_for_status()
+
+    @staticmethod
+    def _keep_alive() -> Dict[str, str]:
+        """Ollama `keep_alive` option, if configured (OLLAMA_KEEP_ALIVE)."""
+        if ModelConfig.OLLAMA_KEEP_ALIVE:
+            return {"keep_alive": ModelConfig.OLLAMA_KEEP_ALIVE}
+        return {}
+
+    @staticmethod
+    def _to_ollama_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Convert messages to Ollama chat format."""
+        ollama_messages = []
+        for msg in messages:
+            role = msg.get("role", "user")
+            content = msg.get("content", "")
+            # Ollama chat API accetta "system", "user", "assistant"
+            if role in ["system", "user", "assistant"]:
+                ollama_messages.append({"role": role, "content": content})
+        return ollama_messages
+
 
 class OpenAILLMProvider(LLMProvider):
     """LLM provider using OpenAI API."""
 
+    name = "openai"
+
     def __init__(self, api_key: str = None, model: str = None):
+        from openai import AsyncOpenAI
+
         self.api_key = api_key or ModelConfig.OPENAI_API_KEY
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         self.model = model or ModelConfig.OPENAI_LLM_MODEL
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=DEFAULT_LLM_TIMEOUT,
+            http_client=get_http_client(),
+        )
 
     def get_inngest_adapter(self):
         """Get the inngest OpenAI adapter."""
+        from inngest.experimental import ai
+
         return ai.openai.Adapter(auth_key=self.api_key, model=self.model)
 
     async def generate(
@@ -115,18 +244,51 @@ class OpenAILLMProvider(LLMProvider):
         max_tokens: int = DEFAULT_MAX_TOKENS,
         temperature: float = DEFAULT_TEMPERATURE,
     ) -> str:
-        """Generate a response using OpenAI API (via inngest adapter)."""
-        # This is typically called through inngest, but we can also call directly
-        # For direct calls, we'd use the OpenAI client, but since we have inngest,
-        # we'll rely on the adapter being used in the inngest context
-        raise NotImplementedError(
-            "OpenAI generation should be done through inngest adapter"
+        """Generate a response using OpenAI API (direct call, outside inngest)."""
+        async with generation_slot(), self.generation_timer():
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        usage = response.usage
+        self.record_usage(
+            usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None
         )
+        if response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        return ""
+
+    async def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Stream a response using OpenAI chat completions API."""
+        async with generation_slot(), self.generation_timer():
+            stream = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                # L'ultimo chunk (senza choices) riporta l'uso dei token
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    self.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
 
 
 class GoogleLLMProvider(LLMProvider):
     """LLM provider using Google Gemini API."""
 
+    name = "google"
+
     def __init__(self, api_key: str = None, model: str = None):
         import google.generativeai as genai
 
@@ -138,10 +300,21 @@ class GoogleLLMProvider(LLMProvider):
         self.genai = genai
         self.model = genai.GenerativeModel(self.model_name)
 
+    @property
+    def model_label(self) -> str:
+        return self.model_name
+
     def get_inngest_adapter(self):
         """Google doesn't have a native inngest adapter, return None."""
         return None
 
+    def _record_usage_metadata(self, response) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.record_usage(usage.prompt_token_count, usage.candidates_token_count)
+        else:
+            self.record_usage(None, None)
+
     async def generate(
         self,
         messages: List[Dict[str, str]],
@@ -149,10 +322,47 @@ class GoogleLLMProvider(LLMProvider):
         temperature: float = DEFAULT_TEMPERATURE,
     ) -> str:
         """Generate a response using Google Gemini API."""
-        # Convert messages to Google format
-        # Google expects alternating user/assistant messages
-        chat = self.model.start_chat(history=[])
+        async with generation_slot(), self.generation_timer():
+            response = await self.model.generate_content_async(
+                self._build_prompt(messages),
+                generation_config={
+                    "max_output_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                request_options={"timeout": DEFAULT_LLM_TIMEOUT},
+            )
+        self._record_usage_metadata(response)
+        return response.text.strip()
 
+    async def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Stream a response using Google Gemini API."""
+        async with generation_slot(), self.generation_timer():
+            response = await self.model.generate_content_async(
+                self._build_prompt(messages),
+                generation_config={
+                    "max_output_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                stream=True,
+                request_options={"timeout": DEFAULT_LLM_TIMEOUT},
+            )
+            last_chunk = None
+            async for chunk in response:
+                last_chunk = chunk
+                # I chunk senza parti (es. bloccati dai filtri) non hanno testo
+                if chunk.parts:
+                    yield chunk.text
+            # L'ultimo chunk riporta l'uso totale dei token
+            self._record_usage_metadata(last_chunk)
+
+    @staticmethod
+    def _build_prompt(messages: List[Dict[str, str]]) -> str:
+        """Convert messages to a single Gemini prompt (system + user messages)."""
         # Find system message if present
         system_content = None
         user_messages = []
@@ -162,38 +372,28 @@ class GoogleLLMProvider(LLMProvider):
             elif msg.get("role") == "user":
                 user_messages.append(msg.get("content", ""))
 
-        # Send all user messages
         full_prompt = "\n\n".join(user_messages)
         if system_content:
             full_prompt = f"{system_content}\n\n{full_prompt}"
-
-        import asyncio
-
-        # Run the synchronous call in a thread pool
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: self.model.generate_content(
-                full_prompt,
-                generation_config={
-                    "max_output_tokens": max_tokens,
-                    "temperature": temperature,
-                },
-            ),
-        )
-        return response.text.strip()
+        return full_prompt
 
 
 class AnthropicLLMProvider(LLMProvider):
     """LLM provider using Anthropic Claude API."""
 
+    name = "anthropic"
+
     def __init__(self, api_key: str = None, model: str = None):
-        from anthropic import Anthropic
+        from anthropic import AsyncAnthropic
 
         self.api_key = api_key or ModelConfig.ANTHROPIC_API_KEY
         if not self.api_key:
             raise ValueError("Anthropic API key is required")
-        self.client = Anthropic(api_key=self.api_key)
+        self.async_client = AsyncAnthropic(
+            api_key=self.api_key,
+            timeout=DEFAULT_LLM_TIMEOUT,
+            http_client=get_http_client(),
+        )
         self.model = model or ModelConfig.ANTHROPIC_LLM_MODEL
 
     def get_inngest_adapter(self):
@@ -207,9 +407,47 @@ class AnthropicLLMProvider(LLMProvider):
         temperature: float = DEFAULT_TEMPERATURE,
     ) -> str:
         """Generate a response using Anthropic Claude API."""
-        import asyncio
+        system_message, conversation_messages = self._split_messages(messages)
 
-        # Separate system message from conversation messages
+        async with generation_slot(), self.generation_timer():
+            response = await self.async_client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_message or "",
+                messages=conversation_messages,
+            )
+        self.record_usage(response.usage.input_tokens, response.usage.output_tokens)
+
+        # Extract text from the response
+        if response.content and len(response.content) > 0:
+            return response.content[0].text.strip()
+        return ""
+
+    async def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Stream a response using Anthropic Claude streaming API."""
+        system_message, conversation_messages = self._split_messages(messages)
+        async with generation_slot(), self.generation_timer():
+            async with self.async_client.messages.stream(
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_message or "",
+                messages=conversation_messages,
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                final = await stream.get_final_message()
+                self.record_usage(final.usage.input_tokens, final.usage.output_tokens)
+
+    @staticmethod
+    def _split_messages(messages: List[Dict[str, str]]):
+        """Separate system message from conversation messages."""
         system_message = None
         conversation_messages = []
 
@@ -220,29 +458,16 @@ class AnthropicLLMProvider(LLMProvider):
                 system_message = content
             elif role in ["user", "assistant"]:
                 conversation_messages.append({"role": role, "content": content})
+        return system_message, conversation_messages
 
-        # Run the synchronous call in a thread pool
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: self.client.messages.create(
-                model=self.model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                system=system_message or "",
-                messages=conversation_messages,
-            ),
-        )
 
-        # Extract text from the response
-        if response.content and len(response.content) > 0:
-            return response.content[0].text.strip()
-        return ""
+# Provider LLM configurato (singleton, riusato tra le richieste)
+_llm_provider: Optional[LLMProvider] = None
 
 
-def get_llm_provider() -> LLMProvider:
-    """Factory function to get the appropriate LLM provider."""
-    provider = ModelConfig.LLM_PROVIDER.lower()
+def create_llm_provider(provider: str = None) -> LLMProvider:
+    """Factory function to create a new LLM provider instance."""
+    provider = (provider or ModelConfig.LLM_PROVIDER).lower()
 
     if provider == "ollama":
         return OllamaLLMProvider()
@@ -254,3 +479,17 @@ def get_llm_provider() -> LLMProvider:
         return AnthropicLLMProvider()
     else:
         raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def get_llm_provider() -> LLMProvider:
+    """Get the configured LLM provider (created once, then cached)."""
+    global _llm_provider
+    if _llm_provider is None:
+        if ModelConfig.get_llm_fallback_providers():
+            # Routing con hedging e failover sui provider di fallback
+            from src.providers.llm_router import create_routed_llm_provider
+
+            _llm_provider = create_routed_llm_provider()
+        else:
+            _llm_provider = create_llm_provider()
+    return _llm_provider
@@ -0,0 +1,253 @@
+"""Hedged and failover LLM generation across the configured providers."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from src.core.config import ModelConfig
+from src.providers.llm_providers import (
+    LLMProvider,
+    create_llm_provider,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TEMPERATURE,
+    DEFAULT_LLM_TIMEOUT,
+)
+
+# Usa il logger di uvicorn per logging consistente
+logger = logging.getLogger("uvicorn")
+
+# ============================================================================
+# CONSTANTS - Hedging settings
+# ============================================================================
+LATENCY_WINDOW = 200  # Numero di latenze recenti conservate per provider
+HEDGE_PERCENTILE = 0.95  # Percentile di latenza dopo cui parte la richiesta hedged
+HEDGE_MIN_SAMPLES = 20  # Campioni minimi prima di usare il percentile misurato
+HEDGE_INITIAL_DELAY = 10.0  # Ritardo di hedging finché non ci sono abbastanza campioni (secondi)
+
+# ============================================================================
+# CONSTANTS - Circuit breaker settings
+# ============================================================================
+BREAKER_FAILURE_THRESHOLD = 3  # Fallimenti consecutivi (o chiamate lente) prima di escludere il provider
+BREAKER_COOLDOWN_SECONDS = 30  # Tempo di esclusione prima di una nuova chiamata di prova
+SLOW_CALL_SECONDS = DEFAULT_LLM_TIMEOUT / 2  # Una chiamata più lenta di così conta come fallimento
+
+
+class CircuitBreaker:
+    """Esclude un provider dopo troppi fallimenti consecutivi, per un periodo di cooldown."""
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        # In half-open lascia passare le chiamate di prova: un nuovo fallimento riapre il circuito
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class _Backend:
+    """Provider con le sue statistiche di latenza e il suo circuit breaker."""
+
+    def __init__(self, name: str, provider: LLMProvider):
+        self.name = name
+        self.provider = provider
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.breaker = CircuitBreaker()
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record(self, elapsed: float) -> None:
+        self.latencies.append(elapsed)
+        if elapsed > SLOW_CALL_SECONDS:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+
+class RoutedLLMProvider(LLMProvider):
+    """
+    Instrada le generazioni su una lista ordinata di provider.
+
+    La richiesta parte sul primo provider disponibile; se non risponde entro
+    il suo p95 di latenza (mai meno di LLM_HEDGE_MIN_DELAY) parte una richiesta
+    hedged sul provider successivo, si usa la prima risposta e le altre vengono
+    cancellate. Un provider che fallisce passa subito la mano al successivo.
+    Ogni provider ha un circuit breaker che lo esclude quando è lento o in errore.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, LLMProvider],
+        hedging: bool = True,
+        hedge_min_delay: float = 2.0,
+    ):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.backends = [_Backend(name, provider) for name, provider in providers.items()]
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+
+    def get_inngest_adapter(self):
+        """Routing calls the providers directly, so no inngest adapter is used."""
+        return None
+
+    def stats(self) -> List[dict]:
+        """Per-provider latency percentile and circuit breaker state."""
+        return [
+            {
+                "provider": b.name,
+                "p95_seconds": b.percentile(HEDGE_PERCENTILE),
+                "samples": len(b.latencies),
+                "breaker": b.breaker.state,
+                "consecutive_failures": b.breaker.failures,
+            }
+            for b in self.backends
+        ]
+
+    def _available(self) -> List[_Backend]:
+        available = [b for b in self.backends if b.breaker.allow()]
+        # Se tutti i circuiti sono aperti meglio tentare comunque che fallire subito
+        return available or list(self.backends)
+
+    def _hedge_delay(self, backend: _Backend) -> float:
+        p95 = backend.percentile(HEDGE_PERCENTILE)
+        if p95 is None:
+            return max(self.hedge_min_delay, HEDGE_INITIAL_DELAY)
+        return max(self.hedge_min_delay, p95)
+
+    async def _call(self, backend: _Backend, messages, max_tokens, temperature) -> str:
+        start = time.monotonic()
+        try:
+            answer = await backend.provider.generate(
+                messages=messages, max_tokens=max_tokens, temperature=temperature
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.breaker.record_failure()
+            raise
+        backend.record(time.monotonic() - start)
+        return answer
+
+    async def generate(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> str:
+        """Generate with hedging and failover across the configured providers."""
+        queue = self._available()
+        pending: Dict[asyncio.Task, _Backend] = {}
+        launched: List[asyncio.Task] = []
+        errors = []
+        winner = None
+
+        def launch() -> _Backend:
+            backend = queue.pop(0)
+            task = asyncio.create_task(self._call(backend, messages, max_tokens, temperature))
+            pending[task] = backend
+            launched.append(task)
+            return backend
+
+        last = launch()
+        try:
+            while pending:
+                timeout = self._hedge_delay(last) if self.hedging and queue else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"[LLM ROUTER] {last.name} is slow, hedging with {queue[0].name}")
+                    last = launch()
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        logger.warning(f"[LLM ROUTER] {backend.name} failed: {task.exception()}")
+                        errors.append(f"{backend.name}: {task.exception()}")
+                if winner is not None:
+                    return winner.result()
+                if not pending and queue:
+                    # Failover sul provider successivo
+                    last = launch()
+            raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+        finally:
+            for task, backend in pending.items():
+                task.cancel()
+                # Conta come chiamata lenta solo una richiesta partita prima della
+                # vincente; le hedged partite dopo e le cancellazioni del chiamante no
+                if winner is not None and launched.index(task) < launched.index(winner):
+                    backend.breaker.record_failure()
+
+    async def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float = DEFAULT_TEMPERATURE,
+    ) -> AsyncIterator[str]:
+        """Stream from the first healthy provider, failing over before the first token."""
+        errors = []
+        for backend in self._available():
+            start = time.monotonic()
+            started = False
+            try:
+                async for token in backend.provider.generate_stream(
+                    messages=messages, max_tokens=max_tokens, temperature=temperature
+                ):
+                    started = True
+                    yield token
+            except Exception as e:
+                backend.breaker.record_failure()
+                if started:
+                    # Token già inviati al client: non si può cambiare provider
+                    raise
+                logger.warning(f"[LLM ROUTER] {backend.name} failed: {str(e)}")
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+            backend.record(time.monotonic() - start)
+            return
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+
+    async def warmup(self) -> None:
+        """Warm up every routed provider."""
+        await asyncio.gather(*(b.provider.warmup() for b in self.backends))
+
+
+def create_routed_llm_provider() -> RoutedLLMProvider:
+    """Build the router from LLM_PROVIDER followed by LLM_FALLBACK_PROVIDERS."""
+    names = [ModelConfig.LLM_PROVIDER, *ModelConfig.get_llm_fallback_providers()]
+    return RoutedLLMProvider(
+        {name: create_llm_provider(name) for name in names},
+        hedging=ModelConfig.LLM_HEDGING,
+        hedge_min_delay=ModelConfig.LLM_HEDGE_MIN_DELAY,
+    )